@@ -1,33 +1,327 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import pdfplumber
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from fastapi.responses import HTMLResponse, JSONResponse
-import uuid
 import time
+IMPORT_STARTED = time.perf_counter()    # Import-time cost is reported on /health
+from fastapi import FastAPI, UploadFile, File, Depends, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 import os
 from datetime import datetime
-import re
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Literal, Optional
 import json
+import hashlib
+import hmac
+import shutil
+import tarfile
+import tempfile
 import asyncio
+import threading
+import uuid
 from concurrent.futures import ThreadPoolExecutor  # ADDED FOR MULTI-UPLOAD
+import ingestion
+import jobs
+from doc_store import DocumentStore, make_preview
+from cache import SemanticCache, TTLCache, VersionCounter, normalize_query
+from embedding_cache import CachedEmbedder, EmbeddingCache
+from embedders import EmbedderSpec
+from resources import Resources, StoreLock
+from sessions import SessionRegistry, tenant_collection_name
+from lexical_index import LexicalIndex
+from maintenance import Maintenance, WriteGate
+import snapshot
+from snapshot import Snapshots
+import retrieval
+import generation
+import telemetry
+from telemetry import span
+from ollama_client import OllamaClient, OllamaError
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+# Structured logs on stderr (LOG_LEVEL, LOG_FORMAT=text|json); metrics on /metrics
+telemetry.configure_logging()
+logger = telemetry.get_logger("backend")
 
 # Request schema for chat
 class ChatRequest(BaseModel):
     query: str
+    mode: Optional[Literal["hybrid", "vector", "lexical"]] = None    # Defaults to RETRIEVAL_MODE
+    candidates: Optional[int] = Field(None, ge=1, le=200)    # Chunks over-fetched for re-ranking
+    k: Optional[int] = Field(None, ge=1, le=20)    # Chunks kept for the answer
+    budget_ms: Optional[float] = Field(None, gt=0)    # Re-ranking stages past this budget are skipped
+class ChatBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=10000)
+    mode: Optional[Literal["hybrid", "vector", "lexical"]] = None
+    candidates: Optional[int] = Field(None, ge=1, le=200)
+    k: Optional[int] = Field(None, ge=1, le=20)
+    budget_ms: Optional[float] = Field(None, gt=0)    # Per query
+    answers: bool = True    # False: retrieved chunks only
+    stream: bool = False    # NDJSON, one line per query as soon as its round is answered
 class DocumentUpdate(BaseModel):
     content: str
+class BulkOperation(BaseModel):
+    op: Literal["delete", "update", "export"]
+    id: str
+    content: Optional[str] = None    # New content, for "update"
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation] = Field(..., min_length=1, max_length=10000)
 
 # Ollama settings - DISABLED by default
-OLLAMA_ENABLED = False  # Set to True ONLY if you have Ollama working properly
-OLLAMA_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "llama3.2"
+OLLAMA_ENABLED = os.environ.get("OLLAMA_ENABLED", "0") == "1"  # Set OLLAMA_ENABLED=1 ONLY if you have Ollama working properly
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2")
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "2"))    # Generations running at once
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "60"))    # Seconds before falling back to the extractive answer
+ollama = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, max_concurrency=OLLAMA_MAX_CONCURRENCY, timeout=OLLAMA_TIMEOUT)
+
+# Answer generator used by /chat and /chat/stream: "extractive" (default) or
+# "stub", an offline stand-in that streams word by word like a model would
+CHAT_GENERATOR = os.environ.get("CHAT_GENERATOR", "extractive")
+STUB_TOKEN_DELAY = float(os.environ.get("STUB_TOKEN_DELAY", "0.02"))
+
+# Initialize ChromaDB with proper persistence
+chroma_dir = "./chroma_store"
+os.makedirs(chroma_dir, exist_ok=True)
+store_lock = StoreLock(chroma_dir)    # One process owns the stores; see resources.py
+
+# Document store for UI document management (separate from ChromaDB)
+# Metadata is indexed by id and session; full text lives in its own table
+DOCUMENTS_DB = os.environ.get("DOCUMENTS_DB", "ui_documents.db")
+doc_store = DocumentStore(DOCUMENTS_DB)
+
+# Per-client sessions: a client sends its id in the X-Session-ID header or the
+# session_id cookie, and a request without one starts a new session (returned in
+# both), stored in the registry when it first uploads. Documents, jobs and chat retrieval are all scoped to the session. The
+# registry is in SQLite, but the collections, caches and jobs are in this process,
+# so the server runs as a single uvicorn worker (enforced by store_lock)
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "session_id"
+SESSION_COOKIE_MAX_AGE = 365 * 24 * 3600
+# Sessions holding this many chunks get their own collection, so their queries
+# skip the metadata filter over everyone else's chunks (0 keeps all in the shared one)
+TENANT_COLLECTION_MIN_CHUNKS = int(os.environ.get("TENANT_COLLECTION_MIN_CHUNKS", "0"))
+sessions = SessionRegistry(DOCUMENTS_DB)
+
+def get_session(request: Request) -> Dict:
+    """The calling client's session (FastAPI dependency)"""
+    session = sessions.resolve(request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE))
+    request.state.session = session    # Echoed back by the session_headers middleware
+    return session
+
+def migrate_json_documents():
+    try:
+        migrated = doc_store.import_json("ui_documents.json")    # One-time migration from the old JSON file
+        if migrated:
+            logger.info("Migrated UI documents from ui_documents.json", extra={"documents": migrated})
+    except Exception as e:
+        logger.error("Error migrating UI documents", extra={"error": str(e)})
+
+def add_documents(docs: List[Dict]):
+    """Register newly ingested documents in the document store"""
+    doc_store.add_many(docs)
+    collection_version.bump()
+    for session_id in {doc["session_id"] for doc in docs}:
+        answer_cache.invalidate_group(session_id)    # A new document may answer better
+        if TENANT_COLLECTION_MIN_CHUNKS:
+            executor.submit(move_to_tenant_collection, session_id)
+
+# ChromaDB client, embedding model and collection are created on first use
+# (or by the warm-up thread started in `lifespan`), never at import time.
+# One in-process model, used for chat queries and by the ingestion pipeline for chunks.
+# EMBEDDING_BACKEND=onnx runs it on ONNX Runtime (optionally int8-quantised) instead of PyTorch
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")    # sentence-transformers | onnx
+EMBEDDING_QUANTIZE = os.environ.get("EMBEDDING_QUANTIZE") or None    # int8 (onnx only)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))    # Texts per embedding forward pass
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))    # Intra-op threads, 0 for the runtime default
+embedder = EmbedderSpec(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_QUANTIZE, EMBEDDING_BATCH_SIZE,
+                        EMBEDDING_THREADS, os.environ.get("ONNX_MODEL_DIR"))
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") != "0"
+resources = Resources(chroma_dir, embedder, started_at=IMPORT_STARTED)
+
+# Chunk vectors by content hash: identical text (re-uploaded files, shared
+# boilerplate) is embedded once and reused from here afterwards
+embedding_cache = EmbeddingCache(os.path.join(chroma_dir, "embedding_cache.db"), embedder.model_id)
+chunk_embedder = CachedEmbedder(resources.embed, embedding_cache)
+
+# BM25 index over the same chunks, kept in step with every collection write.
+# "hybrid" fuses it with vector search (reciprocal rank fusion); until the model
+# is loaded, hybrid queries are answered from the lexical index alone
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")    # hybrid | vector | lexical
+# Chat retrieval over-fetches candidates, re-ranks them in one batch (cosine
+# against the cached chunk vectors, or a cross-encoder when RERANKER_MODEL is
+# set), keeps the top k and quotes the sentences closest to the query.
+# All of these can be overridden per request
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "50"))
+CHAT_TOP_K = int(os.environ.get("CHAT_TOP_K", "3"))
+RETRIEVAL_BUDGET_MS = float(os.environ.get("RETRIEVAL_BUDGET_MS", "1500"))
+SENTENCES_PER_CHUNK = int(os.environ.get("SENTENCES_PER_CHUNK", "3"))
+CHAT_BATCH_SIZE = int(os.environ.get("CHAT_BATCH_SIZE", "256"))    # /chat/batch queries embedded and searched per round
+RERANKER_MODEL = os.environ.get("RERANKER_MODEL")    # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+cross_encoder = retrieval.CrossEncoderReranker(RERANKER_MODEL) if RERANKER_MODEL else None
+lexical_index = LexicalIndex(os.path.join(chroma_dir, "lexical_index.db"))
+resources.on_ready.append(lexical_index.backfill)    # Index chunks stored before the index existed
+
+# Chat caches: query text -> embedding, and (query, collection version) -> top-k results.
+# Every write to the collection bumps `collection_version`, which retires cached results.
+collection_version = VersionCounter()
+query_embedding_cache = TTLCache(
+    maxsize=int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+)
+retrieval_cache = TTLCache(
+    maxsize=int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("RETRIEVAL_CACHE_TTL", "300"))
+)
+# Answers by query embedding, so paraphrases of a recent question are answered at once.
+# Entries are per session and dropped when a source document changes or the session gains one
+answer_cache = SemanticCache(
+    maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", "1024")),    # 0 disables
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),    # Cosine similarity to count as the same question
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+)
+
+def embed_queries(queries: List[str]) -> List:
+    """Query embeddings, served from cache for repeated questions; the rest are embedded in one model batch"""
+    keys = [normalize_query(query) for query in queries]
+    embeddings, missing = {}, []
+    for key in dict.fromkeys(keys):
+        found, embedding = query_embedding_cache.get(key)
+        if found:
+            embeddings[key] = embedding
+        else:
+            missing.append(key)
+    if missing:
+        with span("embed"):
+            computed = resources.embed(missing)
+        for key, embedding in zip(missing, computed):
+            query_embedding_cache.set(key, embedding)
+            embeddings[key] = embedding
+    return [embeddings[key] for key in keys]
 
-app = FastAPI()
+def embed_query(query: str):
+    return embed_queries([query])[0]
+
+def session_collection(session: Dict):
+    """Collection holding a session's chunks: its own once moved there, else the shared one"""
+    if session.get("collection"):
+        return resources.tenant_collection(session["collection"])
+    return resources.collection()
+
+def vector_search(queries: List[str], n_results: int, session: Dict) -> List[Dict]:
+    """Dense results for each query, from one multi-query collection.query"""
+    return retrieval.split_results(session_collection(session).query(
+        query_embeddings=embed_queries(queries),
+        n_results=n_results,
+        where=None if session.get("collection") else {"session_id": session["session_id"]},
+        include=["documents", "distances", "metadatas"]
+    ))
+
+def retrieve_many(queries: List[str], session: Dict, n_results: int = 3, mode: str = "vector") -> List[Dict]:
+    """Top-k chunks of the session's documents for each query, cached until the collection next changes"""
+    session_id = session["session_id"]
+    keys = [(normalize_query(query), session_id, session.get("collection"), n_results, mode, collection_version.value)
+            for query in queries]
+    cached = [retrieval_cache.get(key) for key in keys]
+    results = [value for _, value in cached]
+    pending = [i for i, (found, _) in enumerate(cached) if not found]
+    if pending:
+        dense = vector_search([queries[i] for i in pending], n_results, session) if mode != "lexical" else None
+        for position, i in enumerate(pending):
+            if mode == "vector":
+                results[i] = dense[position]
+            else:
+                lexical = retrieval.from_lexical(lexical_index.search(queries[i], n_results, session_id))
+                results[i] = lexical if mode == "lexical" else \
+                    retrieval.reciprocal_rank_fusion([dense[position], lexical], n_results)
+            retrieval_cache.set(keys[i], results[i])
+    return results
+
+tenant_lock = threading.Lock()
+
+def move_to_tenant_collection(session_id: str) -> int:
+    """Move a session's chunks (vectors included) out of the shared collection into
+    its own once it holds TENANT_COLLECTION_MIN_CHUNKS chunks"""
+    with tenant_lock, write_gate.writing():
+        session = sessions.get(session_id)
+        if session is None or session["collection"] or lexical_index.count(session_id) < TENANT_COLLECTION_MIN_CHUNKS:
+            return 0
+        shared, name = resources.collection(), tenant_collection_name(session_id)
+        tenant = resources.tenant_collection(name)
+        if shared is None or tenant is None:
+            return 0
+        sessions.set_collection(session_id, name)    # New writes go to the tenant collection from here on
+        moved = 0
+        while True:    # Until no chunk is left behind, including ones written while moving
+            page = shared.get(where={"session_id": session_id}, include=["embeddings", "documents", "metadatas"],
+                              limit=embed_batch_size())
+            if not page["ids"]:
+                break
+            tenant.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                          metadatas=page["metadatas"])
+            shared.delete(ids=page["ids"])
+            moved += len(page["ids"])
+        collection_version.bump()
+        logger.info("Moved session chunks to its own collection", extra={"session_id": session_id, "chunks": moved,
+                                                                        "collection": name})
+        return moved
+
+def embed_batch_size() -> int:
+    """Configured ingest batch size, capped at what one ChromaDB write accepts"""
+    client = resources.client()
+    if client is None:
+        return ingestion.EMBED_BATCH_SIZE
+    return max(1, min(ingestion.EMBED_BATCH_SIZE, client.get_max_batch_size()))
+
+# Writers of chunks and documents hold the gate shared (ingests once per stored batch); maintenance takes it exclusively
+write_gate = WriteGate()
+MAINTENANCE_INTERVAL = float(os.environ.get("MAINTENANCE_INTERVAL", "21600"))    # Seconds between runs, 0 disables
+MAINTENANCE_REBUILD_RATIO = float(os.environ.get("MAINTENANCE_REBUILD_RATIO", "0.2"))    # Rebuild once this share of a collection is removed
+maintenance = Maintenance(resources, doc_store, lexical_index, sessions, write_gate,
+                          paths=[chroma_dir, DOCUMENTS_DB], on_change=collection_version.bump,
+                          rebuild_ratio=MAINTENANCE_REBUILD_RATIO, embedding_cache=embedding_cache)
+
+async def maintenance_loop():
+    """Run maintenance every MAINTENANCE_INTERVAL seconds on the upload executor"""
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        if not maintenance.running:
+            await asyncio.get_running_loop().run_in_executor(executor, maintenance.run)
+
+# Thread pool for per-file orchestration - ADDED FOR MULTI-UPLOAD
+# (CPU-bound PDF parsing itself runs on ingestion's process pool)
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+def log_startup():
+    logger.info("Document processing backend started", extra={
+        "chroma_dir": chroma_dir,
+        "documents": doc_store.count(),
+        "embedding_model": embedder.model_id,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "ollama_enabled": OLLAMA_ENABLED,
+        "import_seconds": round(IMPORT_SECONDS, 3),
+        "model_load": "background" if WARMUP_ON_STARTUP else "on first use"
+    })
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store_lock.acquire()    # A second worker on the same stores fails here
+    migrate_json_documents()
+    log_startup()
+    if WARMUP_ON_STARTUP:
+        resources.start_warm_up()    # Liveness is immediate; readiness follows once the model is loaded
+    maintenance_task = asyncio.create_task(maintenance_loop()) if MAINTENANCE_INTERVAL > 0 else None
+    yield
+    if maintenance_task:
+        maintenance_task.cancel()
+    await ingest_jobs.shutdown()
+    await ollama.aclose()
+    ingestion.shutdown_pdf_pool()
+    executor.shutdown(wait=False)
+    store_lock.release()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend requests
 app.add_middleware(
@@ -35,259 +329,156 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER, "ETag", "Server-Timing"],
 )
 
-# Initialize ChromaDB with proper persistence
-chroma_dir = "./chroma_store"
-os.makedirs(chroma_dir, exist_ok=True)
-
-# In-memory storage for UI document management (separate from ChromaDB)
-ui_documents = []  # Stores documents for UI CRUD operations
+# Requests sending this header get a Server-Timing header with their stage times
+# (for streamed responses, the stages finished before the first byte)
+PROFILE_HEADER = "X-Profile"
+REQUEST_SECONDS = telemetry.REGISTRY.histogram(
+    "rag_request_seconds", "Time until the response starts, by route", ["method", "route", "status"]
+)
+telemetry.REGISTRY.gauge("rag_documents", "Documents in the document store", doc_store.count)
+telemetry.REGISTRY.gauge("rag_chunks", "Chunks in the lexical index (one per stored chunk)", lexical_index.count)
+telemetry.REGISTRY.gauge("rag_sessions", "Registered sessions", sessions.count)
+telemetry.REGISTRY.gauge("rag_collection_version", "Writes to the collections since startup",
+                         lambda: collection_version.value)
+telemetry.REGISTRY.gauge("rag_model_ready", "1 once the embedding model is loaded", lambda: int(resources.ready))
 
-# Session-level in-memory storage (for current run/session)
-# `current_session_id` identifies the active session; `session_documents`
-# holds documents uploaded during this session only.
-current_session_id = str(uuid.uuid4())
-session_documents: List[Dict] = []
+@app.middleware("http")
+async def session_headers(request: Request, call_next):
+    """Return the session id to clients whose request resolved one"""
+    response = await call_next(request)
+    session = getattr(request.state, "session", None)
+    if session is not None:
+        response.headers[SESSION_HEADER] = session["session_id"]
+        if request.cookies.get(SESSION_COOKIE) != session["session_id"]:
+            response.set_cookie(SESSION_COOKIE, session["session_id"], max_age=SESSION_COOKIE_MAX_AGE,
+                                httponly=True, samesite="lax")
+    return response
 
-# Load UI documents from file if exists
-def load_ui_documents():
-    global ui_documents
-    try:
-        if os.path.exists("ui_documents.json"):
-            with open("ui_documents.json", "r") as f:
-                ui_documents = json.load(f)
-                print(f"Loaded {len(ui_documents)} UI documents from storage")
-    except Exception as e:
-        print(f"Error loading UI documents: {e}")
-        ui_documents = []
-        
-def save_ui_documents():
-    try:
-        with open("ui_documents.json", "w") as f:
-            json.dump(ui_documents, f)
-    except Exception as e:
-        print(f"Error saving UI documents: {e}")
-
-# Initialize ChromaDB collection for embeddings
-try:
-    client = chromadb.PersistentClient(path=chroma_dir)
-    collection = client.get_or_create_collection(
-        name="documents",
-        embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-    )
-    print(f"ChromaDB initialized. Documents in collection: {collection.count()}")
-except Exception as e:
-    print(f"ChromaDB initialization error: {e}")
-    collection = None
-    
-load_ui_documents()    # Load UI documents on startup
-executor = ThreadPoolExecutor(max_workers=4)    # Thread pool for parallel processing - ADDED FOR MULTI-UPLOAD
-
-def print_banner():
-    print("=" * 60)
-    print("DOCUMENT PROCESSING BACKEND")
-    print("=" * 60)
-    print(f"Server started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"ChromaDB directory: {chroma_dir}")
-    print(f"UI Documents loaded: {len(ui_documents)}")
-    print(f"Embedding model: all-MiniLM-L6-v2")
-    print(f"Ollama enabled: {OLLAMA_ENABLED}")
-    print("=" * 60)
-print_banner()
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Time every request by route template (so ids in paths don't explode the label set)"""
+    profile = telemetry.start_profile() if request.headers.get(PROFILE_HEADER) else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    route = getattr(route, "path", "unmatched")
+    REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=response.status_code)
+    if profile is not None:
+        timing = telemetry.server_timing(profile)
+        response.headers["Server-Timing"] = f"{timing}, total;dur={elapsed * 1000:.2f}" if timing \
+            else f"total;dur={elapsed * 1000:.2f}"
+    logger.debug("Request", extra={"method": request.method, "route": route, "status": response.status_code,
+                                   "seconds": round(elapsed, 4)})
+    return response
 
 @app.get("/")
 def home():
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] GET / - Serving portal.html")
     with open("portal.html", "r", encoding="utf-8") as f:
         return HTMLResponse(content=f.read())
 
-def process_single_file(file: UploadFile, file_index: int, total_files: int):  # ADDED FOR MULTI-UPLOAD
+def ingest_upload(file: UploadFile, session: Dict, progress: Dict = None):
+    """Spool an upload to disk and run it through the ingestion pipeline"""
+    path = ingestion.spool_to_tempfile(file.file, file.filename)
+    try:
+        return ingest_path(path, file.filename, session, progress)
+    finally:
+        os.remove(path)
+
+def ingest_path(path: str, filename: str, session: Dict, progress: Dict = None):
+    """Ingest a file and register its document. Chunks are stored before the document
+    record, so the document is marked in flight until then and maintenance never takes
+    them for orphans; the gate itself is only held while each batch is written."""
+    doc_id = str(uuid.uuid4())
+    session = sessions.register(session)
+    with write_gate.ingesting(doc_id):
+        result = ingestion.ingest_file(
+            path, filename, session["session_id"],
+            session_collection(session), chunk_embedder, doc_store, batch_size=embed_batch_size(), progress=progress,
+            lexical_index=lexical_index, doc_id=doc_id, gate=write_gate
+        )
+        if result is not None:
+            add_documents([result[0]])
+        return result
+
+def process_job_file(path: str, filename: str, progress: Dict, session_id: str):
+    """Ingest one file of a background job (runs on the upload executor)"""
+    try:
+        result = ingest_path(path, filename, sessions.resolve(session_id), progress)
+        if result is not None:
+            ui_document, embedding_report = result
+            if embedding_report["failed"]:
+                progress["error"] = f"{embedding_report['failed']} chunk(s) failed to embed"
+            progress["stage"] = "done"
+    finally:
+        os.remove(path)
+
+ingest_jobs = jobs.JobManager(process_job_file, executor)
+
+def process_single_file(file: UploadFile, file_index: int, total_files: int, session: Dict):  # ADDED FOR MULTI-UPLOAD
     """Process a single file - can be called in parallel"""
-    print(f"\n  [{file_index}/{total_files}] Processing: {file.filename}")
-    start_time = time.time()
-    file_content = file.file.read()        # Read file content
-    file.file.seek(0)  # Reset file pointer
-    # Extract text
-    is_pdf = file.filename.lower().endswith('.pdf')
-    text = ""
-    if is_pdf:
-        try:
-            with pdfplumber.open(file.file) as pdf:
-                num_pages = len(pdf.pages)
-                print(f" {file.filename}: {num_pages} pages")
-                for page_num, page in enumerate(pdf.pages, 1):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"--- Page {page_num} ---\n{page_text}\n\n"
-        except Exception as e:
-            print(f" PDF processing error for {file.filename}: {e}")
-            raise
-    else:
-        try:
-            text = file_content.decode("utf-8")
-        except UnicodeDecodeError:
-            text = file_content.decode("latin-1", errors="ignore")
-    if not text.strip():
-        print(f"Warning: No text extracted from {file.filename}")
+    logger.debug("Processing upload", extra={"upload": file.filename, "index": file_index, "total": total_files})
+    try:
+        result = ingest_upload(file, session)
+    except Exception as e:
+        logger.error("Processing error", extra={"upload": file.filename, "error": str(e)})
+        raise
+    if result is None:
         return None
-    # Create document record
-    doc_id = str(uuid.uuid4())
-    ui_document = {
-        "id": doc_id,
-        "filename": file.filename,
-        "content": text,
-        "uploaded_at": datetime.now().isoformat(),
-        "size": len(text),
-        "file_type": "pdf" if is_pdf else "text",
-        "session_id": current_session_id 
-    }
-    # Store in ChromaDB for chatbot
-    if collection and text.strip():
-        chunk_size = 1000
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        print(f"Created {len(chunks)} chunks for embeddings")
-        for idx, chunk in enumerate(chunks):
-            try:
-                chunk_id = f"{doc_id}_chunk_{idx}"
-                collection.add(
-                    documents=[chunk],
-                    ids=[chunk_id],
-                    metadatas=[{
-                        "source": file.filename,
-                        "doc_id": doc_id,
-                        "session_id": current_session_id,
-                        "chunk": idx,
-                        "type": "embedding"
-                    }]
-                )
-            except Exception as e:
-                print(f"Error storing chunk {idx}: {e}")
-    end_time = time.time()
-    processing_time = end_time - start_time
-    print(f"Processed: {file.filename} ({len(text)} chars, {processing_time:.2f}s)")
+    ui_document, embedding_report = result
+    ui_document["embedding"] = embedding_report
     return ui_document
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    print("\n" + "=" * 60)
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📥 SINGLE FILE UPLOAD")
-    print(f"File: {file.filename}")
+async def upload_file(file: UploadFile = File(...), session: Dict = Depends(get_session)):
+    session_id = session["session_id"]
     start_time = time.time()
-    # Read file content
-    content = await file.read()
-    is_pdf = file.filename.lower().endswith('.pdf')
-    # Extract text
-    text = ""
-    if is_pdf:
-        print("Processing PDF file...")
-        try:
-            import io
-            file_stream = io.BytesIO(content)
-            with pdfplumber.open(file_stream) as pdf:
-                num_pages = len(pdf.pages)
-                print(f"PDF has {num_pages} pages")
-                for page_num, page in enumerate(pdf.pages, 1):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"--- Page {page_num} ---\n{page_text}\n\n"
-        except Exception as e:
-            print(f"PDF processing error: {e}")
-            return {"status": "error", "message": f"PDF processing failed: {str(e)}"}
-    else:
-        print("Processing text file...")
-        try:
-            text = content.decode("utf-8")
-        except UnicodeDecodeError:
-            text = content.decode("latin-1", errors="ignore")
-    if not text.strip():
-        print("ERROR: No text extracted from file!")
+    try:
+        # Extraction and embedding run on the upload executor, not on the event loop
+        result = await asyncio.get_running_loop().run_in_executor(executor, telemetry.bind(ingest_upload), file, session)
+    except Exception as e:
+        logger.error("Processing error", extra={"upload": file.filename, "error": str(e)})
+        return {"status": "error", "message": f"Processing failed: {str(e)}"}
+    if result is None:
         return {"status": "error", "message": "No text extracted from file"}
-    print(f"Total text extracted: {len(text)} characters")
-    # Create document with session ID
-    doc_id = str(uuid.uuid4())
-    ui_document = {
-        "id": doc_id,
-        "filename": file.filename,
-        "content": text,
-        "uploaded_at": datetime.now().isoformat(),
-        "size": len(text),
-        "file_type": "pdf" if is_pdf else "text",
-        "session_id": current_session_id  # ADD THIS
-    }
-    # Store in session documents ONLY (not persistent storage)
-    session_documents.append(ui_document)
-    print(f"Added to session documents: {file.filename} (Session: {current_session_id})")
-    # Also store in persistent storage for backup (optional)
-    ui_documents.append(ui_document)
-    save_ui_documents()
-    # Store in ChromaDB for chatbot
-    if collection and text.strip():
-        print("Creating embeddings for chatbot...")
-        chunk_size = 1000
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        print(f"Created {len(chunks)} chunks for embeddings")
-        for idx, chunk in enumerate(chunks):
-            try:
-                chunk_id = f"{doc_id}_chunk_{idx}"
-                collection.add(
-                    documents=[chunk],
-                    ids=[chunk_id],
-                    metadatas=[{
-                        "source": file.filename,
-                        "doc_id": doc_id,
-                        "session_id": current_session_id,
-                        "chunk": idx,
-                        "type": "embedding"
-                    }]
-                )
-            except Exception as e:
-                print(f"Error storing chunk {idx}: {e}")
-    end_time = time.time()
-    processing_time = end_time - start_time
-    
-    print("=" * 60)
-    print("UPLOAD COMPLETE")
-    print("=" * 60)
-    print(f"File: {file.filename}")
-    print(f"Time: {processing_time:.2f}s")
-    print(f"Text: {len(text)} chars")
-    print(f"Added to session: ✓ (Session ID: {current_session_id})")
-    print(f"Added to ChromaDB: {len(chunks) if collection else 0} chunks")
-    print("=" * 60 + "\n")
+    ui_document, embedding_report = result
+    doc_id = ui_document["id"]
+    processing_time = time.time() - start_time
+    logger.info("Upload complete", extra={"upload": file.filename, "doc_id": doc_id, "session_id": session_id,
+                                          "chars": ui_document["size"], "chunks": embedding_report["stored"],
+                                          "failed": embedding_report["failed"], "seconds": round(processing_time, 3)})
     return {
         "status": "success",
         "filename": file.filename,
         "document_id": doc_id,
-        "session_id": current_session_id,
-        "size": len(text),
+        "session_id": session_id,
+        "size": ui_document["size"],
         "processing_time": f"{processing_time:.2f}s",
+        "embedding": embedding_report,
         "message": f"{file.filename} uploaded successfully!\nDocument is now available for viewing and editing."
 }
 
 @app.post("/upload-multiple")
-async def upload_multiple_files(files: List[UploadFile] = File(...)):
+async def upload_multiple_files(files: List[UploadFile] = File(...), session: Dict = Depends(get_session)):
     """Upload multiple files at once"""
-    print("\n" + "=" * 60)
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📥 MULTI-FILE UPLOAD STARTED")
-    print(f"Session ID: {current_session_id}")
-    print(f"Files received: {len(files)}")
+    session_id = session["session_id"]
     if not files:
         return {"status": "error", "message": "No files selected"}
     start_time = time.time()
     successful_uploads = []
     failed_uploads = []
-    print("Starting parallel processing...")
+    embedding_reports = {}
     # Process files in parallel
     loop = asyncio.get_event_loop()
     tasks = []
     for i, file in enumerate(files, 1):
         task = loop.run_in_executor(
-            executor, 
-            process_single_file, 
-            file, i, len(files)
+            executor,
+            telemetry.bind(process_single_file),
+            file, i, len(files), session
         )
         tasks.append(task)
     results = await asyncio.gather(*tasks, return_exceptions=True)    # Wait for all tasks to complete
@@ -295,34 +486,18 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
     for i, result in enumerate(results):
         filename = files[i].filename if i < len(files) else f"File {i+1}"
         if isinstance(result, Exception):
-            print(f"Failed: {filename} - {str(result)}")
             failed_uploads.append({
                 "filename": filename,
                 "error": str(result)
             })
         elif result is not None:
-            # Add to session documents
-            session_documents.append(result)
-            # Also add to persistent storage (optional)
-            ui_documents.append(result)
+            embedding_reports[result["id"]] = result.pop("embedding", None)    # Per-upload report, not part of the stored record
             successful_uploads.append(result)
-            print(f"Added to session: {result['filename']}")
-    # Save all documents at once
-    if successful_uploads:
-        save_ui_documents()
     end_time = time.time()
     total_time = end_time - start_time
-    print("\n" + "=" * 60)
-    print("UPLOAD SUMMARY")
-    print("=" * 60)
-    print(f"Total files: {len(files)}")
-    print(f"Successful: {len(successful_uploads)}")
-    print(f"Failed: {len(failed_uploads)}")
-    print(f"Total time: {total_time:.2f}s")
-    print(f"Average time per file: {total_time/len(files):.2f}s")
-    print(f"Session documents count: {len(session_documents)}")
-    print(f"Total documents in ChromaDB: {collection.count() if collection else 0}")
-    print("=" * 60)
+    logger.info("Multi-file upload complete", extra={"session_id": session_id, "total_files": len(files),
+                                                     "successful": len(successful_uploads), "failed": len(failed_uploads),
+                                                     "seconds": round(total_time, 3)})
     # Prepare response
     response = {
         "status": "success" if successful_uploads else "partial" if failed_uploads else "error",
@@ -330,14 +505,15 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
         "successful": len(successful_uploads),
         "failed": len(failed_uploads),
         "processing_time": f"{total_time:.2f}s",
-        "session_id": current_session_id,
-        "session_documents": len(session_documents),
+        "session_id": session_id,
+        "session_documents": doc_store.count(session_id),
         "successful_files": [
             {
                 "filename": doc["filename"],
                 "id": doc["id"],
                 "size": doc["size"],
-                "preview": doc["content"][:100] + "..." if len(doc["content"]) > 100 else doc["content"]
+                "preview": doc["preview"],
+                "embedding": embedding_reports.get(doc["id"])
             }
             for doc in successful_uploads
         ],
@@ -351,296 +527,873 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
         response["message"] = "No files were uploaded successfully"
     return response
 
-# Get all UI documents (not chunks) - SESSION DOCUMENTS ONLY
-@app.get("/ui-documents")
-async def get_ui_documents():
-    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 📋 GET /ui-documents")
-    print(f"Session ID: {current_session_id}")
-    print(f"Session documents count: {len(session_documents)}")
-    print(f"All documents in storage: {len(ui_documents)}")
-    # Debug: Show all session document filenames
-    if session_documents:
-        print("Session documents:")
-        for i, doc in enumerate(session_documents):
-            print(f"  {i+1}. {doc['filename']} (ID: {doc['id'][:8]})")
-    # Return ONLY session documents
-    documents_info = []
-    for doc in session_documents:
-        documents_info.append({
-            "id": doc["id"],
-            "filename": doc["filename"],
-            "uploaded_at": doc["uploaded_at"],
-            "size": doc["size"],
-            "session_id": doc.get("session_id", current_session_id),
-            "preview": doc["content"][:100] + "..." if len(doc["content"]) > 100 else doc["content"]
-        })
+# Background ingestion: returns a job id at once, progress is polled on /jobs/{job_id}
+@app.post("/jobs", status_code=202)
+async def create_ingest_job(files: List[UploadFile] = File(...), session: Dict = Depends(get_session)):
+    if not files:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "No files selected"})
+    loop = asyncio.get_running_loop()
+    spooled = []
+    for file in files:
+        path = await loop.run_in_executor(executor, ingestion.spool_to_tempfile, file.file, file.filename)
+        spooled.append((path, file.filename))
+    try:
+        job = await ingest_jobs.submit(spooled, session["session_id"])
+    except jobs.QueueFullError as e:
+        for path, _ in spooled:
+            os.remove(path)
+        return JSONResponse(status_code=503, content={"status": "error", "message": str(e)})
+    logger.info("Queued ingest job", extra={"job_id": job["job_id"], "total_files": len(spooled)})
     return {
-        "status": "success",
-        "count": len(documents_info),
-        "session_id": current_session_id,
-        "total_in_chromadb": collection.count() if collection else 0,
-        "documents": documents_info
+        "status": "accepted",
+        "job_id": job["job_id"],
+        "total_files": job["total_files"],
+        "session_id": session["session_id"]
     }
 
+@app.get("/jobs")
+async def list_ingest_jobs(session: Dict = Depends(get_session)):
+    return {"status": "success", **ingest_jobs.stats(), "jobs": [
+        {key: job[key] for key in ("job_id", "status", "created_at", "finished_at", "total_files", "completed_files")}
+        for job in ingest_jobs.list(session["session_id"])
+    ]}
+
+@app.get("/jobs/{job_id}")
+async def get_ingest_job(job_id: str, session: Dict = Depends(get_session)):
+    job = ingest_jobs.get(job_id)
+    if job is None or job["session_id"] != session["session_id"]:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    return {"status": "success", "job": job}
+
+# Get UI documents (not chunks) - SESSION DOCUMENTS ONLY, one page at a time.
+# Follow `next_cursor` for the next page; `fields` (comma-separated) limits the
+# columns returned. Responses carry an ETag, so an unchanged listing costs a 304
+DOCUMENTS_PAGE_SIZE = int(os.environ.get("DOCUMENTS_PAGE_SIZE", "50"))
+DOCUMENTS_MAX_PAGE_SIZE = 500
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+@app.get("/ui-documents")
+def get_ui_documents(request: Request, session: Dict = Depends(get_session),
+                     limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=DOCUMENTS_MAX_PAGE_SIZE),
+                     cursor: Optional[str] = None,
+                     sort: Literal["uploaded_at", "filename", "size"] = "uploaded_at",
+                     order: Literal["asc", "desc"] = "asc",
+                     fields: Optional[str] = None,
+                     filename: Optional[str] = None,    # Substring of the filename
+                     file_type: Optional[str] = None,    # pdf | text
+                     uploaded_after: Optional[str] = None,    # ISO date/time bounds on uploaded_at
+                     uploaded_before: Optional[str] = None):
+    session_id = session["session_id"]
+    # The listing only changes when the session's documents do: (count, last upload or edit)
+    signature = doc_store.signature(session_id)
+    etag = 'W/"' + hashlib.sha1(json.dumps(
+        [session_id, *signature, sorted(request.query_params.multi_items())]
+    ).encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        page = doc_store.list_page(
+            session_id, limit=limit, cursor=cursor, sort=sort, descending=order == "desc",
+            fields=[field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+            filename=filename, file_type=file_type, uploaded_after=uploaded_after, uploaded_before=uploaded_before
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    logger.debug("Listed documents", extra={"session_id": session_id, "returned": len(page["documents"]),
+                                            "documents": signature[0]})
+    return JSONResponse(headers=headers, content={
+        "status": "success",
+        "count": len(page["documents"]),
+        "total": page["total"],    # Matching documents, counted on the first page only
+        "next_cursor": page["next_cursor"],
+        "session_id": session_id,
+        "documents": page["documents"]
+    })
+
 # Get specific UI document content - ADD THIS ENDPOINT
+# With `offset`/`length` (characters) or `page` (PDF page number) only that window
+# of the text is read and returned, with `next_offset` to continue from;
+# without them the whole content is returned
+DOCUMENT_WINDOW_CHARS = 64 * 1024    # Default window length
+DOCUMENT_MAX_WINDOW_CHARS = 1024 * 1024
+
 @app.get("/ui-documents/{doc_id}")
-async def get_ui_document(doc_id: str):
-    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 📖 GET /ui-documents/{doc_id}")
-    print(f"Looking for document ID: {doc_id}")
-    # Search in session documents first
-    for doc in session_documents:
-        if doc["id"] == doc_id:
-            print(f"Found in session: {doc['filename']}")
-            return {
-                "status": "success",
-                "document": {
-                    "id": doc["id"],
-                    "filename": doc["filename"],
-                    "content": doc["content"],
-                    "uploaded_at": doc["uploaded_at"],
-                    "size": doc["size"],
-                    "file_type": doc.get("file_type", "text"),
-                    "session_id": doc.get("session_id", current_session_id)
-                }
-            }
-    # If not found in session, check persistent storage
-    print(f"Document ID {doc_id} not found in session documents")
-    for doc in ui_documents:
-        if doc["id"] == doc_id:
-            print(f"Found in persistent storage: {doc['filename']}")
-            return {
-                "status": "success",
-                "document": {
-                    "id": doc["id"],
-                    "filename": doc["filename"],
-                    "content": doc["content"],
-                    "uploaded_at": doc["uploaded_at"],
-                    "size": doc["size"],
-                    "file_type": doc.get("file_type", "text"),
-                    "session_id": doc.get("session_id", current_session_id)
-                }
-            }
-    print(f"Document ID {doc_id} not found anywhere")
-    return {"status": "error", "message": "Document not found"}
-    
-# Update UI document content    # Get specific UI document content  
+def get_ui_document(doc_id: str, session: Dict = Depends(get_session),
+                    offset: Optional[int] = Query(None, ge=0),
+                    length: Optional[int] = Query(None, ge=1, le=DOCUMENT_MAX_WINDOW_CHARS),
+                    page: Optional[int] = Query(None, ge=1)):
+    windowed = offset is not None or length is not None or page is not None
+    doc = doc_store.get(doc_id, with_content=not windowed)
+    if doc is None or doc["session_id"] != session["session_id"]:
+        return {"status": "error", "message": "Document not found"}
+    document = {
+        "id": doc["id"],
+        "filename": doc["filename"],
+        "uploaded_at": doc["uploaded_at"],
+        "size": doc["size"],
+        "file_type": doc["file_type"],
+        "session_id": doc["session_id"],
+        "pages": doc_store.page_count(doc_id)
+    }
+    if not windowed:
+        return {"status": "success", "document": {**document, "content": doc["content"]}}
+    if page is not None:
+        page_bounds = doc_store.page_span(doc_id, page)
+        if page_bounds is None:
+            return {"status": "error", "message": f"Page {page} not found"}
+        start, end = page_bounds
+        offset = start + (offset or 0)    # `offset` is then relative to the start of the page
+        if length is None:
+            length = max(0, min((end if end is not None else doc["size"]) - offset, DOCUMENT_MAX_WINDOW_CHARS))
+    offset = offset or 0
+    if length is None:
+        length = DOCUMENT_WINDOW_CHARS
+    content = doc_store.read_range(doc_id, offset, length)
+    end = offset + len(content)
+    return {"status": "success", "document": {
+        **document,
+        "content": content,
+        "offset": offset,
+        "length": len(content),
+        "next_offset": end if end < doc["size"] else None
+    }}
+
+def empty_embedding_report() -> Dict:
+    """What an edit reports when ChromaDB is unavailable and nothing was re-embedded"""
+    return {"reused": 0, "recomputed": 0, "removed": 0, "stored": 0, "failed": 0, "batches": 0, "errors": []}
+
+# Update UI document content (plain `def` so re-embedding runs off the event loop)
 @app.put("/ui-documents/{doc_id}")
-async def update_ui_document(doc_id: str, update: DocumentUpdate):
-    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] ✏️ PUT /ui-documents/{doc_id}")
-    print(f"Looking for document ID: {doc_id}")
-    # Search in session documents
-    doc_found = False
-    for doc in session_documents:
-        if doc["id"] == doc_id:
-            print(f"Found in session: {doc['filename']}")
-            print(f"Old content length: {len(doc['content'])} chars")
-            print(f"New content length: {len(update.content)} chars")
-            # Update session document
-            doc["content"] = update.content
-            doc["size"] = len(update.content)
-            doc_found = True
-            # Also update in persistent storage
-            for persistent_doc in ui_documents:
-                if persistent_doc["id"] == doc_id:
-                    persistent_doc["content"] = update.content
-                    persistent_doc["size"] = len(update.content)
-            save_ui_documents()    # Save to file
-            # Update ChromaDB embeddings
-            if collection:
-                # Remove old embeddings
-                try:
-                    results = collection.get(where={"doc_id": doc_id})
-                    if results and results["ids"]:
-                        collection.delete(ids=results["ids"])
-                        print(f"Removed {len(results['ids'])} old embeddings")
-                except Exception as e:
-                    print(f"Error removing old embeddings: {e}")
-                # Add new embeddings
-                chunk_size = 1000
-                chunks = [update.content[i:i+chunk_size] for i in range(0, len(update.content), chunk_size)]
-                print(f"Creating {len(chunks)} new chunks for updated document")
-                for idx, chunk in enumerate(chunks):
-                    try:
-                        chunk_id = f"{doc_id}_chunk_{idx}_updated"
-                        collection.add(
-                            documents=[chunk],
-                            ids=[chunk_id],
-                            metadatas=[{
-                                "source": doc["filename"],
-                                "doc_id": doc_id,
-                                "session_id": current_session_id,
-                                "chunk": idx,
-                                "type": "embedding",
-                                "updated": True,
-                                "update_time": datetime.now().isoformat()
-                            }]
-                        )
-                    except Exception as e:
-                        print(f"Error storing updated chunk {idx}: {e}")
-            print(f"Document '{doc['filename']}' updated successfully")
-            return {"status": "success", "message": "Document updated successfully"}
-    if not doc_found:
-        print(f"Document ID {doc_id} not found in session documents")
-        # Try to find in persistent storage
-        for doc in ui_documents:
-            if doc["id"] == doc_id:
-                print(f"Found in persistent storage but not in session: {doc['filename']}")
-                return {"status": "error", "message": "Document found but not in current session. Please re-upload it."}
-    return {"status": "error", "message": "Document not found"}
+def update_ui_document(doc_id: str, update: DocumentUpdate, session: Dict = Depends(get_session)):
+    doc = doc_store.get(doc_id)
+    if doc is None:
+        return {"status": "error", "message": "Document not found"}
+    if doc["session_id"] != session["session_id"]:
+        return {"status": "error", "message": "Document found but not in current session. Please re-upload it."}
+    with write_gate.writing():
+        doc_store.update_content(doc_id, update.content)
+        collection_version.bump()
+        # Update ChromaDB embeddings, re-embedding only the chunks whose text changed
+        embedding_report = empty_embedding_report()
+        collection = session_collection(session)
+        if collection:
+            try:
+                embedding_report = ingestion.update_document_chunks(collection, chunk_embedder, doc_id, update.content, {
+                    "source": doc["filename"],
+                    "session_id": session["session_id"],
+                    "updated": True,
+                    "update_time": datetime.now().isoformat()
+                }, batch_size=embed_batch_size(), lexical_index=lexical_index)
+            except Exception as e:
+                logger.error("Error updating embeddings", extra={"doc_id": doc_id, "error": str(e)})
+                embedding_report["errors"].append({"stage": "update", "error": str(e)})
+        answer_cache.invalidate_documents([doc_id])
+        logger.info("Document updated", extra={"doc_id": doc_id, "old_size": doc["size"], "size": len(update.content)})
+        return {
+            "status": "success",
+            "message": "Document updated successfully",
+            "size": len(update.content),
+            "preview": make_preview(update.content),
+            "chunks_reused": embedding_report["reused"],
+            "chunks_recomputed": embedding_report["recomputed"],
+            "embedding": embedding_report
+        }
 
 # Delete UI document
 @app.delete("/ui-documents/{doc_id}")
-async def delete_ui_document(doc_id: str):
-    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🗑️ DELETE /ui-documents/{doc_id}")
-    print(f"Looking for document ID: {doc_id} in session")
-    # Remove from session documents
-    for i, doc in enumerate(session_documents):
-        if doc["id"] == doc_id:
-            print(f"Found in session: {doc['filename']}")
-            deleted_doc = session_documents.pop(i)    # Remove from session documents
-            # Also remove from persistent storage
-            for j, persistent_doc in enumerate(ui_documents):
-                if persistent_doc["id"] == doc_id:
-                    ui_documents.pop(j)
-                    break
-            save_ui_documents()    # Save changes to file
-            if collection:    # Remove from ChromaDB
+def delete_ui_document(doc_id: str, session: Dict = Depends(get_session)):
+    doc = doc_store.get(doc_id)
+    if doc is None or doc["session_id"] != session["session_id"]:
+        return {"status": "error", "message": "Document not found in current session"}
+    with write_gate.writing():
+        doc_store.delete(doc_id)
+        lexical_index.delete_document(doc_id)
+        collection_version.bump()
+        collection = session_collection(session)
+        if collection:    # Remove from ChromaDB
+            try:
+                collection.delete(where={"doc_id": doc_id})
+            except Exception as e:
+                logger.error("Error removing embeddings", extra={"doc_id": doc_id, "error": str(e)})
+        answer_cache.invalidate_documents([doc_id])
+    session_count = doc_store.count(session["session_id"])
+    logger.info("Document deleted", extra={"doc_id": doc_id, "session_documents": session_count})
+    return {
+        "status": "success",
+        "message": f"Document '{doc['filename']}' deleted successfully",
+        "session_documents_count": session_count
+    }
+
+def ndjson_line(data: Dict) -> str:
+    return json.dumps(data) + "\n"
+
+def bulk_results(operations: List[BulkOperation], session: Dict):
+    """Apply a batch of document operations, yielding one NDJSON line per operation, in
+    request order and tagged with its index, then a summary. Operations take effect in
+    request order: an export sees the document as the operations before it left it, and
+    a later update or delete supersedes an earlier update. The net effect is written at
+    once: every delete and content change in one store transaction, the deleted
+    documents' chunks out of ChromaDB in one `$in` delete, then each updated document
+    re-embedded."""
+    with write_gate.writing():
+        lines = list(apply_bulk_operations(operations, session))
+    yield from lines    # Streamed after the gate is released, so a slow reader never holds maintenance off
+
+EXPORT_FIELDS = ("id", "filename", "uploaded_at", "updated_at", "size", "file_type", "content")
+
+def apply_bulk_operations(operations: List[BulkOperation], session: Dict):
+    start_time = time.time()
+    docs = doc_store.get_many(list(dict.fromkeys(op.id for op in operations)))
+    results: List[Optional[Dict]] = [None] * len(operations)
+    contents = {}    # doc_id -> content given by the latest update read so far, or None once deleted
+    deletes, updates, exports = {}, {}, {}    # doc_id -> index of the delete / final update; index -> content
+
+    def result(index: int, status: str, **fields):
+        op = operations[index]
+        results[index] = {"index": index, "id": op.id, "op": op.op, "status": status, **fields}
+
+    for index, op in enumerate(operations):
+        doc = docs.get(op.id)
+        if doc is None or doc["session_id"] != session["session_id"]:
+            result(index, "error", message="Document not found in current session")
+        elif op.id in deletes:
+            result(index, "error", message="Document is deleted earlier in this batch")
+        elif op.op == "delete":
+            deletes[op.id] = index
+            contents[op.id] = None
+            updates.pop(op.id, None)
+        elif op.op == "update":
+            if op.content is None:
+                result(index, "error", message="An update needs `content`")
+            else:
+                contents[op.id] = op.content
+                updates[op.id] = index
+        else:
+            exports[index] = contents.get(op.id)
+    # Exports of documents the batch has not touched before them read the stored text now,
+    # before a later operation changes it
+    for index, content in exports.items():
+        if content is None:
+            doc = doc_store.get(operations[index].id, with_content=True)
+            result(index, "success", document={key: doc[key] for key in EXPORT_FIELDS})
+    updated_at = datetime.now().isoformat()
+    if deletes or updates:
+        doc_store.apply_bulk(list(deletes), [(doc_id, operations[index].content) for doc_id, index in updates.items()],
+                             updated_at=updated_at)
+        collection_version.bump()
+    for index, content in exports.items():
+        if content is not None:
+            doc = docs[operations[index].id]
+            result(index, "success", document={**{key: doc[key] for key in EXPORT_FIELDS if key in doc},
+                                               "updated_at": updated_at, "size": len(content), "content": content})
+    collection = session_collection(session)
+    if deletes:
+        lexical_index.delete_documents(list(deletes))
+        embeddings_error = None
+        if collection:
+            try:
+                collection.delete(where={"doc_id": {"$in": list(deletes)}})
+            except Exception as e:
+                embeddings_error = str(e)
+                logger.error("Error removing embeddings", extra={"documents": len(deletes), "error": str(e)})
+        for doc_id, index in deletes.items():
+            result(index, "success", filename=docs[doc_id]["filename"], embeddings_error=embeddings_error)
+    for doc_id, index in updates.items():
+        content = operations[index].content
+        if not collection:    # ChromaDB unavailable: as with a single edit, the content is saved as it is
+            result(index, "success", filename=docs[doc_id]["filename"], size=len(content),
+                   embedding=empty_embedding_report())
+            continue
+        try:
+            report = ingestion.update_document_chunks(collection, chunk_embedder, doc_id, content, {
+                "source": docs[doc_id]["filename"],
+                "session_id": session["session_id"],
+                "updated": True,
+                "update_time": updated_at
+            }, batch_size=embed_batch_size(), lexical_index=lexical_index)
+            result(index, "success", filename=docs[doc_id]["filename"], size=len(content), embedding=report)
+        except Exception as e:
+            logger.error("Error updating embeddings", extra={"doc_id": doc_id, "error": str(e)})
+            result(index, "error", message=f"Content saved but re-embedding failed: {e}")
+    if deletes or updates:
+        answer_cache.invalidate_documents([*deletes, *updates])
+    for index, op in enumerate(operations):
+        if results[index] is None:    # An update a later update or delete in the batch replaced
+            result(index, "success", filename=docs[op.id]["filename"], size=len(op.content), superseded=True)
+    summary = {"succeeded": sum(item["status"] == "success" for item in results)}
+    summary["failed"] = len(results) - summary["succeeded"]
+    logger.info("Bulk operations applied", extra={"operations": len(operations), **summary})
+    for item in results:
+        yield ndjson_line(item)
+    yield ndjson_line({"summary": {**summary, "operations": len(operations), "deleted": len(deletes),
+                                   "updated": len(updates), "exported": len(exports),
+                                   "elapsed": f"{time.time() - start_time:.2f}s"}})
+
+# Bulk delete/update/export of documents; results stream back as NDJSON, one line per operation
+@app.post("/ui-documents/bulk")
+def bulk_ui_documents(req: BulkRequest, session: Dict = Depends(get_session)):
+    return StreamingResponse(bulk_results(req.operations, session), media_type="application/x-ndjson")
+
+NO_DOCUMENTS_ANSWER = "I don't have any documents to search through. Please upload some documents first using the Upload Document section."
+NO_RESULTS_ANSWER = ("I couldn't find specific information about that in the uploaded documents. "
+                     "Try asking about something that might be in your documents, or upload more relevant files.")
+CHAT_ERROR_ANSWER = ("Sorry, I encountered an error while searching through the documents. "
+                     "Please try again or rephrase your question.")
+
+def answer_generator():
+    if CHAT_GENERATOR == "stub":
+        return generation.StubGenerator(STUB_TOKEN_DELAY)
+    return generation.iter_extractive_answer
+
+async def generate_answer(query: str, chunks: List[str], metadatas: List[Dict],
+                          highlights: Optional[List[List[str]]] = None) -> str:
+    """Whole answer for /chat; nothing has been sent yet, so any Ollama failure falls back"""
+    if OLLAMA_ENABLED:
+        try:
+            return await ollama.generate(generation.build_prompt(query, chunks, metadatas))
+        except OllamaError as e:
+            ollama.counters["fallbacks"] += 1
+            logger.warning("Ollama unavailable, using extractive answer", extra={"error": str(e)})
+    return await run_in_threadpool(lambda: "".join(answer_generator()(query, chunks, metadatas, highlights)))
+
+async def iter_answer(query: str, chunks: List[str], metadatas: List[Dict],
+                      highlights: Optional[List[List[str]]] = None) -> AsyncIterator[str]:
+    """Answer segments from Ollama when enabled, falling back to the local generator
+    if Ollama fails or times out before producing its first token"""
+    if OLLAMA_ENABLED:
+        produced = False
+        try:
+            async for token in ollama.stream(generation.build_prompt(query, chunks, metadatas)):
+                produced = True
+                yield token
+            return
+        except OllamaError as e:
+            if produced:
+                raise
+            ollama.counters["fallbacks"] += 1
+            logger.warning("Ollama unavailable, using extractive answer", extra={"error": str(e)})
+    async for segment in iterate_in_threadpool(answer_generator()(query, chunks, metadatas, highlights)):
+        yield segment
+
+def rerank(query: str, results: Dict, k: int, deadline: float) -> Dict:
+    """Top `k` of the over-fetched candidates, with the sentences to quote from each.
+    A stage reached after `deadline` (or without a loaded model) is skipped: the
+    candidates keep their retrieval order and chunks are quoted from their opening sentences."""
+    chunks = results["documents"][0]
+    pipeline = {"candidates": len(chunks), "k": k, "reranker": None, "skipped": [], "stages_ms": {}}
+    order = list(range(min(k, len(chunks))))
+    scores = results.get("scores", [[None] * len(chunks)])[0]
+    query_vector = None
+    start = time.perf_counter()
+    with span("rerank"):
+        if not resources.ready or start >= deadline:
+            pipeline["skipped"].append("rerank")
+        else:
+            query_vector = embed_query(query)
+            if cross_encoder is not None:
                 try:
-                    results = collection.get(where={"doc_id": doc_id})
-                    if results and results["ids"]:
-                        collection.delete(ids=results["ids"])
-                        print(f"Removed {len(results['ids'])} embeddings from ChromaDB")
+                    scores = cross_encoder.score(query, chunks).tolist()
+                    pipeline["reranker"] = "cross-encoder"
                 except Exception as e:
-                    print(f"Error removing embeddings: {e}")
-            print(f"Document '{deleted_doc['filename']}' deleted from session")
-            print(f"Session documents count after deletion: {len(session_documents)}")
-            return {
-                "status": "success", 
-                "message": f"Document '{deleted_doc['filename']}' deleted successfully",
-                "session_documents_count": len(session_documents)
-            }
-    print(f"Document ID {doc_id} not found in session")
-    # Also check if it exists in persistent storage (for cleanup)
-    for doc in ui_documents:
-        if doc["id"] == doc_id:
-            print(f"Document exists in persistent storage but not in session: {doc['filename']}")
-    return {"status": "error", "message": "Document not found in current session"}
-
-# Enhanced Chat endpoint WITHOUT Ollama (simple RAG)
-@app.post("/chat")
-async def chat(req: ChatRequest):
-    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 💬 CHAT QUERY")
-    print(f"Query: '{req.query}'")
-    
-    if not collection or collection.count() == 0:
-        print("No documents in ChromaDB for chat")
-        return {
-            "answer": "I don't have any documents to search through. Please upload some documents first using the Upload Document section."
+                    logger.warning("Cross-encoder unavailable, re-ranking by cosine", extra={"error": str(e)})
+            if pipeline["reranker"] is None:
+                cosine = retrieval.cosine_scores(query_vector, chunk_embedder(chunks))
+                scores = retrieval.fuse_with_retrieval_order(cosine).tolist()
+                pipeline["reranker"] = "cosine"
+            order = retrieval.top_k(scores, k)
+        top = retrieval.select({**results, "scores": [scores]}, order)
+    pipeline["stages_ms"]["rerank"] = round((time.perf_counter() - start) * 1000, 1)
+    start = time.perf_counter()
+    chunks = top["documents"][0]
+    with span("sentences"):
+        if query_vector is None or start >= deadline:
+            pipeline["skipped"].append("sentences")
+            highlights = retrieval.lead_sentences(chunks, SENTENCES_PER_CHUNK)
+        else:
+            sentences = [retrieval.split_sentences(chunk) for chunk in chunks]
+            flat = [sentence for chunk_sentences in sentences for sentence in chunk_sentences]
+            vectors = resources.embed(flat) if flat else []    # Uncached: query-time sentences are rarely seen twice
+            highlights = retrieval.top_sentences(query_vector, sentences, vectors, SENTENCES_PER_CHUNK)
+    pipeline["stages_ms"]["sentences"] = round((time.perf_counter() - start) * 1000, 1)
+    top["highlights"] = [highlights]
+    top["pipeline"] = pipeline
+    return top
+
+def retrieve_contexts(queries: List[str], session: Dict, mode: Optional[str] = None, candidates: Optional[int] = None,
+                      k: Optional[int] = None, budget_ms: Optional[float] = None) -> Optional[List[Dict]]:
+    """Re-ranked chunks of the session's documents for each chat query, or None when there is nothing to search.
+    The queries are embedded in one model batch and searched with one collection.query; each query
+    gets its share of the retrieval time plus the whole re-ranking budget."""
+    start = time.perf_counter()
+    mode = mode or RETRIEVAL_MODE
+    candidates = candidates or RETRIEVAL_CANDIDATES
+    k = min(k or CHAT_TOP_K, candidates)
+    budget = (budget_ms or RETRIEVAL_BUDGET_MS) / 1000
+    if mode == "hybrid" and not resources.ready:
+        resources.start_warm_up()    # Don't keep the user waiting on the model: answer lexically meanwhile
+        mode = "lexical"
+    if lexical_index.count(session["session_id"]) == 0:    # Indexed alongside every collection write
+        return None
+    if mode != "lexical" and not session_collection(session):
+        logger.warning("ChromaDB unavailable for chat")
+        return None
+    keys = [("reranked", normalize_query(query), session["session_id"], session.get("collection"), mode, candidates, k,
+             cross_encoder is not None, collection_version.value) for query in queries]
+    cached = [retrieval_cache.get(key) for key in keys]
+    contexts = [value for _, value in cached]
+    pending = [i for i, (found, _) in enumerate(cached) if not found]
+    if not pending:
+        return contexts
+    with span("retrieve"):
+        retrieved = retrieve_many([queries[i] for i in pending], session, n_results=candidates, mode=mode)
+    retrieve_seconds = (time.perf_counter() - start) / len(pending)
+    if len(pending) > 1 and resources.ready and cross_encoder is None:
+        with span("rerank"):    # Any chunk vector not cached yet is computed for the whole batch at once
+            chunk_embedder([chunk for results in retrieved for chunk in results["documents"][0]])
+    for i, results in zip(pending, retrieved):
+        results = rerank(queries[i], results, k, time.perf_counter() + budget - retrieve_seconds)
+        results["pipeline"]["mode"] = mode
+        results["pipeline"]["stages_ms"]["retrieve"] = round(retrieve_seconds * 1000, 1)
+        if not results["pipeline"]["skipped"]:    # Budget-degraded results are not worth keeping
+            retrieval_cache.set(keys[i], results)
+        logger.debug("Retrieved chunks", extra={"chunks": len(results["documents"][0]), **results["pipeline"]})
+        contexts[i] = results
+    return contexts
+
+def retrieve_context(query: str, session: Dict, mode: Optional[str] = None, candidates: Optional[int] = None,
+                     k: Optional[int] = None, budget_ms: Optional[float] = None) -> Optional[Dict]:
+    """Re-ranked chunks of the session's documents for a chat query, or None when there is nothing to search"""
+    contexts = retrieve_contexts([query], session, mode, candidates, k, budget_ms)
+    return None if contexts is None else contexts[0]
+
+def describe_sources(results: Dict) -> List[Dict]:
+    """What the UI shows for each retrieved chunk before the answer arrives"""
+    return [
+        {
+            "source": metadata.get("source", "a document"),
+            "doc_id": metadata.get("doc_id"),
+            "chunk": metadata.get("chunk"),
+            "page_start": metadata.get("page_start"),
+            "page_end": metadata.get("page_end"),
+            "distance": distance,
+            "score": score,
+            "preview": make_preview(chunk)
         }
+        for chunk, metadata, distance, score in zip(
+            results["documents"][0], results["metadatas"][0], results["distances"][0],
+            results.get("scores", results["distances"])[0]
+        )
+    ]
+
+def answer_scope(req: ChatRequest, session: Dict) -> tuple:
+    """Requests that may share a cached answer: same session and retrieval settings"""
+    candidates = req.candidates or RETRIEVAL_CANDIDATES
+    return session["session_id"], req.mode or RETRIEVAL_MODE, candidates, min(req.k or CHAT_TOP_K, candidates)
+
+def cached_answer(req: ChatRequest, session: Dict):
+    """(query vector, cached answer or None); both None until the model is loaded"""
+    if answer_cache.maxsize <= 0 or not resources.ready:
+        return None, None
+    vector = embed_query(req.query)
+    found, entry, similarity = answer_cache.get(vector, answer_scope(req, session))
+    if not found:
+        return vector, None
+    return vector, {**entry, "cached": {"similarity": round(similarity, 4), "query": entry["query"]}}
+
+def remember_answer(query_vector, req: ChatRequest, session: Dict, version: int, answer: str, results: Dict):
+    if query_vector is None or results["pipeline"]["skipped"]:    # Not budget-degraded answers either
+        return
+    answer_cache.put(query_vector, answer_scope(req, session), {
+        "query": req.query,
+        "answer": answer,
+        "retrieval": results["pipeline"],
+        "sources": describe_sources(results)
+    }, doc_ids={metadata.get("doc_id") for metadata in results["metadatas"][0]}, group=session["session_id"],
+        version=version)
+
+# Chat endpoint: simple RAG, with Ollama generation when OLLAMA_ENABLED.
+# The query embedding and index search run on the threadpool so they never
+# block the event loop while uploads are being ingested
+@app.post("/chat")
+async def chat(req: ChatRequest, session: Dict = Depends(get_session)):
     try:
-        # Get relevant document chunks
-        results = collection.query(
-            query_texts=[req.query],
-            n_results=3,
-            include=["documents", "distances", "metadatas"]
+        version = answer_cache.version
+        query_vector, hit = await run_in_threadpool(cached_answer, req, session)
+        if hit is not None:
+            return {"answer": hit["answer"], "retrieval": hit["retrieval"], "cached": hit["cached"]}
+        results = await run_in_threadpool(    # Get relevant document chunks
+            retrieve_context, req.query, session, req.mode, req.candidates, req.k, req.budget_ms
         )
-        print(f"Retrieved {len(results['documents'][0])} relevant chunks")
-        print(results)
+        if results is None:
+            return {"answer": NO_DOCUMENTS_ANSWER}
         if not results["documents"] or not results["documents"][0]:
-            print("No relevant information found")
-            return {
-                "answer": "I couldn't find specific information about that in the uploaded documents. "
-                            "Try asking about something that might be in your documents, or upload more relevant files."
-            }
+            return {"answer": NO_RESULTS_ANSWER}
         context_chunks = results["documents"][0]    # Extract context from results
         metadatas = results["metadatas"][0]
-        print(f"Found {len(context_chunks)} relevant sections")
-        if "procedure" in req.query.lower() or "step" in req.query.lower() or "how" in req.query.lower():    # Create a focused answer
-            answer = f"Here's what I found about '{req.query}':\n\n"    # For procedural questions
-            for i, (chunk, metadata) in enumerate(zip(context_chunks[:2], metadatas[:2]), 1):
-                source = metadata.get('source', 'a document')
-                answer += f"**From {source}:**\n"
-                lines = chunk.split('\n')    # Extract procedural content
-                for line in lines:
-                    if any(keyword in line.lower() for keyword in ['step', 'procedure', 'method', 'how to', 'instructions']):
-                        answer += f"- {line.strip()}\n"
-                if i < len(context_chunks[:2]):
-                    answer += "\n"
+        with span("answer"):
+            answer = await generate_answer(req.query, context_chunks, metadatas, results["highlights"][0])
+        logger.debug("Generated answer", extra={"chunks": len(context_chunks), "chars": len(answer)})
+        remember_answer(query_vector, req, session, version, answer, results)
+        return {"answer": answer, "retrieval": results["pipeline"]}
+    except Exception:
+        logger.exception("Chat error")
+        return {"answer": CHAT_ERROR_ANSWER}
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def chat_events(req: ChatRequest, session: Dict) -> AsyncIterator[str]:
+    """Server-sent events for one chat query: `sources` first, then one `token`
+    per answer segment as it is generated, then `done` (or `error`)"""
+    start_time = time.time()
+    query = req.query
+    pipeline = cached = None
+    try:
+        version = answer_cache.version
+        query_vector, hit = await run_in_threadpool(cached_answer, req, session)
+        if hit is not None:    # The whole answer at once
+            pipeline, cached = hit["retrieval"], hit["cached"]
+            yield sse_event("sources", hit["sources"])
+            yield sse_event("token", {"text": hit["answer"]})
         else:
-            # For general questions
-            answer = "Based on the uploaded documents:\n\n"
-            for i, (chunk, metadata) in enumerate(zip(context_chunks[:2], metadatas[:2]), 1):
-                source = metadata.get('source', 'a document')
-                answer += f"**Information from {source}:**\n"
-                # Take the most relevant part of the chunk
-                sentences = chunk.split('. ')
-                relevant_sentences = []
-                query_lower = req.query.lower()
-                for sentence in sentences:
-                    if len(sentence.split()) > 3:    # Avoid very short sentences
-                        if any(word in sentence.lower() for word in query_lower.split()):
-                            relevant_sentences.append(sentence.strip() + '.')
-                        elif len(relevant_sentences) < 2:    # Take first few sentences
-                            relevant_sentences.append(sentence.strip() + '.')
-                answer += " ".join(relevant_sentences[:3]) + "\n\n"
-        answer += "\n*This information comes from your uploaded documents. For more details, you can view the full documents in the See Documents section.*"
-        print(f"Generated answer ({len(answer)} chars)")
-        return {"answer": answer}
-    except Exception as e:
-        print(f"Chat error: {e}")
-        return {
-            "answer": "Sorry, I encountered an error while searching through the documents. "
-                        "Please try again or rephrase your question."
-        }
+            results = await run_in_threadpool(retrieve_context, query, session, req.mode, req.candidates, req.k,
+                                              req.budget_ms)
+            if results is None or not results["documents"] or not results["documents"][0]:
+                yield sse_event("sources", [])
+                yield sse_event("token", {"text": NO_DOCUMENTS_ANSWER if results is None else NO_RESULTS_ANSWER})
+            else:
+                pipeline = results["pipeline"]
+                yield sse_event("sources", describe_sources(results))
+                answer_started = time.perf_counter()    # Not a span: the client's reading time would count too
+                segments = []
+                async for segment in iter_answer(query, results["documents"][0], results["metadatas"][0],
+                                                 results["highlights"][0]):
+                    segments.append(segment)
+                    yield sse_event("token", {"text": segment})
+                telemetry.record("answer", time.perf_counter() - answer_started)
+                remember_answer(query_vector, req, session, version, "".join(segments), results)
+    except Exception:
+        logger.exception("Chat stream error")
+        yield sse_event("error", {"message": CHAT_ERROR_ANSWER})
+    done = {"elapsed": f"{time.time() - start_time:.2f}s", "retrieval": pipeline}
+    if cached is not None:
+        done["cached"] = cached
+    yield sse_event("done", done)
+
+# Streaming chat: every event is flushed as soon as it is yielded
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, session: Dict = Depends(get_session)):
+    return StreamingResponse(
+        chat_events(req, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def batch_item(index: int, query: str, results: Optional[Dict]) -> Dict:
+    """One /chat/batch result without its answer: the retrieved chunk ids with their scores"""
+    if results is None or not results["documents"] or not results["documents"][0]:
+        return {"index": index, "query": query, "chunks": [], "retrieval": results and results.get("pipeline")}
+    return {
+        "index": index,
+        "query": query,
+        "chunks": [
+            {"id": chunk_id, "doc_id": metadata.get("doc_id"), "source": metadata.get("source"),
+             "chunk": metadata.get("chunk"), "score": score, "distance": distance}
+            for chunk_id, metadata, distance, score in zip(
+                results["ids"][0], results["metadatas"][0], results["distances"][0],
+                results.get("scores", results["distances"])[0]
+            )
+        ],
+        "retrieval": results["pipeline"]
+    }
+
+async def batch_answer(query: str, results: Optional[Dict]) -> str:
+    if results is None:
+        return NO_DOCUMENTS_ANSWER
+    if not results["documents"] or not results["documents"][0]:
+        return NO_RESULTS_ANSWER
+    with span("answer"):
+        return await generate_answer(query, results["documents"][0], results["metadatas"][0],
+                                     results["highlights"][0])
+
+async def chat_batch_items(req: ChatBatchRequest, session: Dict) -> AsyncIterator[Dict]:
+    """Results in query order, CHAT_BATCH_SIZE queries per retrieval round.
+    Answers bypass the semantic answer cache, so an evaluation always sees the live pipeline."""
+    for offset in range(0, len(req.queries), CHAT_BATCH_SIZE):
+        queries = req.queries[offset:offset + CHAT_BATCH_SIZE]
+        try:
+            contexts = await run_in_threadpool(retrieve_contexts, queries, session, req.mode, req.candidates,
+                                               req.k, req.budget_ms)
+        except Exception as e:
+            logger.exception("Batch retrieval error")
+            for i, query in enumerate(queries, offset):
+                yield {"index": i, "query": query, "error": str(e)}
+            continue
+        contexts = contexts or [None] * len(queries)
+        answers = [None] * len(queries)
+        if req.answers:
+            answers = await asyncio.gather(*(batch_answer(query, results) for query, results in zip(queries, contexts)),
+                                           return_exceptions=True)
+        for i, (query, results, answer) in enumerate(zip(queries, contexts, answers), offset):
+            item = batch_item(i, query, results)
+            if isinstance(answer, Exception):
+                item["error"] = str(answer)
+            elif answer is not None:
+                item["answer"] = answer
+            yield item
+
+def batch_summary(items: int, failed: int, start_time: float) -> Dict:
+    elapsed = time.time() - start_time
+    return {"queries": items, "failed": failed, "elapsed": f"{elapsed:.2f}s",
+            "queries_per_second": round(items / elapsed, 2) if elapsed else None}
+
+async def chat_batch_lines(req: ChatBatchRequest, session: Dict) -> AsyncIterator[str]:
+    start_time, count, failed = time.time(), 0, 0
+    async for item in chat_batch_items(req, session):
+        count += 1
+        failed += "error" in item
+        yield ndjson_line(item)
+    yield ndjson_line({"summary": batch_summary(count, failed, start_time)})
+
+# Many chat queries in one call (evaluation, regression runs): each round of queries is
+# embedded in one model batch and searched with one collection.query. With `stream`,
+# results come back as NDJSON lines, then a summary line
+@app.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest, session: Dict = Depends(get_session)):
+    if req.stream:
+        return StreamingResponse(chat_batch_lines(req, session), media_type="application/x-ndjson")
+    start_time = time.time()
+    results = [item async for item in chat_batch_items(req, session)]
+    failed = sum(1 for item in results if "error" in item)
+    logger.info("Chat batch answered", extra={"session_id": session["session_id"], "queries": len(results),
+                                              "failed": failed, "seconds": round(time.time() - start_time, 3)})
+    return {"status": "success", "results": results, "summary": batch_summary(len(results), failed, start_time)}
 
 # Health check
 @app.get("/health")
 async def health_check():
     status = {
         "status": "healthy",
+        "ready": resources.ready,
         "timestamp": datetime.now().isoformat(),
-        "session_id": current_session_id,
-        "session_documents": len(session_documents),
-        "total_documents_in_storage": len(ui_documents),
-        "chromadb_documents": collection.count() if collection else 0,
+        "sessions": sessions.count(),
+        "tenant_collections": len(sessions.tenant_collections()),
+        "total_documents_in_storage": doc_store.count(),
+        "chromadb_documents": resources.count() or 0,
         "ollama_enabled": OLLAMA_ENABLED,
-        "upload_workers": executor._max_workers
+        "ollama": ollama.stats(),
+        "upload_workers": executor._max_workers,
+        "ingest_jobs": ingest_jobs.stats(),
+        "cache": {
+            "collection_version": collection_version.value,
+            "query_embeddings": query_embedding_cache.stats(),
+            "retrieval": retrieval_cache.stats(),
+            "answers": answer_cache.stats(),
+            "chunk_embeddings": embedding_cache.count()
+        },
+        "retrieval_mode": RETRIEVAL_MODE,
+        "lexical_index_chunks": lexical_index.count(),
+        "pdf_workers": ingestion.PDF_WORKERS,
+        "maintenance": {"running": maintenance.running,
+                        "last_run": (maintenance.last_report or {}).get("finished_at")},
+        "startup": {"import_seconds": round(IMPORT_SECONDS, 4), **resources.status()}
     }
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🩺 Health check")
     return status
 
+# Prometheus text exposition: stage and request histograms, ingest counters, store gauges
+@app.get("/metrics")
+def metrics():
+    return Response(telemetry.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Liveness: the process is up and serving requests (never touches the model)
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+# Readiness: the model and collection are loaded; 503 while warming up or after a failed load (retried with backoff)
+@app.get("/health/ready")
+async def readiness():
+    status = resources.status()
+    if not resources.ready:
+        return JSONResponse(status_code=503, content={"status": "not_ready", **status})
+    return {"status": "ready", **status}
+
 #Get current session info
 @app.get("/session-info")
-async def get_session_info():
+async def get_session_info(session: Dict = Depends(get_session)):
     return {
         "status": "success",
-        "session_id": current_session_id,
-        "session_started": datetime.now().isoformat(),
-        "documents_in_session": len(session_documents),
-        "total_documents_in_chromadb": collection.count() if collection else 0
+        "session_id": session["session_id"],
+        "session_started": session["created_at"],
+        "collection": session["collection"] or resources.collection_name,
+        "documents_in_session": doc_store.count(session["session_id"]),
+        "total_documents_in_chromadb": resources.count() or 0
     }
     
-# Clear all data (for testing)
+# Clearing every session and running maintenance act on all tenants' data, so those
+# endpoints are off unless ADMIN_TOKEN is set, and then need it as a bearer token
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+
+def bearer_token_error(request: Request, token: Optional[str], kind: str, disabled: str) -> Optional[JSONResponse]:
+    """The response refusing a request guarded by `token`, or None when it may proceed"""
+    if token is None:
+        return JSONResponse(status_code=403, content={"status": "error", "message": disabled})
+    supplied = request.headers.get("Authorization", "").encode("utf-8")
+    if not hmac.compare_digest(supplied, f"Bearer {token}".encode("utf-8")):
+        return JSONResponse(status_code=401, content={"status": "error", "message": f"Invalid or missing {kind} token"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    return None
+
+def admin_access_error(request: Request) -> Optional[JSONResponse]:
+    return bearer_token_error(request, ADMIN_TOKEN, "admin", "Admin endpoints are disabled; set ADMIN_TOKEN")
+
+def clear_all_stores():
+    """Empty every store and cache (the caller holds the write gate exclusively)"""
+    # Clear UI documents
+    doc_store.clear()
+    lexical_index.clear()
+    collection_version.bump()
+    answer_cache.clear()
+    # Clear ChromaDB, including every tenant's own collection (the shared one is recreated empty)
+    if resources.collection():
+        for name in sessions.tenant_collections():
+            resources.drop_collection(name)
+        resources.drop_collection()
+        logger.info("Cleared all data")
+    sessions.clear()    # Clients keep their ids; they are registered again on their next upload
+
+def clear_session_stores(session: Dict) -> int:
+    """Remove a session's documents and chunks (the caller holds the write gate); returns
+    the documents removed. Its own collection is emptied, not dropped, so an ingest still
+    writing to it keeps a valid handle"""
+    session_id = session["session_id"]
+    doc_ids = [doc["id"] for doc in doc_store.list_documents(session_id=session_id)]
+    doc_store.apply_bulk(doc_ids, [])
+    lexical_index.delete_documents(doc_ids)
+    collection_version.bump()
+    answer_cache.invalidate_documents(doc_ids)
+    collection = session_collection(session)
+    if collection:
+        collection.delete(where={"session_id": session_id})
+    logger.info("Cleared session data", extra={"session_id": session_id, "documents": len(doc_ids)})
+    return len(doc_ids)
+
+# Clear the calling session's documents (for testing), or with all=true and the admin
+# token every session's; plain `def` as it waits for in-flight writes to finish
 @app.post("/clear-all")
-async def clear_all_data():
-    global ui_documents
+def clear_all_data(request: Request, all_sessions: bool = Query(False, alias="all"),
+                   session: Dict = Depends(get_session)):
+    if all_sessions:
+        denied = admin_access_error(request)
+        if denied:
+            return denied
     try:
-        # Clear UI documents
-        ui_documents = []
-        save_ui_documents()
-        # Clear ChromaDB
-        if collection:
-            client.delete_collection(name="documents")
-            print("Cleared all data")
-        return {"status": "success", "message": "All data cleared"}
+        if all_sessions:
+            with write_gate.exclusive():
+                clear_all_stores()
+            return {"status": "success", "message": "All data cleared"}
+        with write_gate.writing():
+            removed = clear_session_stores(session)
+        return {"status": "success", "message": "Session data cleared", "documents_removed": removed}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+
+# Reconcile ChromaDB and the lexical index with the document store in the background (admin)
+@app.post("/maintenance", status_code=202)
+async def start_maintenance(request: Request, rebuild: Optional[bool] = None, dry_run: bool = False):
+    denied = admin_access_error(request)
+    if denied:
+        return denied
+    if maintenance.running:
+        return JSONResponse(status_code=409, content={"status": "error", "message": "Maintenance is already running"})
+    asyncio.get_running_loop().run_in_executor(executor, maintenance.run, rebuild, dry_run)
+    return {"status": "accepted", "message": "Maintenance started", "last_report": maintenance.last_report}
+
+# Whether maintenance is running, and the report of the last run (admin)
+@app.get("/maintenance")
+async def maintenance_status(request: Request):
+    denied = admin_access_error(request)
+    if denied:
+        return denied
+    return {
+        "status": "success",
+        "running": maintenance.running,
+        "interval_seconds": MAINTENANCE_INTERVAL,
+        "writers": write_gate.writers,
+        "last_report": maintenance.last_report
+    }
     
+def reset_caches():
+    """Forget cached retrievals and answers after the stores changed wholesale"""
+    collection_version.bump()
+    answer_cache.clear()
+
+# Snapshots bulk-load stored vectors, so a replica starts without running the embedding model over the corpus
+snapshots = Snapshots(resources, doc_store, lexical_index, sessions, embedding_cache, write_gate,
+                      on_change=reset_caches)
+# A snapshot holds every tenant's documents, so /snapshot is off unless this is set,
+# and then needs it as a bearer token; `python -m snapshot` works either way
+SNAPSHOT_TOKEN = os.environ.get("SNAPSHOT_TOKEN") or None
+
+def snapshot_access_error(request: Request) -> Optional[JSONResponse]:
+    return bearer_token_error(request, SNAPSHOT_TOKEN, "snapshot",
+                              "Snapshots over HTTP are disabled; set SNAPSHOT_TOKEN or use python -m snapshot")
+
+# Download a snapshot of every store (documents, sessions, chunks and their vectors) as a tar.
+# Session ids are replaced by pseudonyms (see snapshot.py) unless keep_session_ids=true,
+# for a replica the same clients keep using
+@app.get("/snapshot")
+def export_snapshot(request: Request, keep_session_ids: bool = False):
+    denied = snapshot_access_error(request)
+    if denied:
+        return denied
+    workdir = tempfile.mkdtemp(prefix="rag-snapshot-")
+    try:
+        snapshots.export(os.path.join(workdir, "snapshot"), keep_session_ids=keep_session_ids)
+        name = f"snapshot-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tar"
+        snapshot.pack(os.path.join(workdir, "snapshot"), os.path.join(workdir, name))
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        return JSONResponse(status_code=503, content={"status": "error", "message": str(e)})
+    return FileResponse(os.path.join(workdir, name), media_type="application/x-tar", filename=name,
+                        background=BackgroundTask(shutil.rmtree, workdir, ignore_errors=True))
+
+# Load a snapshot tar into an empty index (or, with replace=true, in place of the current one) without re-embedding
+@app.post("/snapshot")
+def import_snapshot(request: Request, file: UploadFile = File(...), replace: bool = False, verify: bool = True):
+    denied = snapshot_access_error(request)
+    if denied:
+        return denied
+    workdir = tempfile.mkdtemp(prefix="rag-snapshot-")
+    try:
+        archive = os.path.join(workdir, "snapshot.tar")
+        with open(archive, "wb") as f:
+            shutil.copyfileobj(file.file, f, length=1024 * 1024)
+        snapshot.unpack(archive, os.path.join(workdir, "snapshot"))
+        os.remove(archive)
+        return snapshots.load(os.path.join(workdir, "snapshot"), replace=replace, verify=verify)
+    except snapshot.SnapshotConflictError as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e)})
+    except (snapshot.SnapshotError, tarfile.TarError) as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        logger.exception("Snapshot import failed")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
 # Debug function to check session state
 @app.get("/debug-session")
-async def debug_session():
+async def debug_session(session: Dict = Depends(get_session)):
+    session_documents = doc_store.list_documents(session_id=session["session_id"])
     return {
-        "session_id": current_session_id,
+        "session_id": session["session_id"],
         "session_documents_count": len(session_documents),
         "session_documents": [
             {
@@ -650,9 +1403,11 @@ async def debug_session():
             }
             for doc in session_documents
         ],
-        "all_documents_count": len(ui_documents),
-        "chromadb_count": collection.count() if collection else 0
+        "all_documents_count": doc_store.count(),
+        "chromadb_count": resources.count() or 0
     }
     
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
 # for running the app.py file
 # uvicorn backend:app --reload --port 8000
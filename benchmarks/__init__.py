@@ -0,0 +1 @@
+"""Benchmarks for the ingest and query hot paths; run with `python -m benchmarks.run`."""
@@ -0,0 +1,132 @@
+"""Synthetic, reproducible corpora: the same seed always gives the same bytes.
+
+Text is drawn from a fixed technical vocabulary with a sprinkling of
+identifiers (part numbers, error codes) so both the dense and the lexical
+retrievers have something to find. PDFs are written directly (one Helvetica
+text object per page), so no PDF library is needed to generate them.
+"""
+import os
+import random
+from typing import Dict, List, NamedTuple
+
+PAGE_CHARS = 3000    # A TXT "page" for throughput figures: roughly one printed page
+
+VOCABULARY = """
+pump valve bearing seal shaft impeller motor gearbox coupling flange gasket pressure flow rate temperature
+vibration alignment lubrication inspection maintenance procedure torque clearance tolerance sensor controller
+calibration filter strainer housing rotor stator winding insulation voltage current relay breaker fuse cable
+manual operator shutdown startup isolation lockout tagout permit hazard checklist schedule interval replace
+tighten loosen measure record verify adjust drain vent flush clean install remove assemble disassemble
+""".split()
+TOPICS = ["pump overhaul", "valve inspection", "motor alignment", "bearing replacement", "seal failure",
+          "gearbox lubrication", "sensor calibration", "breaker testing", "filter change", "startup checks"]
+
+
+class Document(NamedTuple):
+    filename: str
+    data: bytes
+    pages: int
+    chars: int
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(VOCABULARY, k=rng.randint(8, 20))
+    if rng.random() < 0.15:
+        words.insert(rng.randrange(len(words)), f"ERR-{rng.randint(1000, 9999)}")
+    if rng.random() < 0.15:
+        words.insert(rng.randrange(len(words)), f"PN-{rng.randint(100, 999)}-{rng.choice('ABCDEF')}")
+    return " ".join(words).capitalize() + "."
+
+
+def page_text(rng: random.Random, topic: str, chars: int = PAGE_CHARS) -> str:
+    """About `chars` characters of paragraphs on a topic"""
+    paragraphs, size = [], 0
+    while size < chars:
+        paragraph = f"The {topic} procedure. " + " ".join(sentence(rng) for _ in range(rng.randint(3, 7)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal valid PDF with one page per string (lines wrapped at 90 characters)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"",
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = []
+        for paragraph in text.split("\n"):
+            words, line = paragraph.split(), ""
+            for word in words:
+                if len(line) + len(word) > 90:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}" if line else word
+            lines.append(line)
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = ("BT /F1 8 Tf 30 810 Td 9 TL " + " ".join(f"({line}) '" for line in escaped) + " ET").encode("latin-1")
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def text_corpus(documents: int, pages_per_document: int, seed: int = 0) -> List[Document]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(documents):
+        topic = TOPICS[i % len(TOPICS)]
+        text = "\n\n".join(page_text(rng, topic) for _ in range(pages_per_document))
+        corpus.append(Document(f"bench_{i:04d}.txt", text.encode("utf-8"), pages_per_document, len(text)))
+    return corpus
+
+
+def pdf_corpus(documents: int, pages_per_document: int, seed: int = 0) -> List[Document]:
+    rng = random.Random(seed + 1)
+    corpus = []
+    for i in range(documents):
+        topic = TOPICS[i % len(TOPICS)]
+        pages = [page_text(rng, topic) for _ in range(pages_per_document)]
+        corpus.append(Document(f"bench_{i:04d}.pdf", make_pdf(pages), pages_per_document, sum(map(len, pages))))
+    return corpus
+
+
+def queries(count: int, seed: int = 0) -> List[str]:
+    """Distinct chat queries, so cached results do not flatter the latency figures"""
+    rng = random.Random(seed + 2)
+    generated: Dict[str, None] = {}
+    while len(generated) < count:
+        kind = rng.random()
+        if kind < 0.2:
+            query = f"ERR-{rng.randint(1000, 9999)}"
+        elif kind < 0.6:
+            query = f"How do I {rng.choice(['replace', 'inspect', 'adjust', 'verify'])} the {rng.choice(VOCABULARY)} " \
+                    f"during {rng.choice(TOPICS)}?"
+        else:
+            query = " ".join(rng.sample(VOCABULARY, 4))
+        generated[query] = None
+    return list(generated)
+
+
+def write_corpus(corpus: List[Document], directory: str) -> List[str]:
+    """Write a corpus to disk (to inspect it, or ingest it by other means); returns the paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for document in corpus:
+        path = os.path.join(directory, document.filename)
+        with open(path, "wb") as f:
+            f.write(document.data)
+        paths.append(path)
+    return paths
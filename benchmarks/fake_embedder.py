@@ -0,0 +1,48 @@
+"""Offline stand-in for the sentence-transformers model.
+
+Words are hashed into a fixed number of buckets and the counts normalised, so
+texts sharing words land close together and retrieval still returns sensible
+chunks. It costs microseconds per text, which keeps the benchmarks focused on
+everything around the model; use `--embedder model` to include the real one.
+"""
+import hashlib
+import re
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+FAKE_DIMENSIONS = 384    # Same width as all-MiniLM-L6-v2, so stored vectors cost the same
+
+WORD_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, model_name: str = "hashing", dimensions: int = FAKE_DIMENSIONS, **kwargs):
+        self.model_name = model_name
+        self.dimensions = dimensions
+
+    def __call__(self, input):
+        vectors = np.zeros((len(input), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(input):
+            for word in WORD_RE.findall(text.lower()):
+                vectors[row, int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "little") % self.dimensions] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return list(vectors)
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark-hashing"
+
+    def get_config(self):
+        return {"model_name": self.model_name, "dimensions": self.dimensions}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction(**config)
+
+
+def install():
+    """Make Resources load the hashing embedder instead of the sentence-transformers model.
+    Must run before the model is first loaded."""
+    import embedders
+    embedders.BatchedSentenceTransformerEmbeddingFunction = HashingEmbeddingFunction
@@ -0,0 +1,371 @@
+"""Benchmark harness: ingest throughput, /chat latency under load, memory and startup time.
+
+Runs the app in-process through Starlette's TestClient, in a scratch working
+directory (its own ChromaDB store and document database), against synthetic
+corpora from corpus.py, with the hashing embedder by default so it runs
+offline. Results are written as JSON; `--compare` prints the change against an
+earlier results file, e.g. one from the previous commit.
+
+    python -m benchmarks.run --sizes small,medium --output bench.json
+    python -m benchmarks.run --sizes small --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import resource    # Unix only; memory figures are omitted elsewhere
+except ImportError:
+    resource = None
+
+from benchmarks import corpus
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> {"txt": (documents, pages each), "pdf": (documents, pages each)}
+SIZES = {
+    "small": {"txt": (20, 2), "pdf": (5, 5)},
+    "medium": {"txt": (100, 4), "pdf": (20, 20)},
+    "large": {"txt": (400, 5), "pdf": (50, 50)},
+}
+UPLOAD_BATCH = 16    # Files per /upload-multiple request
+WARMUP_QUERIES = 5    # Chat requests sent before timing starts
+BENCH_ENV = {
+    "MAINTENANCE_INTERVAL": "0",    # No background passes during a run
+    "OLLAMA_ENABLED": "0",
+    "ANSWER_CACHE_SIZE": "0",    # Paraphrased queries would be answered from cache, hiding the pipeline
+    "DOCUMENTS_DB": "ui_documents.db",
+}
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """High-water resident memory of this process and of its finished/waited children (PDF workers)"""
+    if resource is None:
+        return {"self_mb": None, "children_mb": None}
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024    # ru_maxrss is bytes on macOS, KiB on Linux
+    return {
+        "self_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_environment(embedder: str):
+    """Settings and embedder for a run; must happen before `backend` is imported"""
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if embedder == "hashing":
+        from benchmarks import fake_embedder
+        fake_embedder.install()
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Swallow the app's console output while timing (it costs real time on a terminal):
+    stdout, and the "rag" logs on stderr below WARNING"""
+    if not enabled:
+        yield
+        return
+    logger = logging.getLogger("rag")
+    level = logger.level
+    logger.setLevel(max(level, logging.WARNING))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logger.setLevel(level)
+
+
+# ---------------------------------------------------------------- phases
+
+def bench_ingest(client, documents: List[corpus.Document], headers: Dict, verbose: bool) -> Dict:
+    """Upload a corpus in /upload-multiple batches; throughput over the whole corpus"""
+    content_type = "application/pdf" if documents and documents[0].filename.endswith(".pdf") else "text/plain"
+    chunks = failed = 0
+    start = time.perf_counter()
+    for i in range(0, len(documents), UPLOAD_BATCH):
+        files = [("files", (doc.filename, doc.data, content_type)) for doc in documents[i:i + UPLOAD_BATCH]]
+        with quiet(not verbose):
+            response = client.post("/upload-multiple", files=files, headers=headers).json()
+        failed += response.get("failed", 0)
+        chunks += sum((f.get("embedding") or {}).get("stored", 0) for f in response.get("successful_files", []))
+    elapsed = time.perf_counter() - start
+    pages = sum(doc.pages for doc in documents)
+    return {
+        "documents": len(documents),
+        "failed": failed,
+        "pages": pages,
+        "chunks": chunks,
+        "megabytes": round(sum(len(doc.data) for doc in documents) / 1e6, 3),
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(chunks / elapsed, 2) if elapsed else None,
+        "docs_per_s": round(len(documents) / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_chat(client, queries: List[str], concurrency: int, headers: Dict, verbose: bool) -> Dict:
+    """Send `queries` to /chat from `concurrency` threads at once; per-request latency"""
+    from backend import CHAT_ERROR_ANSWER    # A failed chat is still a 200, with this answer
+
+    def ask(query: str):
+        start = time.perf_counter()
+        response = client.post("/chat", json={"query": query}, headers=headers)
+        ok = response.status_code == 200 and response.json().get("answer") != CHAT_ERROR_ANSWER
+        return time.perf_counter() - start, ok
+
+    with quiet(not verbose):
+        for query in queries[:WARMUP_QUERIES]:
+            ask(query)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(ask, queries[WARMUP_QUERIES:]))
+        elapsed = time.perf_counter() - start
+    latencies = [latency for latency, _ in results]
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 2) if elapsed else None,
+        **percentiles(latencies),
+    }
+
+
+def bench_chat_batch(client, queries: List[str], headers: Dict, verbose: bool) -> Dict:
+    """The same queries in one /chat/batch call: retrieval and answer throughput without per-request overhead"""
+    with quiet(not verbose):
+        start = time.perf_counter()
+        response = client.post("/chat/batch", json={"queries": queries}, headers=headers)
+        elapsed = time.perf_counter() - start
+    results = response.json().get("results", []) if response.status_code == 200 else []
+    return {
+        "queries": len(queries),
+        "errors": len(queries) - len(results) + sum(1 for item in results if "error" in item),
+        "seconds": round(elapsed, 3),
+        "queries_per_s": round(len(queries) / elapsed, 2) if elapsed else None,
+    }
+
+
+def startup_probe():
+    """Runs in a fresh interpreter (see bench_startup): import and time-to-ready of the app"""
+    from fastapi.testclient import TestClient
+    start = time.perf_counter()
+    with quiet(True):
+        import backend
+    imported = time.perf_counter()
+    with quiet(True), TestClient(backend.app) as client:
+        client.get("/health/live")
+        live = time.perf_counter()
+        backend.resources.warm_up()    # Joins the background warm-up, or loads now if it is disabled
+        ready = time.perf_counter()
+        ready_at = time.time()
+        client.post("/chat", json={"query": "startup check"})
+        first_chat = time.perf_counter()
+    print(json.dumps({
+        "import_s": round(imported - start, 4),
+        "live_s": round(live - start, 4),
+        "ready_s": round(ready - start, 4),
+        "first_chat_s": round(first_chat - start, 4),
+        "ready_at": ready_at,
+        **peak_rss_mb(),
+    }))
+
+
+def bench_startup(embedder: str, runs: int) -> Dict:
+    """Startup of a fresh process on an empty store, median over `runs`"""
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="rag-bench-startup-") as workdir:
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")]))}
+            spawned_at = time.time()
+            completed = subprocess.run([sys.executable, "-m", "benchmarks.run", "--startup-probe", "--embedder", embedder],
+                                       cwd=workdir, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                return {"error": completed.stderr.strip().splitlines()[-1:] or ["startup probe failed"]}
+            sample = json.loads(completed.stdout.strip().splitlines()[-1])
+            # Interpreter start included; its teardown after the probe is not
+            sample["process_ready_s"] = round(sample.pop("ready_at") - spawned_at, 4)
+            samples.append(sample)
+    return {key: round(statistics.median(s[key] for s in samples), 4) if samples[0][key] is not None else None
+            for key in samples[0]} | {"runs": runs}
+
+
+def run(args) -> Dict:
+    prepare_environment(args.embedder)
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": args.embedder,
+            "embedding_backend": None if args.embedder == "hashing" else "+".join(filter(None, [
+                os.environ.get("EMBEDDING_BACKEND", "sentence-transformers"), os.environ.get("EMBEDDING_QUANTIZE")])),
+            "sizes": args.sizes,
+            "concurrency": args.concurrency,
+            "queries": args.queries,
+            "seed": args.seed,
+        },
+        "startup": bench_startup(args.embedder, args.startup_runs) if args.startup_runs else None,
+        "sizes": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)    # The app keeps its store relative to the working directory
+    try:
+        from fastapi.testclient import TestClient
+        with quiet(not args.verbose):
+            import backend
+        headers = {backend.SESSION_HEADER: "benchmark-session"}
+        with quiet(not args.verbose), TestClient(backend.app) as client:
+            backend.resources.warm_up()
+            for name in args.sizes:
+                spec = SIZES[name]
+                client.post("/clear-all", headers=headers)
+                print(f"[{name}] generating corpora ...", file=sys.stderr)
+                txt = corpus.text_corpus(*spec["txt"], seed=args.seed)
+                pdf = corpus.pdf_corpus(*spec["pdf"], seed=args.seed)
+                print(f"[{name}] ingesting {len(txt)} TXT + {len(pdf)} PDF documents ...", file=sys.stderr)
+                size = {"ingest": {"txt": bench_ingest(client, txt, headers, args.verbose),
+                                   "pdf": bench_ingest(client, pdf, headers, args.verbose)}}
+                size["memory_after_ingest"] = peak_rss_mb()
+                print(f"[{name}] {args.queries} chat queries at concurrency {args.concurrency} ...", file=sys.stderr)
+                chat_queries = corpus.queries(args.queries + WARMUP_QUERIES, seed=args.seed)
+                size["chat"] = bench_chat(client, chat_queries, args.concurrency, headers, args.verbose)
+                print(f"[{name}] {args.queries} queries in one /chat/batch call ...", file=sys.stderr)
+                backend.retrieval_cache.clear()    # /chat just cached these very queries
+                backend.query_embedding_cache.clear()
+                size["chat_batch"] = bench_chat_batch(client, chat_queries[WARMUP_QUERIES:], headers, args.verbose)
+                size["memory_after_chat"] = peak_rss_mb()
+                results["sizes"][name] = size
+    finally:
+        os.chdir(previous_dir)
+        if not args.keep:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Scratch directory kept: {workdir}", file=sys.stderr)
+    return results
+
+
+# ---------------------------------------------------------------- reporting
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of a results document, keyed by dotted path"""
+    flat = {}
+    for key, value in (data or {}).items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline: Dict, current: Dict) -> str:
+    """Side-by-side table of every metric present in both result documents"""
+    old = {**flatten(baseline.get("sizes"), "sizes."), **flatten(baseline.get("startup"), "startup.")}
+    new = {**flatten(current.get("sizes"), "sizes."), **flatten(current.get("startup"), "startup.")}
+    lines = [f"{'metric':<52} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for key in sorted(old.keys() & new.keys()):
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else ""
+        lines.append(f"{key:<52} {old[key]:>12} {new[key]:>12} {change:>9}")
+    lines.append(f"baseline: {baseline.get('meta', {}).get('commit')}  current: {current.get('meta', {}).get('commit')}")
+    return "\n".join(lines)
+
+
+def summary(results: Dict) -> str:
+    lines = []
+    startup = results.get("startup") or {}
+    if "ready_s" in startup:
+        lines.append(f"startup: import {startup['import_s']}s, ready {startup['ready_s']}s, "
+                     f"first chat {startup['first_chat_s']}s, new process to ready {startup['process_ready_s']}s")
+    for name, size in results["sizes"].items():
+        for kind, ingest in size["ingest"].items():
+            lines.append(f"[{name}] ingest {kind}: {ingest['pages_per_s']} pages/s, {ingest['chunks_per_s']} chunks/s "
+                         f"({ingest['documents']} docs, {ingest['chunks']} chunks, {ingest['seconds']}s)")
+        chat = size["chat"]
+        lines.append(f"[{name}] chat: p50 {chat.get('p50_ms')}ms p95 {chat.get('p95_ms')}ms p99 {chat.get('p99_ms')}ms, "
+                     f"{chat['requests_per_s']} req/s, {chat['errors']} errors")
+        batch = size.get("chat_batch")
+        if batch:
+            lines.append(f"[{name}] chat batch: {batch['queries_per_s']} queries/s, {batch['errors']} errors")
+        lines.append(f"[{name}] peak RSS: {size['memory_after_chat']['self_mb']} MB")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and chat of the RAG backend")
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma-separated corpus sizes: {', '.join(SIZES)}")
+    parser.add_argument("--embedder", choices=["hashing", "model"], default="hashing",
+                        help="hashing: offline stand-in (default); model: the configured embedding model "
+                             "(EMBEDDING_BACKEND / EMBEDDING_QUANTIZE select its runtime)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /chat requests")
+    parser.add_argument("--queries", type=int, default=200, help="Timed /chat requests per size")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Fresh processes timed for startup (0 skips)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's console output")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.startup_probe:
+        prepare_environment(args.embedder)
+        startup_probe()
+        return
+    args.sizes = [name.strip() for name in args.sizes.split(",") if name.strip()]
+    unknown = [name for name in args.sizes if name not in SIZES]
+    if unknown:
+        parser.error(f"Unknown size(s) {', '.join(unknown)}; expected {', '.join(SIZES)}")
+    results = run(args)
+    print(summary(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), results))
+
+
+if __name__ == "__main__":
+    main()
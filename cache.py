@@ -0,0 +1,226 @@
+"""Small in-process caches for the chat hot path."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Returns (found, value)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class SemanticCache:
+    """Answers by query embedding: a query whose vector is within `threshold` cosine
+    similarity of a cached one, in the same scope, gets that answer back.
+
+    Vectors sit in one preallocated matrix (a slot per entry), so a lookup is a
+    single matrix-vector product over the scope's slots. Entries remember the
+    documents they were built from and are dropped when any of them changes
+    (`invalidate_documents`) or their group gains documents (`invalidate_group`);
+    past `maxsize` the least recently used entry is evicted, and entries expire
+    after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.95, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None    # maxsize x dim, allocated on the first put
+        self._entries: List[Optional[Dict]] = []    # Slot -> entry, None once freed
+        self._free: List[int] = []
+        self._used = np.zeros(max(maxsize, 0), dtype=np.int64)    # Slot -> tick of its last use
+        self._tick = 0
+        self._by_scope: Dict[Hashable, Set[int]] = {}
+        self._by_doc: Dict[str, Set[int]] = {}
+        self._by_group: Dict[Hashable, Set[int]] = {}
+        self._version = 0    # Bumped by every invalidation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @property
+    def version(self) -> int:
+        """Read before computing an answer and pass to `put`, so an answer computed
+        while its documents changed is not cached"""
+        return self._version
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, slot: int):
+        entry = self._entries[slot]
+        self._entries[slot] = None
+        self._free.append(slot)
+        for index, key in ((self._by_scope, entry["scope"]), (self._by_group, entry["group"]),
+                           *((self._by_doc, doc_id) for doc_id in entry["doc_ids"])):
+            slots = index.get(key)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del index[key]
+
+    def _nearest(self, vector: np.ndarray, scope: Hashable) -> Tuple[Optional[int], float]:
+        """Closest live entry in `scope` and its similarity (expired entries are dropped on the way)"""
+        now = time.monotonic()
+        for slot in [slot for slot in self._by_scope.get(scope, ()) if self._entries[slot]["expires"] <= now]:
+            self._remove(slot)
+        slots = list(self._by_scope.get(scope, ()))
+        if not slots or self._vectors is None or self._vectors.shape[1] != len(vector):
+            return None, 0.0
+        similarities = self._vectors[slots] @ vector
+        best = int(np.argmax(similarities))
+        return slots[best], float(similarities[best])
+
+    def get(self, vector, scope: Hashable) -> Tuple[bool, Any, float]:
+        """Returns (found, value, similarity)"""
+        vector = self._unit(vector)
+        with self._lock:
+            slot, similarity = self._nearest(vector, scope)
+            if slot is not None and similarity >= self.threshold:
+                self._tick += 1
+                self._used[slot] = self._tick
+                self.hits += 1
+                return True, self._entries[slot]["value"], similarity
+            self.misses += 1
+            return False, None, similarity
+
+    def put(self, vector, scope: Hashable, value: Any, doc_ids: Iterable[str], group: Hashable = None,
+            version: Optional[int] = None):
+        if self.maxsize <= 0:
+            return
+        vector = self._unit(vector)
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if self._vectors is None or self._vectors.shape[1] != len(vector):    # First put (or a new model)
+                self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+                self._entries, self._free = [], []
+                self._by_scope, self._by_doc, self._by_group = {}, {}, {}
+            slot, similarity = self._nearest(vector, scope)
+            if slot is not None and similarity >= self.threshold:    # Replaces its near-duplicate
+                self._remove(slot)
+            if self._free:
+                slot = self._free.pop()
+            elif len(self._entries) < self.maxsize:
+                slot = len(self._entries)
+                self._entries.append(None)
+            else:
+                slot = int(np.argmin(self._used))
+                self._remove(slot)
+                self._free.remove(slot)
+            doc_ids = set(doc_ids)
+            self._vectors[slot] = vector
+            self._entries[slot] = {"scope": scope, "group": group, "doc_ids": doc_ids, "value": value,
+                                   "expires": time.monotonic() + self.ttl}
+            self._tick += 1
+            self._used[slot] = self._tick
+            self._by_scope.setdefault(scope, set()).add(slot)
+            self._by_group.setdefault(group, set()).add(slot)
+            for doc_id in doc_ids:
+                self._by_doc.setdefault(doc_id, set()).add(slot)
+
+    def _invalidate(self, slots: Set[int]) -> int:
+        self._version += 1
+        for slot in slots:
+            self._remove(slot)
+        self.invalidated += len(slots)
+        return len(slots)
+
+    def invalidate_documents(self, doc_ids: Iterable[str]) -> int:
+        """Drop every answer built from any of these documents; returns how many"""
+        with self._lock:
+            return self._invalidate(set().union(*(self._by_doc.get(doc_id, ()) for doc_id in doc_ids)))
+
+    def invalidate_group(self, group: Hashable) -> int:
+        with self._lock:
+            return self._invalidate(set(self._by_group.get(group, ())))
+
+    def clear(self):
+        with self._lock:
+            self._invalidate(set(slot for slot, entry in enumerate(self._entries) if entry is not None))
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries) - len(self._free),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidated": self.invalidated
+        }
+
+
+class VersionCounter:
+    """Monotonic counter bumped on every write to the collection.
+    Cache keys include the current value, so a bump invalidates older entries."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: case and whitespace differences are ignored"""
+    return " ".join(query.lower().split())
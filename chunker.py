@@ -0,0 +1,252 @@
+"""Chunkers: split a stream of extracted text into the chunks that get embedded.
+
+A chunker consumes the text parts produced by extraction (PDF page sections,
+or blocks of a text file) and yields Chunk records as soon as enough text has
+arrived, so it runs inside the streaming ingestion pipeline. Every chunk
+records its character span in the full document text and the PDF pages it
+covers.
+
+- "structured" (default) packs whole sentences up to a token budget, prefers
+  to end chunks at paragraph and page boundaries, repeats the last sentences
+  of a chunk at the start of the next (overlap), and never includes the
+  `--- Page N ---` markers in chunk text. Once a chunk is half full it may
+  also end after an "anchor" sentence, chosen by a hash of its text, so an
+  edit only moves the boundaries up to the next anchor and later chunks keep
+  their exact text (and their stored vectors).
+- "fixed" is the original fixed-width character slicing.
+"""
+import os
+import re
+import zlib
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+CHUNKER = os.environ.get("CHUNKER", "structured")
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "180"))    # Upper bound per chunk
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "30"))
+FIXED_CHUNK_SIZE = 1000    # Characters per chunk for the "fixed" chunker
+MAX_PENDING_CHARS = 64 * 1024    # Text with no sentence boundary is split at whitespace (or hard-cut) past this
+MAX_TOKEN_CHARS = 16    # An unbroken run of text counts at least one token per this many characters
+ANCHOR_EVERY = 4    # On average one sentence in this many may end a chunk early (see StructuredChunker)
+
+PAGE_MARKER_RE = re.compile(r"--- Page (\d+) ---\n")
+# A sentence: up to terminal punctuation or a paragraph break, plus the whitespace after it.
+# Single line breaks do not end sentences (PDF text is hard-wrapped)
+UNIT_RE = re.compile(r"\S.*?(?:[.!?]+[\"')\]]*(?=\s)|(?=\n[^\S\n]*\n)|\Z)\s*", re.S)
+# Places where streamed text can safely be cut: the whitespace after a sentence or paragraph
+BOUNDARY_RE = re.compile(r"(?:[.!?]+[\"')\]]*\s+|\n[^\S\n]*\n\s*)(?=\S)")
+WORD_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate model tokens: words and punctuation marks"""
+    return len(WORD_TOKEN_RE.findall(text))
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int    # Character span in the full document text
+    end: int
+    page_start: Optional[int] = None    # PDF pages covered, None for plain text
+    page_end: Optional[int] = None
+    tokens: int = 0
+
+
+class _Unit(NamedTuple):
+    text: str    # Sentence with its trailing whitespace
+    start: int
+    end: int
+    page: Optional[int]
+    tokens: int
+    paragraph_end: bool
+    page_end: bool
+
+
+class StructuredChunker:
+    def __init__(self, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 length_function: Callable[[str], int] = count_tokens):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.length_function = length_function
+
+    # ------------------------------------------------------------ sentences
+
+    def _tokens(self, text: str) -> int:
+        """Token count, with unbroken runs (base64, minified text) counted by their length"""
+        return max(self.length_function(text), len(text) // MAX_TOKEN_CHARS)
+
+    def _split_long(self, text: str, start: int, page: Optional[int]) -> Iterator[_Unit]:
+        """A sentence longer than a whole chunk, cut at word boundaries (and inside words too long to fit)"""
+        pieces = []
+        for word in re.finditer(r"\S+\s*", text):
+            if self._tokens(word.group()) > self.max_tokens:
+                pieces.extend(range(word.start(), word.end(), self.max_tokens))    # At least a character per token
+            else:
+                pieces.append(word.start())
+        piece_start = 0
+        tokens = 0
+        for position, end in zip(pieces, pieces[1:] + [len(text)]):
+            piece_tokens = self._tokens(text[position:end])
+            if tokens and tokens + piece_tokens > self.max_tokens:
+                yield _Unit(text[piece_start:position], start + piece_start, start + position, page, tokens, False, False)
+                piece_start, tokens = position, 0
+            tokens += piece_tokens
+        if piece_start < len(text):
+            yield _Unit(text[piece_start:], start + piece_start, start + len(text), page, tokens, False, False)
+
+    def _units(self, text: str, offset: int, page: Optional[int]):
+        """Sentences of a complete piece of text; returns them, the page in effect at
+        its end, and whether the piece opens with a page marker"""
+        units = []
+        position = 0
+        starts_with_page = bool(PAGE_MARKER_RE.match(text.lstrip()))
+        for marker in list(PAGE_MARKER_RE.finditer(text)) + [None]:
+            span_end = marker.start() if marker else len(text)
+            span = text[position:span_end]
+            matches = list(UNIT_RE.finditer(span))
+            for i, match in enumerate(matches):
+                sentence = match.group()
+                start = offset + position + match.start()
+                tokens = self._tokens(sentence)
+                paragraph_end = "\n\n" in sentence[len(sentence.rstrip()):] or (i == len(matches) - 1 and marker is not None)
+                if tokens > self.max_tokens:
+                    units.extend(self._split_long(sentence, start, page))
+                else:
+                    units.append(_Unit(sentence, start, start + len(sentence), page, tokens, paragraph_end, False))
+            if marker is None:
+                break
+            if units:
+                units[-1] = units[-1]._replace(paragraph_end=True, page_end=True)
+            page = int(marker.group(1))
+            position = marker.end()
+        return units, page, starts_with_page
+
+    def _iter_units(self, parts: Iterable[str]) -> Iterator[_Unit]:
+        """Sentences over streamed parts: text is only split once a boundary after it has arrived"""
+        pending = ""
+        offset = 0
+        page = None
+        held = None    # Last sentence so far: a page marker may still follow it
+
+        def release(units, starts_with_page):
+            nonlocal held
+            if held is not None:
+                yield held._replace(paragraph_end=True, page_end=True) if starts_with_page else held
+            if units:
+                yield from units[:-1]
+                held = units[-1]
+            else:
+                held = None
+
+        for part in parts:
+            pending += part
+            cut = 0
+            for boundary in BOUNDARY_RE.finditer(pending):
+                cut = boundary.end()
+            if not cut and len(pending) > MAX_PENDING_CHARS:
+                # Split at the last space, never inside (or before) a page marker
+                floor = max((marker.end() for marker in PAGE_MARKER_RE.finditer(pending)), default=0)
+                space = pending.rfind(" ", floor, len(pending) - 1)
+                cut = space + 1 if space >= 0 else len(pending)    # No space at all (base64, minified text): hard cut
+            if cut:
+                units, page, starts_with_page = self._units(pending[:cut], offset, page)
+                yield from release(units, starts_with_page)
+                offset += cut
+                pending = pending[cut:]
+        if pending:
+            units, page, starts_with_page = self._units(pending, offset, page)
+            yield from release(units, starts_with_page)
+        if held is not None:
+            yield held
+
+    # ------------------------------------------------------------ chunks
+
+    def _make_chunk(self, units: List[_Unit]) -> Chunk:
+        text = "".join(unit.text for unit in units).strip()
+        pages = [unit.page for unit in units if unit.page is not None]
+        return Chunk(text, units[0].start, units[-1].start + len(units[-1].text.rstrip()),
+                     min(pages) if pages else None, max(pages) if pages else None,
+                     sum(unit.tokens for unit in units))
+
+    @staticmethod
+    def _is_anchor(unit: _Unit) -> bool:
+        """Content-defined boundary: depends only on the sentence itself"""
+        return zlib.crc32(unit.text.strip().encode("utf-8")) % ANCHOR_EVERY == 0
+
+    def _overlap(self, units: List[_Unit]) -> List[_Unit]:
+        """Trailing sentences repeated at the start of the next chunk"""
+        carried, tokens = [], 0
+        for unit in reversed(units):
+            if unit.page_end or tokens + unit.tokens > self.overlap_tokens:
+                break    # Overlap never reaches back across a page boundary
+            carried.insert(0, unit)
+            tokens += unit.tokens
+        return carried if len(carried) < len(units) else []
+
+    def iter_chunks(self, parts: Iterable[str]) -> Iterator[Chunk]:
+        current: List[_Unit] = []
+        tokens = 0
+        fresh = 0    # Sentences in `current` not already emitted as overlap
+        for unit in self._iter_units(parts):
+            if current and tokens + unit.tokens > self.max_tokens:
+                if fresh:
+                    yield self._make_chunk(current)
+                current = self._overlap(current) if fresh else []
+                tokens = sum(u.tokens for u in current)
+                if tokens + unit.tokens > self.max_tokens:    # No room for overlap before this sentence
+                    current, tokens = [], 0
+                fresh = 0
+            current.append(unit)
+            tokens += unit.tokens
+            fresh += 1
+            # Close early at a page break or anchor sentence once half full, or at a paragraph break once mostly full
+            if (tokens >= self.max_tokens // 2 and (unit.page_end or self._is_anchor(unit))) or \
+                    (unit.paragraph_end and tokens >= self.max_tokens * 0.8):
+                yield self._make_chunk(current)
+                current = self._overlap(current)
+                tokens = sum(u.tokens for u in current)
+                fresh = 0
+        if current and fresh:
+            yield self._make_chunk(current)
+
+
+class FixedChunker:
+    """Fixed-width character slices (the original behaviour), with positions and pages"""
+
+    def __init__(self, chunk_size: int = FIXED_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def iter_chunks(self, parts: Iterable[str]) -> Iterator[Chunk]:
+        buffer = ""
+        offset = 0
+        page = None
+
+        def make(text: str, start: int) -> Chunk:
+            nonlocal page
+            first = page    # Page in effect where the slice starts
+            for marker in PAGE_MARKER_RE.finditer(text):
+                if marker.start() == 0 or first is None:
+                    first = int(marker.group(1))
+                page = int(marker.group(1))
+            return Chunk(text, start, start + len(text), first, page, count_tokens(text))
+
+        for part in parts:
+            buffer += part    # Bounded: the buffer never holds more than one part plus chunk_size
+            if len(buffer) >= self.chunk_size:
+                full = len(buffer) - len(buffer) % self.chunk_size
+                for i in range(0, full, self.chunk_size):
+                    yield make(buffer[i:i + self.chunk_size], offset + i)
+                offset += full
+                buffer = buffer[full:]
+        if buffer:
+            yield make(buffer, offset)
+
+
+CHUNKERS = {"structured": StructuredChunker, "fixed": FixedChunker}
+
+
+def get_chunker(name: Optional[str] = None):
+    """Chunker by name (defaults to the CHUNKER setting)"""
+    name = name or CHUNKER
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{name}', expected one of {', '.join(CHUNKERS)}")
+    return CHUNKERS[name]()
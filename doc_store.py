@@ -0,0 +1,436 @@
+"""SQLite-backed store for the documents shown in the UI.
+
+Document metadata lives in `documents` (id primary key, indexed by session)
+and the extracted text in `document_segments`, split into fixed-size
+segments so a window of a large document (a character range, or a PDF page
+found through `document_pages`) is read without loading the whole body.
+Listings and lookups never read document bodies and every write touches only
+the rows it changes. Uploads stage their text segment by segment while it is
+extracted (see ContentWriter), so no body is ever held in memory whole.
+The listing preview is computed when content is written and stored with the
+metadata, and listings are paged by keyset cursors rather than offsets.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from chunker import PAGE_MARKER_RE
+
+PREVIEW_LENGTH = 100
+SEGMENT_CHARS = 64 * 1024    # Characters per stored segment of document text
+LIST_FIELDS = ("id", "filename", "uploaded_at", "updated_at", "size", "file_type", "session_id", "preview")
+SORT_FIELDS = ("uploaded_at", "filename", "size")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    uploaded_at TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    file_type TEXT NOT NULL DEFAULT 'text',
+    session_id TEXT,
+    file_hash TEXT,
+    preview TEXT NOT NULL DEFAULT '',
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_session ON documents(session_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents(file_hash);
+-- Listing sorts, and the (count, last change) signature behind the listing ETag
+CREATE INDEX IF NOT EXISTS idx_documents_session_filename ON documents(session_id, filename);
+CREATE INDEX IF NOT EXISTS idx_documents_session_size ON documents(session_id, size);
+CREATE INDEX IF NOT EXISTS idx_documents_session_updated ON documents(session_id, updated_at);
+CREATE TABLE IF NOT EXISTS document_segments (
+    doc_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,    -- Segment `seq` holds characters [seq * SEGMENT_CHARS, (seq + 1) * SEGMENT_CHARS)
+    content TEXT NOT NULL,
+    PRIMARY KEY (doc_id, seq)
+);
+CREATE TABLE IF NOT EXISTS document_pages (
+    doc_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    start INTEGER NOT NULL,    -- Character offset of the page's `--- Page N ---` marker
+    PRIMARY KEY (doc_id, page)
+) WITHOUT ROWID;
+-- Text of documents still being ingested, written as it is extracted and moved
+-- into document_segments / document_pages when the document is registered
+CREATE TABLE IF NOT EXISTS staged_segments (
+    doc_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (doc_id, seq)
+);
+CREATE TABLE IF NOT EXISTS staged_pages (
+    doc_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, page)
+) WITHOUT ROWID;
+"""
+
+
+def make_preview(content: str) -> str:
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+
+def encode_cursor(value, rowid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, rowid]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    try:
+        value, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, int(rowid)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ContentWriter:
+    """Stages a document's text segment by segment as it is extracted, so an upload's
+    full body is never held in memory. `DocumentStore.add_many` moves the staged text
+    in when the document is registered without a `content`; `discard` drops it."""
+
+    def __init__(self, store: "DocumentStore", doc_id: str):
+        self.store = store
+        self.doc_id = doc_id
+        self.size = 0
+        self.has_text = False    # Anything besides whitespace and page markers written
+        self._head = ""    # Enough of the start for the preview
+        self._pending: List[str] = []    # Text not yet written as a full segment
+        self._pending_chars = 0
+        self._seq = 0
+        self._pages: List[Tuple[int, int]] = []
+
+    @property
+    def preview(self) -> str:
+        return make_preview(self._head)
+
+    def write(self, part: str):
+        # Extraction emits each `--- Page N ---` marker whole, at the start of its page's part
+        self._pages.extend((int(marker.group(1)), self.size + marker.start()) for marker in PAGE_MARKER_RE.finditer(part))
+        if len(self._head) <= PREVIEW_LENGTH:
+            self._head += part[:PREVIEW_LENGTH + 1 - len(self._head)]
+        self.has_text = self.has_text or bool(PAGE_MARKER_RE.sub("", part).strip())
+        self.size += len(part)
+        self._pending.append(part)
+        self._pending_chars += len(part)
+        if self._pending_chars >= SEGMENT_CHARS:
+            self._flush()
+
+    def _flush(self, final: bool = False):
+        text = "".join(self._pending)
+        end = len(text) if final else len(text) - len(text) % SEGMENT_CHARS
+        rows = [(self.doc_id, self._seq + i, text[start:start + SEGMENT_CHARS])
+                for i, start in enumerate(range(0, end, SEGMENT_CHARS))]
+        if final and not rows and not self._seq:
+            rows = [(self.doc_id, 0, "")]    # Every document has at least one segment
+        with self.store._connect() as conn:
+            conn.executemany("INSERT INTO staged_segments (doc_id, seq, content) VALUES (?, ?, ?)", rows)
+            conn.executemany("INSERT OR IGNORE INTO staged_pages (doc_id, page, start) VALUES (?, ?, ?)",
+                             ((self.doc_id, page, start) for page, start in self._pages))
+        self._seq += len(rows)
+        self._pages = []
+        self._pending = [text[end:]] if end < len(text) else []
+        self._pending_chars = len(text) - end
+
+    def close(self):
+        """Write the last partial segment"""
+        self._flush(final=True)
+
+    def discard(self):
+        self._pending, self._pages = [], []
+        with self.store._connect() as conn:
+            conn.execute("DELETE FROM staged_segments WHERE doc_id = ?", (self.doc_id,))
+            conn.execute("DELETE FROM staged_pages WHERE doc_id = ?", (self.doc_id,))
+
+
+class DocumentStore:
+    TABLES = ("documents", "document_segments", "document_pages")    # What a snapshot import swaps in (not staged text)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()    # One connection per thread
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------ writes
+
+    @staticmethod
+    def _write_content(conn: sqlite3.Connection, doc_id: str, content: str):
+        """Replace a document's text segments and page offsets"""
+        conn.execute("DELETE FROM document_segments WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM document_pages WHERE doc_id = ?", (doc_id,))
+        conn.executemany(
+            "INSERT INTO document_segments (doc_id, seq, content) VALUES (?, ?, ?)",
+            ((doc_id, start // SEGMENT_CHARS, content[start:start + SEGMENT_CHARS])
+             for start in range(0, max(len(content), 1), SEGMENT_CHARS))
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO document_pages (doc_id, page, start) VALUES (?, ?, ?)",
+            ((doc_id, int(marker.group(1)), marker.start()) for marker in PAGE_MARKER_RE.finditer(content))
+        )
+
+    @staticmethod
+    def _adopt_staged(conn: sqlite3.Connection, doc_id: str):
+        """Move text staged by a ContentWriter into a document's segments and page offsets"""
+        conn.execute("INSERT INTO document_segments (doc_id, seq, content)"
+                     " SELECT doc_id, seq, content FROM staged_segments WHERE doc_id = ?", (doc_id,))
+        conn.execute("INSERT OR IGNORE INTO document_pages (doc_id, page, start)"
+                     " SELECT doc_id, page, start FROM staged_pages WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM staged_segments WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM staged_pages WHERE doc_id = ?", (doc_id,))
+
+    def content_writer(self, doc_id: str) -> ContentWriter:
+        return ContentWriter(self, doc_id)
+
+    def add_many(self, docs: Iterable[Dict]):
+        """Insert documents in one transaction, each with its `content`, or with `size` and
+        `preview` and its text staged by a ContentWriter. `updated_at` defaults to `uploaded_at`"""
+        docs = list(docs)
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO documents (id, filename, uploaded_at, size, file_type, session_id, file_hash, preview, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(d["id"], d["filename"], d["uploaded_at"], d["size"], d.get("file_type", "text"), d.get("session_id"),
+                  d.get("file_hash"), make_preview(d["content"]) if "content" in d else d["preview"],
+                  d.get("updated_at") or d["uploaded_at"]) for d in docs]
+            )
+            for d in docs:
+                if "content" in d:
+                    self._write_content(conn, d["id"], d["content"])
+                else:
+                    self._adopt_staged(conn, d["id"])
+
+    def _update_content(self, conn: sqlite3.Connection, doc_id: str, content: str,
+                        updated_at: Optional[str] = None) -> bool:
+        # An edited document no longer matches the file it came from
+        cur = conn.execute(
+            "UPDATE documents SET size = ?, file_hash = NULL, preview = ?, updated_at = ? WHERE id = ?",
+            (len(content), make_preview(content), updated_at or datetime.now().isoformat(), doc_id)
+        )
+        if not cur.rowcount:
+            return False
+        self._write_content(conn, doc_id, content)
+        return True
+
+    def update_content(self, doc_id: str, content: str) -> bool:
+        with self._connect() as conn:
+            return self._update_content(conn, doc_id, content)
+
+    def delete(self, doc_id: str) -> bool:
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return cur.rowcount > 0
+
+    def apply_bulk(self, delete_ids: List[str], updates: List[Tuple[str, str]],
+                   updated_at: Optional[str] = None) -> Tuple[int, int]:
+        """Delete `delete_ids` and apply (doc_id, content) `updates` in one transaction;
+        returns (deleted, updated)"""
+        deleted = updated = 0
+        with self._connect() as conn:
+            for start in range(0, len(delete_ids), 500):    # Stay under SQLite's bound-parameter limit
+                part = delete_ids[start:start + 500]
+                deleted += conn.execute(f"DELETE FROM documents WHERE id IN ({','.join('?' * len(part))})", part).rowcount
+            for doc_id, content in updates:
+                updated += self._update_content(conn, doc_id, content, updated_at)
+        return deleted, updated
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents")
+
+    def staged_documents(self) -> Set[str]:
+        """Ids of the documents with staged text not yet adopted"""
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute(
+                "SELECT doc_id FROM staged_segments UNION SELECT doc_id FROM staged_pages")}
+
+    def clear_staged(self, doc_ids: Iterable[str]) -> int:
+        """Drop the staged text of ingests that never finished (never pass a live ingest's id)"""
+        doc_ids = list(doc_ids)
+        removed = 0
+        with self._connect() as conn:
+            for start in range(0, len(doc_ids), 500):    # Stay under SQLite's bound-parameter limit
+                part = doc_ids[start:start + 500]
+                marks = ",".join("?" * len(part))
+                removed += conn.execute(f"DELETE FROM staged_segments WHERE doc_id IN ({marks})", part).rowcount
+                conn.execute(f"DELETE FROM staged_pages WHERE doc_id IN ({marks})", part)
+        return removed
+
+    def vacuum(self):
+        """Return the pages freed by deletes to the filesystem"""
+        conn = self._connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+
+    # ------------------------------------------------------------ reads
+
+    def get(self, doc_id: str, with_content: bool = False) -> Optional[Dict]:
+        """Document metadata by id, plus `content` when asked for"""
+        row = self._connect().execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        doc = dict(row)
+        if with_content:
+            doc["content"] = self.get_content(doc_id)
+        return doc
+
+    def get_many(self, doc_ids: List[str]) -> Dict[str, Dict]:
+        """Metadata of the documents among `doc_ids` that exist, by id"""
+        docs = {}
+        conn = self._connect()
+        for start in range(0, len(doc_ids), 500):
+            part = doc_ids[start:start + 500]
+            for row in conn.execute(f"SELECT * FROM documents WHERE id IN ({','.join('?' * len(part))})", part):
+                docs[row["id"]] = dict(row)
+        return docs
+
+    def find_by_file_hash(self, file_hash: str, session_id: Optional[str] = None) -> Optional[str]:
+        """Id of an unedited document extracted from a file with this SHA-256 (in `session_id` when given)"""
+        where, params = ("file_hash = ? AND session_id = ?", (file_hash, session_id)) if session_id is not None \
+            else ("file_hash = ?", (file_hash,))
+        row = self._connect().execute(f"SELECT id FROM documents WHERE {where} LIMIT 1", params).fetchone()
+        return row["id"] if row else None
+
+    def get_content(self, doc_id: str) -> Optional[str]:
+        segments = list(self.iter_content(doc_id))
+        return "".join(segments) if segments else None
+
+    def iter_content(self, doc_id: str) -> Iterator[str]:
+        """A document's text one segment at a time (nothing for an unknown id)"""
+        seq = -1
+        while True:
+            row = self._connect().execute(
+                "SELECT seq, content FROM document_segments WHERE doc_id = ? AND seq > ? ORDER BY seq LIMIT 1",
+                (doc_id, seq)
+            ).fetchone()
+            if row is None:
+                return
+            seq = row["seq"]
+            yield row["content"]
+
+    def read_range(self, doc_id: str, offset: int, length: int) -> str:
+        """Characters [offset, offset + length) of a document, reading only the segments they fall in"""
+        if length <= 0:
+            return ""
+        first, last = offset // SEGMENT_CHARS, (offset + length - 1) // SEGMENT_CHARS
+        rows = self._connect().execute(
+            "SELECT content FROM document_segments WHERE doc_id = ? AND seq BETWEEN ? AND ? ORDER BY seq",
+            (doc_id, first, last)
+        ).fetchall()
+        window = "".join(row["content"] for row in rows)
+        start = offset - first * SEGMENT_CHARS
+        return window[start:start + length]
+
+    def page_span(self, doc_id: str, page: int) -> Optional[Tuple[int, Optional[int]]]:
+        """(start, end) character offsets of a PDF page; end is None for the last page"""
+        rows = self._connect().execute(
+            "SELECT page, start FROM document_pages WHERE doc_id = ? AND page >= ? ORDER BY page LIMIT 2", (doc_id, page)
+        ).fetchall()
+        if not rows or rows[0]["page"] != page:
+            return None
+        return rows[0]["start"], rows[1]["start"] if len(rows) > 1 else None
+
+    def page_count(self, doc_id: str) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM document_pages WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+    def list_documents(self, session_id: Optional[str] = None) -> List[Dict]:
+        """Metadata (with preview) of all documents, or one session's, oldest first"""
+        where, params = ("WHERE session_id = ?", (session_id,)) if session_id is not None else ("", ())
+        rows = self._connect().execute(
+            f"SELECT * FROM documents {where} ORDER BY uploaded_at, rowid", params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_page(self, session_id: str, limit: int = 50, cursor: Optional[str] = None,
+                  sort: str = "uploaded_at", descending: bool = False, fields: Optional[Iterable[str]] = None,
+                  filename: Optional[str] = None, file_type: Optional[str] = None,
+                  uploaded_after: Optional[str] = None, uploaded_before: Optional[str] = None) -> Dict:
+        """One page of a session's documents: {"documents", "next_cursor", "total"}.
+        `cursor` is the `next_cursor` of the previous page; `total` (matching documents)
+        is only counted for the first page. `fields` picks the columns returned."""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field '{sort}', expected one of {', '.join(SORT_FIELDS)}")
+        fields = list(dict.fromkeys(["id", *(fields or LIST_FIELDS)]))
+        unknown = [field for field in fields if field not in LIST_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field(s) {', '.join(unknown)}, expected some of {', '.join(LIST_FIELDS)}")
+        conditions, params = ["session_id = ?"], [session_id]
+        if filename:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            params.append("%" + filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if file_type:
+            conditions.append("file_type = ?")
+            params.append(file_type)
+        if uploaded_after:
+            conditions.append("uploaded_at >= ?")
+            params.append(uploaded_after)
+        if uploaded_before:
+            conditions.append("uploaded_at < ?")
+            params.append(uploaded_before)
+        conn = self._connect()
+        total = None
+        if cursor is None:
+            total = conn.execute(f"SELECT COUNT(*) FROM documents WHERE {' AND '.join(conditions)}", params).fetchone()[0]
+        else:
+            value, rowid = decode_cursor(cursor)
+            op = "<" if descending else ">"    # Keyset: strictly after the last row of the previous page
+            conditions.append(f"({sort} {op} ? OR ({sort} = ? AND rowid {op} ?))")
+            params.extend([value, value, rowid])
+        direction = "DESC" if descending else "ASC"
+        rows = conn.execute(
+            f"SELECT {', '.join(fields)}, {sort} AS _sort, rowid AS _rowid FROM documents"
+            f" WHERE {' AND '.join(conditions)} ORDER BY {sort} {direction}, rowid {direction} LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1]["_sort"], rows[limit - 1]["_rowid"]) if len(rows) > limit else None
+        return {
+            "documents": [{field: row[field] for field in fields} for row in rows[:limit]],
+            "next_cursor": next_cursor,
+            "total": total
+        }
+
+    def signature(self, session_id: str) -> Tuple[int, Optional[str]]:
+        """(documents, last upload or edit) of a session: changes whenever its listing does"""
+        count, updated = self._connect().execute(
+            "SELECT COUNT(*), MAX(updated_at) FROM documents WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return count, updated
+
+    def count(self, session_id: Optional[str] = None) -> int:
+        if session_id is None:
+            return self._connect().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM documents WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+
+    # ------------------------------------------------------------ migration
+
+    def import_json(self, json_path: str) -> int:
+        """One-time import of the old ui_documents.json list; the file is renamed afterwards"""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r") as f:
+            legacy = json.load(f)
+        known = {row[0] for row in self._connect().execute("SELECT id FROM documents")}
+        docs = [
+            {**doc, "size": doc.get("size", len(doc["content"]))}
+            for doc in legacy if doc.get("id") and doc["id"] not in known
+        ]
+        self.add_many(docs)
+        os.replace(json_path, json_path + ".migrated")
+        return len(docs)
@@ -0,0 +1,184 @@
+"""Embedding backends: the model that turns chunk and query text into vectors.
+
+- "sentence-transformers" (default): the PyTorch model, through ChromaDB's
+  SentenceTransformerEmbeddingFunction, encoding EMBEDDING_BATCH_SIZE texts
+  per forward pass.
+- "onnx": the same model exported to ONNX and run on ONNX Runtime (already a
+  ChromaDB dependency). Batches are sorted by length and padded only to their
+  longest text, the intra-op thread count is fixed, and the weights can be
+  quantised to int8 (EMBEDDING_QUANTIZE=int8) for a further CPU saving.
+
+fp32 ONNX vectors are numerically equivalent to PyTorch's within float
+tolerance, so switching runtime keeps an existing collection usable. int8 vectors are close but not identical, so a
+quantised model has its own `model_id`, and Resources refuses to open a
+collection written under a different model id or vector width.
+"""
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils.embedding_functions.sentence_transformer_embedding_function import (
+    SentenceTransformerEmbeddingFunction,
+)
+
+from telemetry import get_logger
+
+logger = get_logger("embedders")
+
+BACKENDS = ("sentence-transformers", "onnx")
+QUANTIZATIONS = ("int8",)
+
+# Collection metadata recording which model wrote its vectors
+MODEL_KEY = "embedding_model"
+DIMENSIONS_KEY = "embedding_dimensions"
+
+
+class EmbeddingMismatchError(RuntimeError):
+    """A collection holds vectors from a different model than the one configured"""
+
+
+class BatchedSentenceTransformerEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """ChromaDB's sentence-transformers function with a configurable encode batch size
+    (ChromaDB's own always uses the library default)"""
+
+    def __init__(self, model_name: str, batch_size: int = 32):
+        super().__init__(model_name=model_name)
+        self.batch_size = batch_size
+
+    def __call__(self, input) -> List[np.ndarray]:
+        embeddings = self._model.encode(list(input), batch_size=self.batch_size, convert_to_numpy=True,
+                                        normalize_embeddings=self.normalize_embeddings)
+        return [np.array(embedding, dtype=np.float32) for embedding in embeddings]
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction):
+    """A sentence-transformers model exported to ONNX (`model.onnx` and `tokenizer.json`
+    in `model_dir`), mean-pooled and normalised like the PyTorch original"""
+
+    def __init__(self, model_dir: str, quantize: Optional[str] = None, batch_size: int = 32,
+                 threads: int = 0, max_length: int = 256):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        self.model_dir = model_dir
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.threads = threads
+        path = os.path.join(model_dir, "model.onnx")
+        if quantize == "int8":
+            path = quantized_model(path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.log_severity_level = 3
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._inputs = {model_input.name for model_input in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self._tokenizer.token_to_id("[PAD]")
+        self._tokenizer.enable_padding(pad_id=pad_id or 0, pad_token="[PAD]")    # To the longest text of each batch
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+        output = self._session.run(None, feed)[0]
+        if output.ndim == 3:    # Token embeddings: mean over the real (unpadded) tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return output / np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+
+    def __call__(self, input) -> List[np.ndarray]:
+        texts = list(input)
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))    # Similar lengths pad less
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._forward([texts[i] for i in batch])):
+                vectors[i] = vector.astype(np.float32)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "rag_onnx"
+
+    def get_config(self) -> Dict:
+        return {"model_dir": self.model_dir, "quantize": self.quantize, "batch_size": self.batch_size,
+                "threads": self.threads}
+
+    @staticmethod
+    def build_from_config(config: Dict) -> "OnnxEmbeddingFunction":
+        return OnnxEmbeddingFunction(**config)
+
+
+def quantized_model(path: str) -> str:
+    """Path of an int8 copy of an ONNX model (weights quantised dynamically), written next to it on first use"""
+    target = path[:-len(".onnx")] + "_int8.onnx"
+    if not os.path.exists(target):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:    # onnxruntime's quantisation tools need the onnx package
+            raise RuntimeError(f"int8 quantisation needs the onnx package (pip install onnx): {e}")
+        staging = target + ".tmp"
+        quantize_dynamic(path, staging, weight_type=QuantType.QInt8)
+        os.replace(staging, target)
+        logger.info("Quantised ONNX model to int8", extra={"model": target, "bytes": os.path.getsize(target)})
+    return target
+
+
+def default_onnx_dir(model: str) -> str:
+    """ChromaDB's ONNX export of all-MiniLM-L6-v2, downloaded on first use; other models need ONNX_MODEL_DIR"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+    if model != ONNXMiniLM_L6_V2.MODEL_NAME:
+        raise ValueError(f"No ONNX export known for {model}; set ONNX_MODEL_DIR to a directory "
+                         "holding its model.onnx and tokenizer.json")
+    ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+    return os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+
+
+class EmbedderSpec(NamedTuple):
+    model: str
+    backend: str = "sentence-transformers"
+    quantize: Optional[str] = None
+    batch_size: int = 32    # Texts per forward pass
+    threads: int = 0    # Intra-op threads (0 leaves the runtime's default)
+    model_dir: Optional[str] = None    # ONNX export to load instead of the default
+
+    @property
+    def model_id(self) -> str:
+        """What the vectors depend on: the model and its quantisation, not the runtime"""
+        return f"{self.model}:{self.quantize}" if self.quantize else self.model
+
+    def build(self) -> EmbeddingFunction:
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {self.backend!r}; expected one of {', '.join(BACKENDS)}")
+        if self.quantize and self.quantize not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantisation {self.quantize!r}; expected one of {', '.join(QUANTIZATIONS)}")
+        if self.backend == "onnx":
+            return OnnxEmbeddingFunction(self.model_dir or default_onnx_dir(self.model), self.quantize,
+                                         self.batch_size, self.threads)
+        if self.quantize:
+            raise ValueError("Quantisation needs the onnx embedding backend")
+        embedding_function = BatchedSentenceTransformerEmbeddingFunction(model_name=self.model,
+                                                                         batch_size=self.batch_size)
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        return embedding_function
+
+
+def check_signature(metadata: Optional[Dict], model_id: str, dimensions: int, collection: str):
+    """Raise EmbeddingMismatchError if a collection's recorded model or width differs from ours"""
+    metadata = metadata or {}
+    recorded_model, recorded_dimensions = metadata.get(MODEL_KEY), metadata.get(DIMENSIONS_KEY)
+    if recorded_model is not None and recorded_model != model_id:
+        raise EmbeddingMismatchError(f"Collection {collection} holds vectors from {recorded_model}, "
+                                     f"not the configured {model_id}; re-ingest into a fresh store to switch models")
+    if recorded_dimensions is not None and recorded_dimensions != dimensions:
+        raise EmbeddingMismatchError(f"Collection {collection} holds {recorded_dimensions}-dim vectors, "
+                                     f"but {model_id} produces {dimensions}-dim ones")
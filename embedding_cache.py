@@ -0,0 +1,138 @@
+"""Content-addressed embedding cache.
+
+Chunk vectors are stored in SQLite under (model, SHA-256 of the chunk text),
+so re-uploaded files and boilerplate shared between documents (headers, legal
+footers) reuse the vector computed the first time instead of going back
+through the model. Vectors no stored chunk uses any more are pruned by
+maintenance (see maintenance.py).
+"""
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, content_hash)
+) WITHOUT ROWID;
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file on disk, read block by block"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        hashes = list(set(hashes))
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(hashes), 500):    # Stay under SQLite's bound-parameter limit
+            part = hashes[start:start + 500]
+            rows = conn.execute(
+                f"SELECT content_hash, vector FROM chunk_embeddings WHERE model = ? AND content_hash IN ({','.join('?' * len(part))})",
+                [self.model, *part]
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        rows = [
+            (self.model, h, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+            for h, vector in items
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_embeddings (model, content_hash, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def count(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM chunk_embeddings WHERE model = ?", (self.model,)
+        ).fetchone()[0]
+
+    def unreferenced(self, keep: Set[str]) -> List[str]:
+        """Hashes of this model's vectors not in `keep`"""
+        rows = self._connect().execute("SELECT content_hash FROM chunk_embeddings WHERE model = ?", (self.model,))
+        return [h for (h,) in rows if h not in keep]
+
+    def prune(self, keep: Set[str]) -> int:
+        """Delete the vectors no stored chunk uses: this model's not in `keep`, and every
+        other model's (a store only ever holds one model's vectors); returns rows removed"""
+        stale = self.unreferenced(keep)
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM chunk_embeddings WHERE model != ?", (self.model,)).rowcount
+            for start in range(0, len(stale), 500):    # Stay under SQLite's bound-parameter limit
+                part = stale[start:start + 500]
+                removed += conn.execute(
+                    f"DELETE FROM chunk_embeddings WHERE model = ? AND content_hash IN ({','.join('?' * len(part))})",
+                    [self.model, *part]
+                ).rowcount
+        return removed
+
+    def vacuum(self):
+        """Return the pages freed by prune() to the filesystem"""
+        conn = self._connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+
+
+class CachedEmbedder:
+    """Wraps an embedding function so that only texts never seen before reach the model."""
+
+    def __init__(self, embedding_function, cache: Optional[EmbeddingCache] = None):
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+    def embed(self, texts: List[str]) -> Tuple[List[np.ndarray], int]:
+        """Vectors for `texts` in order, and how many of them came from the cache"""
+        if self.cache is None:
+            return list(self.embedding_function(texts)), 0
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.cache.get_many(hashes)
+        reused = sum(1 for h in hashes if h in vectors)
+        missing = {}
+        for h, text in zip(hashes, texts):    # Duplicates within the batch are embedded once
+            if h not in vectors:
+                missing.setdefault(h, text)
+        if missing:
+            computed = self.embedding_function(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), (np.asarray(v, dtype=np.float32) for v in computed)))
+            self.cache.put_many(new_vectors.items())
+            vectors.update(new_vectors)
+        return [vectors[h] for h in hashes], reused
+
+    def __call__(self, texts: List[str]) -> List[np.ndarray]:
+        return self.embed(texts)[0]
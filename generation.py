@@ -0,0 +1,96 @@
+"""Answer generators for /chat.
+
+A generator takes the query and the retrieved chunks and yields the answer as
+text segments, as they are produced, so /chat/stream can forward each segment
+the moment it exists and /chat can simply join them.
+"""
+import re
+import time
+from typing import Dict, Iterator, List, Optional
+
+QUERY_KEYWORDS = ["procedure", "step", "how"]
+PROCEDURE_KEYWORDS = ['step', 'procedure', 'method', 'how to', 'instructions']
+ANSWER_FOOTER = "\n*This information comes from your uploaded documents. For more details, you can view the full documents in the See Documents section.*"
+
+
+def iter_highlighted_answer(query: str, metadatas: List[Dict], highlights: List[List[str]]) -> Iterator[str]:
+    """The extractive answer quoting the sentences picked for each chunk by the retrieval pipeline"""
+    procedural = any(keyword in query.lower() for keyword in QUERY_KEYWORDS)
+    yield f"Here's what I found about '{query}':\n\n" if procedural else "Based on the uploaded documents:\n\n"
+    for metadata, sentences in zip(metadatas, highlights):
+        if not sentences:
+            continue
+        source = metadata.get('source', 'a document')
+        if procedural:
+            yield f"**From {source}:**\n" + "".join(f"- {sentence}\n" for sentence in sentences) + "\n"
+        else:
+            yield f"**Information from {source}:**\n" + " ".join(sentences) + "\n\n"
+    yield ANSWER_FOOTER
+
+
+def iter_extractive_answer(query: str, chunks: List[str], metadatas: List[Dict],
+                           highlights: Optional[List[List[str]]] = None) -> Iterator[str]:
+    """The extractive answer built from the top chunks, one section at a time"""
+    if highlights is not None:
+        yield from iter_highlighted_answer(query, metadatas, highlights)
+        return
+    query_lower = query.lower()
+    if any(keyword in query_lower for keyword in QUERY_KEYWORDS):    # For procedural questions
+        yield f"Here's what I found about '{query}':\n\n"
+        for i, (chunk, metadata) in enumerate(zip(chunks[:2], metadatas[:2]), 1):
+            source = metadata.get('source', 'a document')
+            yield f"**From {source}:**\n"
+            for line in chunk.split('\n'):    # Extract procedural content
+                if any(keyword in line.lower() for keyword in PROCEDURE_KEYWORDS):
+                    yield f"- {line.strip()}\n"
+            if i < len(chunks[:2]):
+                yield "\n"
+    else:
+        # For general questions
+        yield "Based on the uploaded documents:\n\n"
+        for chunk, metadata in zip(chunks[:2], metadatas[:2]):
+            source = metadata.get('source', 'a document')
+            yield f"**Information from {source}:**\n"
+            # Take the most relevant part of the chunk
+            relevant_sentences = []
+            for sentence in chunk.split('. '):
+                if len(sentence.split()) > 3:    # Avoid very short sentences
+                    if any(word in sentence.lower() for word in query_lower.split()):
+                        relevant_sentences.append(sentence.strip() + '.')
+                    elif len(relevant_sentences) < 2:    # Take first few sentences
+                        relevant_sentences.append(sentence.strip() + '.')
+            yield " ".join(relevant_sentences[:3]) + "\n\n"
+    yield ANSWER_FOOTER
+
+
+def build_prompt(query: str, chunks: List[str], metadatas: List[Dict]) -> str:
+    """LLM prompt grounding the answer in the retrieved chunks"""
+    context = "\n\n".join(
+        f"[{metadata.get('source', 'a document')}]\n{chunk}" for chunk, metadata in zip(chunks, metadatas)
+    )
+    return (
+        "Answer the question using only the context below. "
+        "If the context does not contain the answer, say so.\n\n"
+        f"Context:\n{context}\n\nQuestion: {query}\nAnswer:"
+    )
+
+
+def extractive_answer(query: str, chunks: List[str], metadatas: List[Dict],
+                      highlights: Optional[List[List[str]]] = None) -> str:
+    return "".join(iter_extractive_answer(query, chunks, metadatas, highlights))
+
+
+class StubGenerator:
+    """Offline stand-in for an LLM: streams the extractive answer word by word,
+    pausing `token_delay` seconds between words like a model emitting tokens."""
+
+    def __init__(self, token_delay: float = 0.02):
+        self.token_delay = token_delay
+
+    def __call__(self, query: str, chunks: List[str], metadatas: List[Dict],
+                 highlights: Optional[List[List[str]]] = None) -> Iterator[str]:
+        for segment in iter_extractive_answer(query, chunks, metadatas, highlights):
+            for token in re.findall(r"\s*\S+\s*|\s+", segment):    # Words with their surrounding whitespace
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield token
@@ -0,0 +1,469 @@
+"""Document ingestion pipeline shared by the upload and update endpoints.
+
+extract -> chunk -> embed -> store
+
+Each stage is a generator feeding the next, so an upload is processed page by
+page with roughly constant memory however large the file is. PDF page
+extraction is CPU bound, so it runs on a process pool and large PDFs are split
+into page ranges across workers. Embedding stays in the calling process on the
+single model owned by backend.py.
+"""
+import codecs
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pdfplumber
+
+from chunker import Chunk, get_chunker
+from embedding_cache import content_hash, file_hash
+from telemetry import REGISTRY, get_logger, span, timed_iter
+
+logger = get_logger("ingestion")
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "128"))    # Chunks per embed + write call
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "8"))
+PDF_MAX_INFLIGHT = max(1, PDF_WORKERS * 2)    # Page ranges submitted ahead of the consumer, per file
+TEXT_BLOCK_SIZE = 1024 * 1024    # Bytes decoded at a time from text uploads
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+INGESTED_DOCUMENTS = REGISTRY.counter("rag_ingest_documents_total", "Documents ingested", ["file_type"])
+INGESTED_PAGES = REGISTRY.counter("rag_ingest_pages_total", "PDF pages extracted")
+INGESTED_CHUNKS = REGISTRY.counter("rag_ingest_chunks_total", "Chunks written by ingestion and edits", ["outcome"])
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Process pool for PDF extraction, created on first use.
+    Workers are spawned (not forked) so they never inherit the torch/ChromaDB state of the server."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+# ---------------------------------------------------------------- extract
+#
+# Extraction is a stream of text parts: pages for a PDF, decoded blocks for a
+# text file. Nothing holds the whole source file in memory, and the chunker
+# consumes parts as they arrive.
+
+def _extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract pages [start, end) of a PDF. Runs inside a pool worker process."""
+    pages = []
+    with pdfplumber.open(path, pages=list(range(start + 1, end + 1))) as pdf:
+        for page in pdf.pages:
+            pages.append((page.page_number, page.extract_text() or ""))
+            page.close()    # Drop the parsed layout before moving to the next page
+    return pages
+
+
+def count_pdf_pages(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def report_progress(progress: Optional[Dict], **fields):
+    """Update a job's per-file progress entry, if the caller passed one"""
+    if progress is not None:
+        progress.update(fields)
+
+
+def iter_pdf_pages(path: str, progress: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for a PDF on disk, in page order.
+    Page ranges of PDF_PAGES_PER_TASK run on the process pool, with at most
+    PDF_MAX_INFLIGHT ranges submitted at once so memory stays bounded."""
+    num_pages = count_pdf_pages(path)
+    report_progress(progress, pages_total=num_pages)
+    pool = get_pdf_pool()
+    starts = iter(range(0, num_pages, PDF_PAGES_PER_TASK))
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            pending.append(pool.submit(_extract_page_range, path, start, min(start + PDF_PAGES_PER_TASK, num_pages)))
+
+    for _ in range(PDF_MAX_INFLIGHT):
+        submit_next()
+    pages_extracted = 0
+    try:
+        while pending:
+            pages = pending.popleft().result()    # Ranges are consumed in page order
+            submit_next()
+            INGESTED_PAGES.inc(len(pages))
+            for page_num, page_text in pages:
+                pages_extracted += 1
+                yield page_num, page_text
+            report_progress(progress, pages_extracted=pages_extracted)
+    finally:
+        for future in pending:    # Consumer stopped early
+            future.cancel()
+
+
+def _iter_decoded(path: str, encoding: str, block_size: int, errors: str = "strict") -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            text = decoder.decode(block)
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def detect_text_encoding(path: str, block_size: int = TEXT_BLOCK_SIZE) -> str:
+    """UTF-8 if the whole file decodes as UTF-8, otherwise latin-1 (one streaming pass)."""
+    try:
+        for _ in _iter_decoded(path, "utf-8", block_size):
+            pass
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def is_pdf_file(filename: str) -> bool:
+    return filename.lower().endswith('.pdf')
+
+
+def iter_document_parts(path: str, filename: str, progress: Optional[Dict] = None) -> Iterator[str]:
+    """Stream the extracted text of an uploaded file stored at `path`.
+    PDF pages come out as `--- Page N ---` sections, empty pages (scans, blank
+    sheets) included, so every page has a marker the document store can find."""
+    report_progress(progress, stage="extracting")
+    if is_pdf_file(filename):
+        for page_num, page_text in iter_pdf_pages(path, progress):
+            yield f"--- Page {page_num} ---\n{page_text}\n\n"
+    else:
+        encoding = detect_text_encoding(path)
+        yield from _iter_decoded(path, encoding, TEXT_BLOCK_SIZE, errors="ignore")
+
+
+# ---------------------------------------------------------------- chunk
+
+def iter_chunks(parts: Iterable[str], chunker=None) -> Iterator[Chunk]:
+    """Chunks over a stream of text parts (see chunker.py); same output as chunk_text("".join(parts))."""
+    return (chunker or get_chunker()).iter_chunks(parts)
+
+
+def chunk_text(text: str, chunker=None) -> List[Chunk]:
+    return list(iter_chunks([text], chunker))
+
+
+# ---------------------------------------------------------------- embed + store
+
+def chunk_hash(text: str) -> str:
+    """Content hash stored with every chunk, used to skip re-embedding unchanged text"""
+    return content_hash(text)
+
+
+def chunk_id(doc_id: str, idx: int) -> str:
+    return f"{doc_id}_chunk_{idx}"
+
+
+def chunk_metadata(metadata: Dict, doc_id: str, idx: int, chunk: Chunk) -> Dict:
+    positions = {"char_start": chunk.start, "char_end": chunk.end, "tokens": chunk.tokens}
+    if chunk.page_start is not None:
+        positions.update(page_start=chunk.page_start, page_end=chunk.page_end)
+    return {
+        **metadata,
+        "doc_id": doc_id,
+        "chunk": idx,
+        "content_hash": chunk_hash(chunk.text),
+        **positions,
+        "type": "embedding"
+    }
+
+
+POSITION_FIELDS = ("char_start", "char_end", "page_start", "page_end")
+
+
+def embed_batch(embedder, texts: List[str]) -> Tuple[List, int]:
+    """One model forward pass for a batch of chunk texts.
+    With an embedding_cache.CachedEmbedder only unseen texts reach the model;
+    returns the vectors and how many came from the cache."""
+    with span("embed"):
+        if hasattr(embedder, "embed"):
+            return embedder.embed(texts)
+        return embedder(texts), 0
+
+
+def store_batch(collection, ids: List[str], texts: List[str], embeddings: List, metadatas: List[Dict]):
+    with span("store"):
+        collection.add(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+
+
+def writing(gate):
+    """`gate.writing()` (see maintenance.WriteGate), or nothing without a gate"""
+    return gate.writing() if gate is not None else nullcontext()
+
+
+def embed_and_store(collection, embedding_function, chunks: Iterable[Chunk], doc_id: str,
+                    metadata: Dict, batch_size: int = EMBED_BATCH_SIZE,
+                    progress: Optional[Dict] = None, lexical_index=None, gate=None) -> Dict:
+    """Embed and store chunks batch by batch, pulling them lazily from `chunks`.
+    Stored batches are also added to `lexical_index` when one is given; each
+    batch is written inside `gate`, so maintenance waits for one batch at most.
+    Returns a report with stored/failed counts and one entry per failed batch."""
+    report = {"stored": 0, "failed": 0, "batches": 0, "cached": 0, "errors": []}
+    chunks = iter(chunks)
+    start = 0
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            break
+        end = start + len(batch)
+        report_progress(progress, chunks_total=end)
+        if collection is None:
+            start = end
+            continue
+        report["batches"] += 1
+        stage = "embed"
+        try:
+            texts = [chunk.text for chunk in batch]
+            embeddings, cached = embed_batch(embedding_function, texts)
+            stage = "store"
+            ids = [chunk_id(doc_id, idx) for idx in range(start, end)]
+            metadatas = [chunk_metadata(metadata, doc_id, idx, chunk) for idx, chunk in enumerate(batch, start)]
+            with writing(gate):
+                store_batch(collection, ids=ids, texts=texts, embeddings=embeddings, metadatas=metadatas)
+                if lexical_index is not None:
+                    stage = "index"
+                    with span("index"):
+                        lexical_index.add(ids, texts, metadatas)
+            report["stored"] += len(batch)
+            report["cached"] += cached
+        except Exception as e:
+            report["failed"] += len(batch)
+            report["errors"].append({"chunks": f"{start}-{end - 1}", "stage": stage, "error": str(e)})
+            logger.error("Ingest batch failed", extra={"doc_id": doc_id, "stage": stage, "chunks": f"{start}-{end - 1}",
+                                                       "error": str(e)})
+        report_progress(progress, chunks_embedded=report["stored"], chunks_failed=report["failed"])
+        start = end
+    INGESTED_CHUNKS.inc(report["stored"], outcome="stored")
+    INGESTED_CHUNKS.inc(report["failed"], outcome="failed")
+    INGESTED_CHUNKS.inc(report["cached"], outcome="cached")
+    logger.debug("Stored chunks", extra={"doc_id": doc_id, "stored": report["stored"], "total": start,
+                                         "batches": report["batches"], "cached": report["cached"]})
+    return report
+
+
+def update_document_chunks(collection, embedding_function, doc_id: str, text: str,
+                           metadata: Dict, batch_size: int = EMBED_BATCH_SIZE, lexical_index=None) -> Dict:
+    """Bring a document's chunks in line with its edited `text`, re-embedding only what changed.
+
+    A chunk whose id and content hash are unchanged is left untouched (only its
+    offsets are rewritten if text before it grew or shrank). A chunk
+    whose text already exists elsewhere in the document (e.g. it moved, or was
+    stored under an old id) is rewritten with its existing vector. Only chunks
+    with new text go through the model. Leftover chunks are deleted."""
+    report = {"reused": 0, "recomputed": 0, "removed": 0, "stored": 0, "failed": 0, "batches": 0, "errors": []}
+    existing = collection.get(where={"doc_id": doc_id}, include=["metadatas", "embeddings"])
+    missing_hash = [cid for cid, meta in zip(existing["ids"], existing["metadatas"]) if not (meta or {}).get("content_hash")]
+    legacy_text = {}
+    if missing_hash:    # Chunks written before hashes were stored
+        legacy = collection.get(ids=missing_hash, include=["documents"])
+        legacy_text = dict(zip(legacy["ids"], legacy["documents"]))
+    hash_by_id = {}
+    meta_by_id = {}
+    vector_by_hash = {}
+    for cid, meta, embedding in zip(existing["ids"], existing["metadatas"], existing["embeddings"]):
+        h = (meta or {}).get("content_hash") or chunk_hash(legacy_text.get(cid, ""))
+        hash_by_id[cid] = h
+        meta_by_id[cid] = meta or {}
+        vector_by_hash.setdefault(h, embedding)
+
+    reuse, recompute, moved = [], [], []
+    new_ids = set()
+    with span("chunk"):
+        chunks = chunk_text(text)
+    for idx, chunk in enumerate(chunks):
+        cid = chunk_id(doc_id, idx)
+        new_ids.add(cid)
+        h = chunk_hash(chunk.text)
+        new_meta = chunk_metadata(metadata, doc_id, idx, chunk)
+        if hash_by_id.get(cid) == h:
+            report["reused"] += 1    # Same text at the same position: no new vector needed
+            if any(meta_by_id[cid].get(field) != new_meta.get(field) for field in POSITION_FIELDS):
+                moved.append((cid, chunk.text, new_meta))
+        elif h in vector_by_hash:
+            reuse.append((cid, chunk.text, new_meta, vector_by_hash[h]))
+        else:
+            recompute.append((cid, chunk.text, new_meta))
+
+    for start in range(0, len(moved), batch_size):    # Metadata only: offsets shifted by an earlier edit
+        batch = moved[start:start + batch_size]
+        try:
+            with span("store"):
+                collection.update(ids=[item[0] for item in batch], metadatas=[item[2] for item in batch])
+                if lexical_index is not None:
+                    lexical_index.add([item[0] for item in batch], [item[1] for item in batch], [item[2] for item in batch])
+        except Exception as e:
+            report["errors"].append({"chunks": ",".join(item[0] for item in batch), "stage": "store", "error": str(e)})
+
+    for start in range(0, len(reuse), batch_size):
+        batch = reuse[start:start + batch_size]
+        report["batches"] += 1
+        try:
+            with span("store"):
+                collection.upsert(
+                    ids=[item[0] for item in batch],
+                    documents=[item[1] for item in batch],
+                    metadatas=[item[2] for item in batch],
+                    embeddings=[item[3] for item in batch]
+                )
+                if lexical_index is not None:
+                    lexical_index.add([item[0] for item in batch], [item[1] for item in batch], [item[2] for item in batch])
+            report["reused"] += len(batch)
+            report["stored"] += len(batch)
+        except Exception as e:
+            report["failed"] += len(batch)
+            report["errors"].append({"chunks": ",".join(item[0] for item in batch), "stage": "store", "error": str(e)})
+    for start in range(0, len(recompute), batch_size):
+        batch = recompute[start:start + batch_size]
+        report["batches"] += 1
+        stage = "embed"
+        try:
+            embeddings, cached = embed_batch(embedding_function, [item[1] for item in batch])
+            stage = "store"
+            with span("store"):
+                collection.upsert(
+                    ids=[item[0] for item in batch],
+                    documents=[item[1] for item in batch],
+                    metadatas=[item[2] for item in batch],
+                    embeddings=embeddings
+                )
+            if lexical_index is not None:
+                stage = "index"
+                with span("index"):
+                    lexical_index.add([item[0] for item in batch], [item[1] for item in batch], [item[2] for item in batch])
+            report["recomputed"] += len(batch) - cached
+            report["reused"] += cached
+            report["stored"] += len(batch)
+        except Exception as e:
+            report["failed"] += len(batch)
+            report["errors"].append({"chunks": ",".join(item[0] for item in batch), "stage": stage, "error": str(e)})
+    for e in report["errors"]:
+        logger.error("Update batch failed", extra={"doc_id": doc_id, "stage": e["stage"], "error": e["error"]})
+
+    stale = [cid for cid in existing["ids"] if cid not in new_ids]
+    if stale:
+        collection.delete(ids=stale)
+        if lexical_index is not None:
+            lexical_index.delete_chunks(stale)
+        report["removed"] = len(stale)
+    INGESTED_CHUNKS.inc(report["stored"], outcome="stored")
+    INGESTED_CHUNKS.inc(report["failed"], outcome="failed")
+    logger.info("Updated document chunks", extra={"doc_id": doc_id, "reused": report["reused"],
+                                                  "recomputed": report["recomputed"], "removed": report["removed"]})
+    return report
+
+
+# ---------------------------------------------------------------- pipeline
+
+def new_document(filename: str, size: int, preview: str, file_type: str, session_id: str,
+                 doc_id: Optional[str] = None) -> Dict:
+    """Document record kept for the UI (view / edit / delete); its text is staged in the doc_store."""
+    return {
+        "id": doc_id or str(uuid.uuid4()),
+        "filename": filename,
+        "uploaded_at": datetime.now().isoformat(),
+        "size": size,
+        "preview": preview,
+        "file_type": file_type,
+        "session_id": session_id
+    }
+
+
+def ingest_file(path: str, filename: str, session_id: str, collection, embedding_function, doc_store,
+                batch_size: int = EMBED_BATCH_SIZE, progress: Optional[Dict] = None,
+                lexical_index=None, doc_id: Optional[str] = None, gate=None) -> Optional[Tuple[Dict, Dict]]:
+    """Run the full pipeline for a file on disk, streaming pages into the chunker
+    and chunks into the embedder as they are extracted, while the text is staged
+    in `doc_store` segment by segment; registering the returned record adopts it.
+    Returns (document record, embedding report), or None when no text was extracted.
+    `progress`, when given, is a job file entry (see jobs.py) updated as stages complete.
+    Chunks are written inside `gate` batch by batch (see embed_and_store).
+    A file whose bytes match an earlier upload in the same session reuses that
+    upload's extracted text instead of being parsed again."""
+    start_time = time.time()
+    doc_id = doc_id or str(uuid.uuid4())
+    sha256 = file_hash(path)
+    duplicate_of = doc_store.find_by_file_hash(sha256, session_id)
+    writer = doc_store.content_writer(doc_id)
+
+    def source_parts():
+        if duplicate_of is not None and doc_store.get(duplicate_of) is not None:
+            logger.info("Identical to an earlier upload, reusing its text",
+                        extra={"upload": filename, "duplicate_of": duplicate_of})
+            report_progress(progress, stage="extracting")
+            yield from doc_store.iter_content(duplicate_of)
+            return
+        yield from iter_document_parts(path, filename, progress)
+
+    def staged_parts():
+        for part in timed_iter(source_parts(), "extract"):
+            writer.write(part)
+            yield part
+        writer.close()
+        report_progress(progress, stage="embedding")    # Extraction done, last batches in flight
+
+    try:
+        report = embed_and_store(collection, embedding_function, timed_iter(iter_chunks(staged_parts()), "chunk"), doc_id, {
+            "source": filename,
+            "session_id": session_id,
+        }, batch_size=batch_size, progress=progress, lexical_index=lexical_index, gate=gate)
+    except BaseException:
+        writer.discard()
+        raise
+    if not writer.has_text:
+        writer.discard()
+        logger.warning("No text extracted", extra={"upload": filename})
+        if report["stored"] and collection is not None:    # Whitespace-only chunks
+            with writing(gate):
+                collection.delete(where={"doc_id": doc_id})
+                if lexical_index is not None:
+                    lexical_index.delete_document(doc_id)
+        report_progress(progress, stage="skipped", chunks_total=0, chunks_embedded=0, error="No text extracted from file")
+        return None
+    document = new_document(filename, writer.size, writer.preview, "pdf" if is_pdf_file(filename) else "text",
+                            session_id, doc_id)
+    document["file_hash"] = sha256
+    report["duplicate_of"] = duplicate_of
+    report_progress(progress, document_id=doc_id, size=writer.size)
+    INGESTED_DOCUMENTS.inc(file_type=document["file_type"])
+    logger.info("Processed upload", extra={"upload": filename, "doc_id": doc_id, "chars": writer.size,
+                                           "chunks": report["stored"], "seconds": round(time.time() - start_time, 3)})
+    return document, report
+
+
+def spool_to_tempfile(fileobj, filename: str) -> str:
+    """Copy an upload stream to a temp file so pool workers can open it by path."""
+    suffix = os.path.splitext(filename)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(fileobj, tmp, length=1024 * 1024)
+        return tmp.name
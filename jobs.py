@@ -0,0 +1,144 @@
+"""Background ingestion jobs.
+
+An upload becomes a job with one entry per file. Files wait in a bounded
+asyncio queue and a fixed number of workers take them off the queue, running the
+blocking ingestion pipeline on a thread pool so the event loop stays free for
+chat and document requests. Progress is written into the job's file entries as
+each stage advances and can be polled through GET /jobs/{job_id}. A job belongs
+to the session that submitted it and its files are ingested into that session.
+"""
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telemetry import get_logger
+
+logger = get_logger("jobs")
+
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))    # Files ingested at the same time
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "200"))    # Files waiting before new jobs are refused
+MAX_FINISHED_JOBS = 500    # Finished jobs kept for polling
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def new_file_progress(filename: str) -> Dict:
+    return {
+        "filename": filename,
+        "stage": "queued",    # queued -> extracting -> embedding -> done | skipped | failed
+        "pages_total": 0,
+        "pages_extracted": 0,
+        "chunks_total": 0,
+        "chunks_embedded": 0,
+        "chunks_failed": 0,
+        "document_id": None,
+        "size": 0,
+        "error": None
+    }
+
+
+class JobManager:
+    def __init__(self, process_file: Callable[[str, str, Dict, Optional[str]], None], executor,
+                 concurrency: int = INGEST_CONCURRENCY, queue_size: int = INGEST_QUEUE_SIZE):
+        """`process_file(path, filename, progress, session_id)` runs on `executor` and updates `progress` in place."""
+        self.process_file = process_file
+        self.executor = executor
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+
+    def _ensure_workers(self):
+        """Workers are started on first use, inside the running event loop"""
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, files: List[Tuple[str, str]], session_id: Optional[str] = None) -> Dict:
+        """Queue a job for `files`, a list of (temp path, original filename)."""
+        self._ensure_workers()
+        if self.queue.qsize() + len(files) > self.queue_size:
+            raise QueueFullError(f"Ingest queue is full ({self.queue.qsize()} files waiting)")
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "status": "queued",
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "total_files": len(files),
+            "completed_files": 0,
+            "successful": 0,
+            "failed": 0,
+            "files": [new_file_progress(filename) for _, filename in files]
+        }
+        self.jobs[job["job_id"]] = job
+        self._trim()
+        for (path, filename), progress in zip(files, job["files"]):
+            self.queue.put_nowait((job, path, filename, progress))
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def list(self, session_id: Optional[str] = None) -> List[Dict]:
+        return [job for job in self.jobs.values() if session_id is None or job["session_id"] == session_id]
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.concurrency,
+            "queued_files": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "active_jobs": sum(1 for job in self.jobs.values() if job["status"] in ("queued", "running"))
+        }
+
+    async def shutdown(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, path, filename, progress = await self.queue.get()
+            if job["status"] == "queued":
+                job["status"] = "running"
+                job["started_at"] = datetime.now().isoformat()
+            try:
+                await loop.run_in_executor(self.executor, self.process_file, path, filename, progress, job["session_id"])
+                if progress["stage"] not in ("done", "skipped", "failed"):
+                    progress["stage"] = "done"
+            except Exception as e:
+                progress["stage"] = "failed"
+                progress["error"] = str(e)
+                logger.error("Job file failed", extra={"job_id": job["job_id"], "upload": filename, "error": str(e)})
+            finally:
+                self.queue.task_done()
+                self._finish_file(job, progress)
+
+    def _finish_file(self, job: Dict, progress: Dict):
+        job["completed_files"] += 1
+        if progress["stage"] == "done":
+            job["successful"] += 1
+        else:
+            job["failed"] += 1
+        if job["completed_files"] == job["total_files"]:
+            job["status"] = "completed" if job["successful"] else "failed"
+            job["finished_at"] = datetime.now().isoformat()
+            logger.info("Job finished", extra={"job_id": job["job_id"], "successful": job["successful"],
+                                               "total_files": job["total_files"]})
+
+    def _trim(self):
+        """Forget the oldest finished jobs once more than MAX_FINISHED_JOBS are kept"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished_at"]]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
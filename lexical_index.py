@@ -0,0 +1,228 @@
+"""Lexical (BM25) inverted index over the stored chunks.
+
+Postings live in SQLite next to the ChromaDB files and are updated in the same
+places chunks are written to or deleted from the collection, so exact-term
+queries (part numbers, error codes) can be answered without the embedding
+model, and the index survives restarts without being rebuilt.
+"""
+import json
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from telemetry import get_logger
+
+logger = get_logger("lexical_index")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lexical_chunks (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    session_id TEXT,
+    length INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lexical_chunks_doc ON lexical_chunks(doc_id);
+-- Covers the per-session corpus stats as well as the search filter
+CREATE INDEX IF NOT EXISTS idx_lexical_chunks_session ON lexical_chunks(session_id, length);
+CREATE TABLE IF NOT EXISTS lexical_postings (
+    term TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_lexical_postings_chunk ON lexical_postings(chunk_id);
+CREATE TABLE IF NOT EXISTS lexical_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    chunks INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO lexical_stats (id, chunks, total_length) VALUES (1, 0, 0);
+"""
+
+# Words too common to help ranking; dropping them keeps the postings small
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its of on or our she so that the their
+them then there these they this to was we were what when where which who will with you your
+""".split())
+
+# Words, plus identifiers joined by - _ . / : (ERR-4012, v2.3.1, eth0/1) kept whole
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+SEPARATOR_RE = re.compile(r"[-_./:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Index terms of `text`; compound identifiers also contribute their parts"""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if SEPARATOR_RE.search(token):
+            tokens.extend(part for part in SEPARATOR_RE.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    TABLES = ("lexical_chunks", "lexical_postings", "lexical_stats")    # What a snapshot import swaps in
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------ writes
+
+    def _remove(self, conn: sqlite3.Connection, where: str, params: Iterable):
+        """Drop matching chunks and their postings, keeping the corpus stats in step"""
+        params = list(params)
+        removed, length = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM lexical_chunks WHERE {where}", params
+        ).fetchone()
+        if not removed:
+            return 0
+        conn.execute(f"DELETE FROM lexical_postings WHERE chunk_id IN (SELECT chunk_id FROM lexical_chunks WHERE {where})", params)
+        conn.execute(f"DELETE FROM lexical_chunks WHERE {where}", params)
+        conn.execute("UPDATE lexical_stats SET chunks = chunks - ?, total_length = total_length - ? WHERE id = 1",
+                     (removed, length))
+        return removed
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict]):
+        """Index chunks, replacing any already indexed under the same ids"""
+        rows, postings, total_length = [], [], 0
+        for cid, text, metadata in zip(ids, texts, metadatas):
+            terms = Counter(tokenize(text))
+            length = sum(terms.values())
+            total_length += length
+            metadata = metadata or {}
+            rows.append((cid, metadata.get("doc_id", ""), metadata.get("session_id"), length, text, json.dumps(metadata)))
+            postings.extend((term, cid, tf) for term, tf in terms.items())
+        with self._connect() as conn:
+            for start in range(0, len(ids), 500):    # Stay under SQLite's bound-parameter limit
+                part = ids[start:start + 500]
+                self._remove(conn, f"chunk_id IN ({','.join('?' * len(part))})", part)
+            conn.executemany("INSERT INTO lexical_chunks (chunk_id, doc_id, session_id, length, text, metadata) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO lexical_postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            conn.execute("UPDATE lexical_stats SET chunks = chunks + ?, total_length = total_length + ? WHERE id = 1",
+                         (len(rows), total_length))
+
+    def delete_chunks(self, ids: List[str]) -> int:
+        removed = 0
+        with self._connect() as conn:
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                removed += self._remove(conn, f"chunk_id IN ({','.join('?' * len(part))})", part)
+        return removed
+
+    def delete_document(self, doc_id: str) -> int:
+        with self._connect() as conn:
+            return self._remove(conn, "doc_id = ?", (doc_id,))
+
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        removed = 0
+        with self._connect() as conn:
+            for start in range(0, len(doc_ids), 500):
+                part = doc_ids[start:start + 500]
+                removed += self._remove(conn, f"doc_id IN ({','.join('?' * len(part))})", part)
+        return removed
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM lexical_postings")
+            conn.execute("DELETE FROM lexical_chunks")
+            conn.execute("UPDATE lexical_stats SET chunks = 0, total_length = 0 WHERE id = 1")
+
+    def backfill(self, collection, page_size: int = 1000) -> int:
+        """Index every chunk of `collection` when the index is empty (chunks stored before it existed)"""
+        if self.count() or not collection.count():
+            return 0
+        indexed = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=indexed)
+            if not page["ids"]:
+                break
+            self.add(page["ids"], page["documents"], page["metadatas"])
+            indexed += len(page["ids"])
+        logger.info("Backfilled lexical index from the collection", extra={"chunks": indexed})
+        return indexed
+
+    def vacuum(self):
+        """Return the pages freed by deletes to the filesystem"""
+        conn = self._connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+
+    # ------------------------------------------------------------ reads
+
+    def chunk_ids(self) -> Set[str]:
+        return {row[0] for row in self._connect().execute("SELECT chunk_id FROM lexical_chunks")}
+
+    def _stats(self, session_id: Optional[str] = None):
+        """(chunks, total length) of the whole index or of one session's chunks"""
+        if session_id is None:
+            return self._connect().execute("SELECT chunks, total_length FROM lexical_stats WHERE id = 1").fetchone()
+        return self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM lexical_chunks WHERE session_id = ?", (session_id,)
+        ).fetchone()
+
+    def count(self, session_id: Optional[str] = None) -> int:
+        return self._stats(session_id)[0]
+
+    def search(self, query: str, n_results: int = 10, session_id: Optional[str] = None) -> List[Dict]:
+        """Top chunks by BM25 score: [{"id", "document", "metadata", "score"}], best first.
+        With `session_id`, only that session's chunks are searched and scored as a corpus of their own."""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._connect()
+        chunks, total_length = self._stats(session_id)
+        if not chunks:
+            return []
+        scope, params = (" AND c.session_id = ?", terms + [session_id]) if session_id is not None else ("", terms)
+        rows = conn.execute(
+            "SELECT p.term, p.chunk_id, p.tf, c.length FROM lexical_postings p"
+            " JOIN lexical_chunks c ON c.chunk_id = p.chunk_id"
+            f" WHERE p.term IN ({','.join('?' * len(terms))}){scope}", params
+        ).fetchall()
+        if not rows:
+            return []
+        row_terms, row_ids, tf, length = zip(*rows)
+        tf = np.asarray(tf, dtype=np.float64)
+        length = np.asarray(length, dtype=np.float64)
+        df = Counter(row_terms)
+        idf_by_term = {term: np.log(1 + (chunks - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+        idf = np.fromiter((idf_by_term[term] for term in row_terms), dtype=np.float64, count=len(rows))
+        avgdl = total_length / chunks if total_length else 1.0
+        row_scores = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl))
+        ids, inverse = np.unique(np.asarray(row_ids, dtype=object), return_inverse=True)
+        scores = np.bincount(inverse, weights=row_scores)    # Sum over the query terms of each chunk
+        top = np.argsort(-scores, kind="stable")[:n_results]
+        top_ids = [ids[i] for i in top]
+        found = {
+            row[0]: row for row in conn.execute(
+                f"SELECT chunk_id, text, metadata FROM lexical_chunks WHERE chunk_id IN ({','.join('?' * len(top_ids))})",
+                top_ids
+            )
+        }
+        return [
+            {"id": cid, "document": found[cid][1], "metadata": json.loads(found[cid][2]), "score": float(scores[i])}
+            for cid, i in zip(top_ids, top)
+        ]
@@ -0,0 +1,362 @@
+"""Background maintenance: reconcile ChromaDB against the document store.
+
+Uploads that fail part-way, crashes between embedding and registering a
+document, and older code paths (e.g. the `_updated` chunk ids of early edits)
+leave chunks behind that no document owns. A maintenance run
+
+- scans every collection for orphaned chunks (no document, or a document of
+  another session) and duplicates (a chunk stored under a non-canonical id
+  next to its canonical one, or left in the shared collection after its
+  session moved to its own),
+- deletes them, after checking them again with writers held off,
+- drops text staged by ingests that never finished,
+- brings the lexical index in line with what ChromaDB holds,
+- prunes the embedding cache of vectors no stored chunk uses (edited and
+  deleted documents' chunks),
+- optionally rebuilds collections (copying stored vectors into a fresh
+  collection, so nothing is re-embedded) and vacuums the SQLite files,
+- and reports the rows and bytes reclaimed.
+
+Writers (edits, deletes, tenant moves, and each batch an ingest stores) run inside
+`WriteGate.writing()`. A document being ingested is marked with `WriteGate.ingesting()`
+until it is registered, and maintenance leaves its chunks and staged text alone, so
+an ingest does not hold the gate between batches. Only the checked deletes and the
+embedding-cache prune run inside `WriteGate.exclusive()`, which waits for in-flight
+writes to finish and holds new ones until it is done. A rebuild copies without the gate and swaps the copy in
+under it, but only if nothing was written meanwhile and no ingest is in flight.
+
+The gate is in-process: maintenance runs in the server process, which owns the
+stores (see resources.StoreLock), so it sees every writer.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+import ingestion
+from telemetry import get_logger
+
+logger = get_logger("maintenance")
+
+MAINTENANCE_PAGE_SIZE = 1000    # Chunks read from a collection per request
+MAINTENANCE_REBUILD_ATTEMPTS = 3    # Copies tried before a rebuild is given up for this run
+
+
+class WriteGate:
+    """Shared/exclusive gate: any number of writers, or one maintenance pass"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._writers = 0
+        self._exclusive = False
+        self._ingesting: Set[str] = set()
+        self.generation = 0    # Bumped as each write starts and ends; unchanged means nothing was written
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive)
+            self._writers += 1
+            self.generation += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writers -= 1
+                self.generation += 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def ingesting(self, doc_id: str):
+        """Mark a document as being ingested until it is registered; never waits"""
+        with self._condition:
+            self._ingesting.add(doc_id)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._ingesting.discard(doc_id)
+
+    def in_flight(self) -> Set[str]:
+        """Ids of the documents being ingested. Read it before looking documents up: an
+        ingest that is gone from here has registered its document (or given up)."""
+        with self._condition:
+            return set(self._ingesting)
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive)
+            self._exclusive = True    # New writers wait from here on
+            self._condition.wait_for(lambda: self._writers == 0)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+    @property
+    def writers(self) -> int:
+        return self._writers
+
+
+def path_size(path: str) -> int:
+    """Bytes used by a file (with its SQLite -wal/-shm companions) or a directory tree"""
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:    # Removed while walking
+                    pass
+        return total
+    return sum(os.path.getsize(p) for p in (path, path + "-wal", path + "-shm") if os.path.exists(p))
+
+
+def scan_collection(collection, page_size: int = MAINTENANCE_PAGE_SIZE) -> Dict[str, Dict]:
+    """Metadata of every chunk in a collection, by chunk id"""
+    chunks: Dict[str, Dict] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return chunks
+        for cid, metadata in zip(page["ids"], page["metadatas"]):
+            chunks[cid] = metadata or {}
+        offset += len(page["ids"])
+
+
+class Maintenance:
+    def __init__(self, resources, doc_store, lexical_index, sessions, gate: WriteGate,
+                 paths: List[str], on_change: Optional[Callable[[], None]] = None,
+                 rebuild_ratio: float = 0.2, embedding_cache=None):
+        """`paths` are the files and directories whose size is reported; `on_change` is
+        called after chunks are removed or moved (e.g. to retire cached results).
+        A collection is rebuilt when a run removes at least `rebuild_ratio` of its chunks.
+        `embedding_cache` (an embedding_cache.EmbeddingCache) is pruned and vacuumed."""
+        self.resources = resources
+        self.doc_store = doc_store
+        self.lexical_index = lexical_index
+        self.sessions = sessions
+        self.gate = gate
+        self.paths = paths
+        self.on_change = on_change
+        self.rebuild_ratio = rebuild_ratio
+        self.embedding_cache = embedding_cache
+        self.running = False
+        self.last_report: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def _collections(self) -> Dict[str, object]:
+        names = [self.resources.collection_name] + self.sessions.tenant_collections()
+        return {name: self.resources.tenant_collection(name) for name in dict.fromkeys(names)}
+
+    def _find_garbage(self, name: str, chunks: Dict[str, Dict], docs: Dict[str, Dict],
+                      tenant_ids: Dict[str, Set[str]], in_flight: Set[str]) -> Dict[str, List[str]]:
+        """Orphaned and duplicate chunk ids of one collection"""
+        orphans, duplicates = [], []
+        shared = name == self.resources.collection_name
+        for cid, metadata in chunks.items():
+            if metadata.get("doc_id") in in_flight:
+                continue
+            doc = docs.get(metadata.get("doc_id"))
+            if doc is None or doc["session_id"] != metadata.get("session_id"):
+                orphans.append(cid)
+                continue
+            chunk = metadata.get("chunk")
+            canonical = ingestion.chunk_id(doc["id"], chunk) if chunk is not None else cid
+            if canonical != cid and canonical in chunks:
+                duplicates.append(cid)    # e.g. a legacy `_updated` id beside the current chunk
+            elif shared and cid in tenant_ids.get(doc["session_id"], ()):
+                duplicates.append(cid)    # Left behind by an interrupted move to the tenant's collection
+        return {"orphans": orphans, "duplicates": duplicates}
+
+    def run(self, rebuild: Optional[bool] = None, dry_run: bool = False) -> Dict:
+        """One maintenance pass. `rebuild` forces (True) or skips (False) rebuilding the
+        collections; by default one is rebuilt when enough of it was removed.
+        With `dry_run` nothing is changed and the report lists what would be."""
+        with self._lock:
+            if self.running:
+                return {"status": "error", "message": "Maintenance is already running"}
+            self.running = True
+        start_time = time.time()
+        try:
+            report = self._run(rebuild, dry_run)
+        except Exception as e:
+            report = {"status": "error", "message": str(e)}
+            logger.exception("Maintenance failed")
+        finally:
+            self.running = False
+        report.update(dry_run=dry_run, finished_at=datetime.now().isoformat(),
+                      elapsed=f"{time.time() - start_time:.2f}s")
+        self.last_report = report
+        return report
+
+    def _run(self, rebuild: Optional[bool], dry_run: bool) -> Dict:
+        if self.resources.collection() is None:
+            return {"status": "error", "message": f"ChromaDB unavailable: {self.resources.error}"}
+        bytes_before = sum(path_size(path) for path in self.paths)
+        # Candidates are found without holding writers off ...
+        collections = self._collections()
+        scanned = {name: scan_collection(collection) for name, collection in collections.items()}
+        tenant_ids = {}
+        for session in self.sessions.list():
+            if session["collection"] in scanned:
+                tenant_ids[session["session_id"]] = set(scanned[session["collection"]])
+        in_flight = self.gate.in_flight()
+        doc_ids = {meta.get("doc_id") for chunks in scanned.values() for meta in chunks.values()}
+        docs = self.doc_store.get_many([doc_id for doc_id in doc_ids if doc_id])
+        found = {name: self._find_garbage(name, chunks, docs, tenant_ids, in_flight) for name, chunks in scanned.items()}
+        report = {"status": "success", "collections": {}, "lexical": {"removed": 0, "added": 0}}
+        for name, garbage in found.items():
+            report["collections"][name] = {"chunks": len(scanned[name]), "orphans": len(garbage["orphans"]),
+                                           "duplicates": len(garbage["duplicates"]), "removed": 0, "rebuilt": False}
+        if dry_run:
+            stale_lexical = self.lexical_index.chunk_ids() - {cid for chunks in scanned.values() for cid in chunks}
+            report["lexical"]["removed"] = len(stale_lexical)
+            if self.embedding_cache is not None:
+                report["embedding_cache"] = {"removed": len(self.embedding_cache.unreferenced(self._hashes(scanned))),
+                                             "bytes_reclaimed": 0}
+            report.update(rows_removed=0, bytes_before=bytes_before, bytes_after=bytes_before, bytes_reclaimed=0)
+            return report
+        # ... and checked again once in-flight writes have finished: a document may have been
+        # registered or edited meanwhile
+        with self.gate.exclusive():
+            for name, garbage in found.items():
+                candidates = garbage["orphans"] + garbage["duplicates"]
+                if not candidates:
+                    continue
+                collection = collections[name]
+                removable = self._confirm(name, collection, candidates)
+                for start in range(0, len(removable), MAINTENANCE_PAGE_SIZE):
+                    collection.delete(ids=removable[start:start + MAINTENANCE_PAGE_SIZE])
+                report["collections"][name]["removed"] = len(removable)
+        changed = any(stats["removed"] for stats in report["collections"].values())
+        # Text of ingests that died part-way: staged before the in-flight set is read, so a live
+        # ingest's text is either in the set or already adopted by its document
+        staged = self.doc_store.staged_documents()
+        report["staged_segments"] = self.doc_store.clear_staged(staged - self.gate.in_flight())
+        report["lexical"] = self._reconcile_lexical(collections)
+        changed = changed or any(report["lexical"].values())
+        for name in collections:
+            stats = report["collections"][name]
+            ratio = stats["removed"] / stats["chunks"] if stats["chunks"] else 0
+            if rebuild or (rebuild is None and stats["removed"] and ratio >= self.rebuild_ratio):
+                stats["rebuilt"] = self._rebuild(name)
+                changed = changed or stats["rebuilt"]
+        if changed and self.on_change:
+            self.on_change()
+        if self.embedding_cache is not None:
+            report["embedding_cache"] = self._prune_embeddings()
+        self.lexical_index.vacuum()
+        self.doc_store.vacuum()
+        bytes_after = sum(path_size(path) for path in self.paths)
+        report.update(
+            rows_removed=sum(stats["removed"] for stats in report["collections"].values()) + report["lexical"]["removed"]
+            + report.get("embedding_cache", {}).get("removed", 0),
+            bytes_before=bytes_before, bytes_after=bytes_after, bytes_reclaimed=max(0, bytes_before - bytes_after)
+        )
+        logger.info("Maintenance finished", extra={"rows_removed": report["rows_removed"],
+                                                   "bytes_reclaimed": report["bytes_reclaimed"]})
+        return report
+
+    @staticmethod
+    def _hashes(scanned: Dict[str, Dict[str, Dict]]) -> Set[str]:
+        """Content hashes of the scanned chunks, i.e. the cached vectors still in use"""
+        return {meta["content_hash"] for chunks in scanned.values() for meta in chunks.values() if meta.get("content_hash")}
+
+    def _scan_hashes(self) -> Set[str]:
+        return self._hashes({name: scan_collection(collection) for name, collection in self._collections().items()})
+
+    def _prune_embeddings(self) -> Dict[str, int]:
+        """Drop cached vectors no stored chunk uses, and vacuum the cache. The chunks are scanned
+        again (after this run's deletes and rebuilds) without the gate, and pruned under it,
+        scanning once more if anything was written meanwhile, so chunks stored by ingests during
+        the run keep their vectors. A vector cached for a batch not stored yet may still go:
+        it is just computed again"""
+        size_before = path_size(self.embedding_cache.path)
+        generation = self.gate.generation
+        keep = self._scan_hashes()
+        with self.gate.exclusive():
+            if self.gate.generation != generation:
+                keep = self._scan_hashes()
+            removed = self.embedding_cache.prune(keep)
+        if removed:
+            self.embedding_cache.vacuum()
+        return {"removed": removed, "bytes_reclaimed": max(0, size_before - path_size(self.embedding_cache.path))}
+
+    def _rebuild(self, name: str) -> bool:
+        """Rebuild a collection, copying it without the gate; the copy replaces the
+        original only if nothing was written while it was made and no ingest, which
+        holds on to the collection between batches, is in flight"""
+        for _ in range(MAINTENANCE_REBUILD_ATTEMPTS):
+            generation = self.gate.generation
+            if self.resources.copy_collection(name, page_size=MAINTENANCE_PAGE_SIZE) is None:
+                return False
+            with self.gate.exclusive():
+                if self.gate.generation == generation and not self.gate.in_flight():
+                    self.resources.swap_rebuilt(name)
+                    return True
+            self.resources.discard_rebuild(name)
+        logger.warning("Collection kept busy by writes, rebuild skipped", extra={"collection": name})
+        return False
+
+    def _confirm(self, name: str, collection, candidates: List[str]) -> List[str]:
+        """The candidates that are still orphans or duplicates"""
+        current = collection.get(ids=candidates, include=["metadatas"])
+        in_flight = self.gate.in_flight()
+        chunks = {cid: meta or {} for cid, meta in zip(current["ids"], current["metadatas"])
+                  if (meta or {}).get("doc_id") not in in_flight}
+        docs = self.doc_store.get_many(list({meta.get("doc_id") for meta in chunks.values() if meta.get("doc_id")}))
+        canonical = {cid: ingestion.chunk_id(meta["doc_id"], meta["chunk"]) for cid, meta in chunks.items()
+                     if meta.get("doc_id") in docs and meta.get("chunk") is not None}
+        present = set(collection.get(ids=list(set(canonical.values())), include=[])["ids"]) if canonical else set()
+        in_tenant: Set[str] = set()
+        if name == self.resources.collection_name:
+            by_collection: Dict[str, List[str]] = {}
+            for cid, meta in chunks.items():
+                doc = docs.get(meta.get("doc_id"))
+                session = self.sessions.get(doc["session_id"]) if doc else None
+                if session and session["collection"]:
+                    by_collection.setdefault(session["collection"], []).append(cid)
+            for tenant, ids in by_collection.items():
+                in_tenant.update(self.resources.tenant_collection(tenant).get(ids=ids, include=[])["ids"])
+        removable = []
+        for cid, meta in chunks.items():
+            doc = docs.get(meta.get("doc_id"))
+            if doc is None or doc["session_id"] != meta.get("session_id"):
+                removable.append(cid)
+            elif (canonical.get(cid, cid) != cid and canonical[cid] in present) or cid in in_tenant:
+                removable.append(cid)
+        return removable
+
+    def _reconcile_lexical(self, collections: Dict[str, object]) -> Dict[str, int]:
+        """Drop indexed chunks ChromaDB no longer holds and index the ones it holds but the index lacks.
+        The differences are found without the gate and checked again under it."""
+        indexed = self.lexical_index.chunk_ids()
+        missing: Dict[str, List[str]] = {}
+        stored: Set[str] = set()
+        for name, collection in collections.items():
+            ids = set(scan_collection(collection))
+            stored |= ids
+            missing[name] = list(ids - indexed)
+        stale = list(indexed - stored)
+        if not stale and not any(missing.values()):
+            return {"removed": 0, "added": 0}
+        added = 0
+        with self.gate.exclusive():
+            present: Set[str] = set()
+            for name, collection in collections.items():
+                for start in range(0, len(stale), MAINTENANCE_PAGE_SIZE):
+                    present.update(collection.get(ids=stale[start:start + MAINTENANCE_PAGE_SIZE], include=[])["ids"])
+                ids = missing[name]
+                for start in range(0, len(ids), MAINTENANCE_PAGE_SIZE):
+                    page = collection.get(ids=ids[start:start + MAINTENANCE_PAGE_SIZE], include=["documents", "metadatas"])
+                    self.lexical_index.add(page["ids"], page["documents"], page["metadatas"])    # Replaces, so no recheck
+                    added += len(page["ids"])
+            removed = self.lexical_index.delete_chunks([cid for cid in stale if cid not in present])
+        return {"removed": removed, "added": added}
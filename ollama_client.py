@@ -0,0 +1,153 @@
+"""Async client for Ollama's /api/generate.
+
+One pooled httpx.AsyncClient (keep-alive) is shared by all requests, a
+semaphore caps how many generations run at once, and identical prompts that
+are already being generated are coalesced: later callers subscribe to the
+running generation and receive the same tokens instead of starting another.
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+
+class OllamaError(Exception):
+    pass
+
+
+class _Generation:
+    """One running generation and the tokens it has produced so far"""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, token: Optional[str] = None, error: Optional[Exception] = None, done: bool = False):
+        async with self.changed:
+            if token:
+                self.tokens.append(token)
+            if error is not None:
+                self.error = error
+            self.done = self.done or done or error is not None
+            self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: index < len(self.tokens) or self.done)
+                new_tokens = self.tokens[index:]
+                finished, error = self.done, self.error
+            index += len(new_tokens)
+            for token in new_tokens:
+                yield token
+            if finished and index >= len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class OllamaClient:
+    def __init__(self, url: str, model: str, max_concurrency: int = 2, timeout: float = 60.0,
+                 connect_timeout: float = 5.0, max_connections: int = 10):
+        self.url = url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self._loop = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[Tuple[str, str], _Generation] = {}
+        self._tasks = set()
+        self.counters = {"generations": 0, "coalesced": 0, "failures": 0, "timeouts": 0, "fallbacks": 0}
+
+    def _ensure_client(self):
+        # Created lazily inside the running loop; a new loop (tests, reload) gets a fresh pool
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+            self._tasks = set()
+
+    async def _run(self, prompt: str, generation: _Generation):
+        async with self._semaphore:
+            self.counters["generations"] += 1
+            async with self._client.stream(
+                "POST", self.url, json={"model": self.model, "prompt": prompt, "stream": True}
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise OllamaError(f"Ollama returned HTTP {response.status_code}: {response.text[:200]}")
+                async for line in response.aiter_lines():    # One JSON object per line
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+                    await generation.publish(token=data.get("response", ""))
+                    if data.get("done"):
+                        break
+
+    async def _generate(self, prompt: str, generation: _Generation):
+        """Run one generation, publishing each token as Ollama streams it"""
+        try:
+            # The timeout includes time spent queued on the semaphore
+            await asyncio.wait_for(self._run(prompt, generation), self.timeout)
+            await generation.publish(done=True)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            self.counters["failures"] += 1
+            await generation.publish(error=OllamaError(f"Ollama generation timed out after {self.timeout}s"))
+        except Exception as e:
+            self.counters["failures"] += 1
+            await generation.publish(error=e if isinstance(e, OllamaError) else OllamaError(str(e)))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Tokens for `prompt`, joining an identical generation already in flight"""
+        self._ensure_client()
+        key = (self.model, prompt)
+        generation = self._inflight.get(key)
+        if generation is None:
+            generation = _Generation()
+            self._inflight[key] = generation
+            # The generation runs as its own task so it outlives any one subscriber
+            task = asyncio.create_task(self._generate(prompt, generation))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is generation else None)
+        else:
+            self.counters["coalesced"] += 1
+        async for token in generation.subscribe():
+            yield token
+
+    async def generate(self, prompt: str) -> str:
+        return "".join([token async for token in self.stream(prompt)])
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._loop = None
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "in_flight": len(self._inflight),
+            **self.counters
+        }
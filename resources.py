@@ -0,0 +1,432 @@
+"""Lazily initialised heavy resources: the ChromaDB client, the embedding model
+and the document collection.
+
+Vectors are always computed by the embedder here (see embedders.py), never by
+ChromaDB, so collections are opened without an embedding function. Instead each
+collection records the model id and vector width that wrote it, and opening one
+written by another model fails rather than mixing incomparable vectors.
+
+Nothing here is imported or loaded when backend.py is imported. The first
+caller that needs the collection (or the background warm-up started by the
+app's lifespan) pays the cost once, and the time each step took is recorded
+so /health can report cold-start cost. A failed load (ChromaDB unreachable, a
+model download cut short) is retried with exponential backoff, on the next access
+after the cooldown or by the warm-up thread; only a model mismatch is final.
+
+The stores belong to a single process: ChromaDB's PersistentClient is not safe
+across processes, and the write gate, caches and ingest jobs are in memory.
+`StoreLock` enforces that, so a second server or uvicorn worker on the same
+directory refuses to start instead of corrupting the index.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from embedders import DIMENSIONS_KEY, MODEL_KEY, EmbedderSpec, EmbeddingMismatchError, check_signature
+from telemetry import get_logger
+
+try:
+    import fcntl
+except ImportError:    # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger("resources")
+
+REBUILD_SUFFIX = "__rebuild"    # A collection being rebuilt is copied here, then renamed over the original
+IMPORT_SUFFIX = "__import"    # A snapshot is loaded here, then swapped in for the original
+REPLACED_SUFFIX = "__replaced"    # The original, set aside until the swap has succeeded
+
+STATE_COLD = "cold"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+INIT_RETRY_SECONDS = 5    # Cooldown after the first failed load, doubled after each further failure
+INIT_RETRY_MAX_SECONDS = 300
+
+
+class Resources:
+    def __init__(self, chroma_dir: str, embedder: EmbedderSpec, collection_name: str = "documents",
+                 started_at: Optional[float] = None):
+        self.chroma_dir = chroma_dir
+        self.embedder = embedder
+        self.model_name = embedder.model
+        self.dimensions: Optional[int] = None    # Width of the model's vectors, measured on load
+        self.collection_name = collection_name
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.state = STATE_COLD
+        self.error: Optional[str] = None
+        self.failures = 0    # Consecutive failed loads
+        self.retry_at: Optional[float] = None    # time.monotonic() after which a failed load is retried; None: never
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedding_function = None
+        self._collection = None
+        self._tenant_collections: Dict[str, object] = {}
+        self._warmup_thread: Optional[threading.Thread] = None
+        self.on_ready: List[Callable] = []    # Called with the collection once it is loaded
+
+    # ------------------------------------------------------------ initialisation
+
+    def _timed(self, name: str, start: float):
+        self.timings[name] = round(time.perf_counter() - start, 4)
+
+    def _settled(self) -> bool:
+        """Loaded, or failed and still cooling down"""
+        if self.state == STATE_FAILED:
+            return self.retry_at is None or time.monotonic() < self.retry_at
+        return self.state == STATE_READY
+
+    def _init(self):
+        if self._settled():
+            return
+        with self._lock:
+            if self._settled():
+                return
+            self.state = STATE_LOADING
+            try:
+                t = time.perf_counter()
+                import chromadb
+                self._timed("import_chromadb_s", t)
+                t = time.perf_counter()
+                self._client = chromadb.PersistentClient(path=self.chroma_dir)
+                self._recover_rebuilds()
+                self._timed("client_s", t)
+                t = time.perf_counter()
+                self._embedding_function = self.embedder.build()
+                self.dimensions = len(self._embedding_function(["dimension check"])[0])
+                self._timed("model_load_s", t)
+                t = time.perf_counter()
+                self._collection = self._open(self.collection_name)
+                self._timed("collection_s", t)
+                self.state = STATE_READY
+                self.error, self.failures, self.retry_at = None, 0, None
+                self._timed("time_to_ready_s", self.started_at)
+                logger.info("ChromaDB initialized", extra={"chunks": self._collection.count(), **self.timings})
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                self.failures += 1
+                self._client = self._embedding_function = self._collection = None
+                self._tenant_collections.clear()
+                if isinstance(e, EmbeddingMismatchError):    # The store itself is incompatible: retrying can't help
+                    self.retry_at = None
+                else:
+                    cooldown = min(INIT_RETRY_MAX_SECONDS, INIT_RETRY_SECONDS * 2 ** (self.failures - 1))
+                    self.retry_at = time.monotonic() + cooldown
+                logger.error("ChromaDB initialization failed", extra={"error": str(e), "failures": self.failures,
+                                                                      "retry_in_s": self._retry_in()})
+                return
+            for callback in self.on_ready:
+                try:
+                    callback(self._collection)
+                except Exception as e:
+                    logger.error("On-ready callback failed",
+                                 extra={"callback": getattr(callback, "__name__", str(callback)), "error": str(e)})
+
+    def _recover_rebuilds(self):
+        """Finish or discard rebuilds and snapshot imports interrupted by a crash
+        (see copy_collection and swap_imported)"""
+        names = {collection.name for collection in self._client.list_collections()}
+        for name in sorted(names):
+            if name.endswith(REBUILD_SUFFIX):
+                original = name[:-len(REBUILD_SUFFIX)]
+                if original in names:    # Interrupted while copying: the original is intact
+                    self._client.delete_collection(name=name)
+                else:    # Interrupted between dropping the original and renaming the copy
+                    self._client.get_collection(name=name, embedding_function=None).modify(name=original)
+            elif name.endswith(REPLACED_SUFFIX):    # An import that never finished: the original goes back
+                original = name[:-len(REPLACED_SUFFIX)]
+                if original in names:
+                    self._client.delete_collection(name=original)
+                self._client.get_collection(name=name, embedding_function=None).modify(name=original)
+            elif name.endswith(IMPORT_SUFFIX):
+                original = name[:-len(IMPORT_SUFFIX)]
+                self._client.delete_collection(name=name)
+            else:
+                continue
+            logger.warning("Recovered interrupted collection swap", extra={"collection": original})
+
+    def _signature(self) -> Dict:
+        return {MODEL_KEY: self.embedder.model_id, DIMENSIONS_KEY: self.dimensions}
+
+    def _open(self, name: str):
+        """Get or create a collection, refusing one whose vectors come from another model"""
+        collection = self._client.get_or_create_collection(name=name, embedding_function=None,
+                                                           metadata=self._signature())
+        metadata = collection.metadata or {}
+        if MODEL_KEY in metadata:
+            check_signature(metadata, self.embedder.model_id, self.dimensions, name)
+            return collection
+        # Written before models were recorded: all we can check is the width of a stored vector
+        peek = collection.get(limit=1, include=["embeddings"])
+        if len(peek["ids"]):
+            check_signature({DIMENSIONS_KEY: len(peek["embeddings"][0])}, self.embedder.model_id, self.dimensions, name)
+        if not any(key.startswith("hnsw:") for key in metadata):    # modify() refuses index settings
+            collection.modify(metadata={**metadata, **self._signature()})
+            logger.warning("Recorded the embedding model of an existing collection",
+                           extra={"collection": name, "chunks": collection.count(), **self._signature()})
+        return collection
+
+    def _retry_in(self) -> Optional[float]:
+        if self.state != STATE_FAILED or self.retry_at is None:
+            return None
+        return round(max(0.0, self.retry_at - time.monotonic()), 1)
+
+    def warm_up(self):
+        """Load everything and run one embedding so the first real request is fast,
+        retrying a failed load until it succeeds (or fails for good)"""
+        t = time.perf_counter()
+        self._init()
+        while self.state == STATE_FAILED and self.retry_at is not None:
+            time.sleep(max(0.0, self.retry_at - time.monotonic()))
+            self._init()
+        if self.state == STATE_READY:
+            try:
+                self._embedding_function(["warm up"])
+            except Exception as e:
+                logger.warning("Embedding warm-up failed", extra={"error": str(e)})
+        self._timed("warmup_s", t)
+
+    def start_warm_up(self) -> threading.Thread:
+        """Warm up on a background thread; the server accepts connections meanwhile"""
+        if self._warmup_thread is None or (not self._warmup_thread.is_alive() and self.state != STATE_READY):
+            self._warmup_thread = threading.Thread(target=self.warm_up, name="resources-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    # ------------------------------------------------------------ accessors
+
+    @property
+    def ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def client(self):
+        self._init()
+        return self._client
+
+    def collection(self):
+        """The document collection, loading it on first use; None if initialisation failed"""
+        self._init()
+        return self._collection
+
+    def tenant_collection(self, name: str):
+        """A named collection sharing the client and model (one per large tenant); None if unavailable"""
+        if not name or name == self.collection_name:
+            return self.collection()
+        self._init()
+        if self._client is None:
+            return None
+        with self._lock:
+            if name not in self._tenant_collections:
+                self._tenant_collections[name] = self._open(name)
+            return self._tenant_collections[name]
+
+    def embedding_function(self):
+        self._init()
+        return self._embedding_function
+
+    def embed(self, texts: List[str]) -> List:
+        embedding_function = self.embedding_function()
+        if embedding_function is None:
+            raise RuntimeError(f"Embedding model unavailable: {self.error}")
+        return embedding_function(texts)
+
+    def count(self) -> Optional[int]:
+        """Chunks in the collection, without triggering initialisation (None until ready)"""
+        if self.state != STATE_READY:
+            return None
+        return self._collection.count()
+
+    def drop_collection(self, name: Optional[str] = None):
+        """Delete a collection; the document collection is recreated empty so its handle stays valid"""
+        client = self.client()
+        if client is None:
+            return
+        with self._lock:
+            client.delete_collection(name=name or self.collection_name)
+            self._tenant_collections.pop(name, None)
+            if not name or name == self.collection_name:
+                self._collection = self._open(self.collection_name)
+
+    def copy_collection(self, name: Optional[str] = None, page_size: int = 1000) -> Optional[int]:
+        """First half of a rebuild: copy a collection's chunks (stored vectors included, nothing
+        is re-embedded) into a fresh staging collection. Writers may run meanwhile, so the
+        copy is only good if nothing was written (see Maintenance._rebuild). Returns chunks
+        copied, or None when ChromaDB is unavailable."""
+        name = name or self.collection_name
+        client = self.client()
+        if client is None:
+            return None
+        old = client.get_collection(name=name, embedding_function=None)
+        self.discard_rebuild(name)
+        new = client.create_collection(name=name + REBUILD_SUFFIX, embedding_function=None,
+                                       metadata=old.metadata or None)    # Keeps the model and index settings (e.g. hnsw:space)
+        copied = 0
+        while True:
+            page = old.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=copied)
+            if not page["ids"]:
+                break
+            new.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                    metadatas=page["metadatas"])
+            copied += len(page["ids"])
+        return copied
+
+    def swap_rebuilt(self, name: Optional[str] = None):
+        """Second half: the staging copy takes the collection's name, leaving deleted entries
+        and index fragmentation behind. Callers must keep writers out meanwhile."""
+        name = name or self.collection_name
+        client = self.client()
+        with self._lock:
+            old = client.get_collection(name=name, embedding_function=None)
+            new = client.get_collection(name=name + REBUILD_SUFFIX, embedding_function=None)
+            if new.count() != old.count():
+                client.delete_collection(name=new.name)
+                raise RuntimeError(f"Rebuild of {name} copied {new.count()} of {old.count()} chunks; original kept")
+            client.delete_collection(name=name)
+            new.modify(name=name)
+            if name == self.collection_name:
+                self._collection = new
+            else:
+                self._tenant_collections[name] = new
+
+    def create_import(self, name: str):
+        """An empty collection, signed by the current model, to load a snapshot's copy of `name` into"""
+        client = self.client()
+        self.discard_imports([name])
+        return client.create_collection(name=name + IMPORT_SUFFIX, embedding_function=None,
+                                        metadata=self._signature())
+
+    def discard_imports(self, names: List[str]):
+        client = self.client()
+        existing = {collection.name for collection in client.list_collections()} if client is not None else set()
+        for name in names:
+            if name + IMPORT_SUFFIX in existing:
+                client.delete_collection(name=name + IMPORT_SUFFIX)
+
+    def swap_imported(self, names: List[str]):
+        """Rename the collections loaded by `create_import` over `names`, setting the originals
+        aside; if a rename fails, everything is put back. `finish_import` then deletes the
+        originals, or `revert_import` restores them. Callers keep writers out meanwhile."""
+        client = self.client()
+        with self._lock:
+            existing = {collection.name for collection in client.list_collections()}
+            set_aside, swapped = [], []
+            try:
+                for name in names:
+                    if name in existing:
+                        client.get_collection(name=name, embedding_function=None).modify(name=name + REPLACED_SUFFIX)
+                        set_aside.append(name)
+                    client.get_collection(name=name + IMPORT_SUFFIX, embedding_function=None).modify(name=name)
+                    swapped.append(name)
+            except BaseException:
+                self._put_back(swapped, set_aside)
+                raise
+            finally:
+                self._reopen()
+
+    def finish_import(self, names: List[str], drop: List[str]):
+        """Delete the originals set aside by `swap_imported`, and the collections in `drop`"""
+        client = self.client()
+        with self._lock:
+            existing = {collection.name for collection in client.list_collections()}
+            for name in names:
+                if name + REPLACED_SUFFIX in existing:
+                    client.delete_collection(name=name + REPLACED_SUFFIX)
+            for name in drop:
+                if name in existing and name not in names:
+                    client.delete_collection(name=name)
+            self._reopen()
+
+    def revert_import(self, names: List[str]):
+        """Undo `swap_imported`: the imported collections are dropped and the originals return"""
+        client = self.client()
+        with self._lock:
+            existing = {collection.name for collection in client.list_collections()}
+            self._put_back(names, [name for name in names if name + REPLACED_SUFFIX in existing])
+            self.discard_imports(names)
+            self._reopen()
+
+    def _put_back(self, swapped: List[str], set_aside: List[str]):
+        client = self._client
+        for name in swapped:
+            client.get_collection(name=name, embedding_function=None).modify(name=name + IMPORT_SUFFIX)
+        for name in set_aside:
+            client.get_collection(name=name + REPLACED_SUFFIX, embedding_function=None).modify(name=name)
+
+    def _reopen(self):
+        """Drop collection handles made stale by renames"""
+        self._tenant_collections.clear()
+        self._collection = self._open(self.collection_name)
+
+    def discard_rebuild(self, name: Optional[str] = None):
+        """Drop a staging copy that will not be swapped in"""
+        client = self.client()
+        staging = (name or self.collection_name) + REBUILD_SUFFIX
+        if client is not None and staging in {collection.name for collection in client.list_collections()}:
+            client.delete_collection(name=staging)
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "retry_in_s": self._retry_in(),
+            "embedding_model": self.embedder.model_id,
+            "embedding_backend": self.embedder.backend,
+            "embedding_dimensions": self.dimensions,
+            "timings": dict(self.timings)
+        }
+
+
+class StoreLockedError(RuntimeError):
+    pass
+
+
+class StoreLock:
+    """Exclusive lock on a store directory, held for the life of the process.
+
+    The operating system drops the lock when the process exits, so a crashed
+    server never leaves a stale lock behind.
+    """
+
+    def __init__(self, directory: str, filename: str = ".lock"):
+        self.path = os.path.join(directory, filename)
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return
+        f = open(self.path, "a+")
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            try:
+                f.seek(0)
+                owner = f.read().strip()
+            except OSError:    # Windows refuses reads of a range another process has locked
+                owner = ""
+            f.close()
+            raise StoreLockedError(f"{os.path.dirname(self.path) or '.'} is in use by {owner or 'another process'}; "
+                                   f"run one server (a single uvicorn worker) per store") from None
+        f.seek(0)
+        f.truncate()
+        f.write(f"pid {os.getpid()}")
+        f.flush()
+        self._file = f
+
+    def release(self):
+        if self._file is None:
+            return
+        if not fcntl:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()    # Closing the file releases the flock
+        self._file = None
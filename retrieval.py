@@ -0,0 +1,150 @@
+"""Combining and re-ranking dense (ChromaDB) and lexical (BM25) results for /chat.
+
+Results are kept in the shape `collection.query` returns for a single query
+(lists nested one level per query), so the chat code reads them the same way
+whichever retriever produced them.
+"""
+import re
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+RRF_K = 60
+MODES = ("hybrid", "vector", "lexical")
+
+
+def empty_results() -> Dict:
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "scores": [[]]}
+
+
+def from_lexical(hits: List[Dict]) -> Dict:
+    """Query-shaped results from LexicalIndex.search hits"""
+    return {
+        "ids": [[hit["id"] for hit in hits]],
+        "documents": [[hit["document"] for hit in hits]],
+        "metadatas": [[hit["metadata"] for hit in hits]],
+        "distances": [[None] * len(hits)],
+        "scores": [[hit["score"] for hit in hits]]
+    }
+
+
+def split_results(results: Dict) -> List[Dict]:
+    """Single-query results for each query of a multi-query `collection.query`"""
+    fields = [field for field in ("ids", "documents", "metadatas", "distances") if results.get(field) is not None]
+    return [{field: [results[field][i]] for field in fields} for i in range(len(results["ids"]))]
+
+
+def reciprocal_rank_fusion(rankings: List[Dict], n_results: int, k: int = RRF_K) -> Dict:
+    """Fuse query-shaped result sets by reciprocal rank: score = sum of 1 / (k + rank).
+    Only ranks matter, so BM25 scores and cosine distances never need calibrating."""
+    fused: Dict[str, float] = {}
+    entries: Dict[str, Dict] = {}
+    for results in rankings:
+        distances = results.get("distances") or [[None] * len(results["ids"][0])]
+        for rank, (cid, document, metadata, distance) in enumerate(zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], distances[0]), 1):
+            fused[cid] = fused.get(cid, 0.0) + 1.0 / (k + rank)
+            entry = entries.setdefault(cid, {"document": document, "metadata": metadata, "distance": None})
+            if distance is not None:
+                entry["distance"] = distance
+    top = sorted(fused, key=fused.get, reverse=True)[:n_results]
+    return {
+        "ids": [top],
+        "documents": [[entries[cid]["document"] for cid in top]],
+        "metadatas": [[entries[cid]["metadata"] for cid in top]],
+        "distances": [[entries[cid]["distance"] for cid in top]],
+        "scores": [[fused[cid] for cid in top]]
+    }
+
+
+# ---------------------------------------------------------------- re-ranking
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+PAGE_MARKER_RE = re.compile(r"^--- Page \d+ ---$")
+
+
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "scores")
+
+
+def select(results: Dict, order: List[int]) -> Dict:
+    """Query-shaped results restricted to the candidates at `order`, in that order"""
+    selected = {field: [[results[field][0][i] for i in order]] for field in RESULT_FIELDS if results.get(field)}
+    selected.setdefault("scores", [[None] * len(order)])
+    return selected
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def cosine_scores(query_vector, vectors) -> np.ndarray:
+    """Cosine similarity of every row of `vectors` to the query, in one matrix product"""
+    return normalize_rows(vectors) @ normalize_rows(query_vector)[0]
+
+
+def top_k(scores, k: int) -> List[int]:
+    """Positions of the `k` highest scores, best first (ties keep retrieval order)"""
+    return np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")[:k].tolist()
+
+
+def fuse_with_retrieval_order(scores, k: int = RRF_K) -> np.ndarray:
+    """Reciprocal-rank blend of the retrieval order and the order by `scores`.
+    Cosine against the same model that ran the dense search only restates its ranking,
+    so on its own it would undo the credit lexical hits earned in fusion."""
+    scores = np.asarray(scores, dtype=np.float64)
+    score_rank = np.empty(len(scores))
+    score_rank[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+    return 1.0 / (k + np.arange(1, len(scores) + 1)) + 1.0 / (k + score_rank)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Distinct sentences long enough to be worth quoting (more than three words)"""
+    sentences = (s.strip() for s in SENTENCE_SPLIT_RE.split(text))
+    return list(dict.fromkeys(s for s in sentences if len(s.split()) > 3 and not PAGE_MARKER_RE.match(s)))
+
+
+def lead_sentences(chunks: List[str], per_chunk: int) -> List[List[str]]:
+    """Opening sentences of each chunk: the highlight when there is no time or model to rank them"""
+    return [split_sentences(chunk)[:per_chunk] for chunk in chunks]
+
+
+def top_sentences(query_vector, sentences_by_chunk: List[List[str]], sentence_vectors, per_chunk: int) -> List[List[str]]:
+    """The `per_chunk` sentences of each chunk closest to the query, kept in reading order.
+    All sentences of all chunks are scored with a single matrix product."""
+    counts = np.fromiter((len(s) for s in sentences_by_chunk), dtype=np.int64, count=len(sentences_by_chunk))
+    if not counts.sum():
+        return [[] for _ in sentences_by_chunk]
+    scores = cosine_scores(query_vector, sentence_vectors)
+    group = np.repeat(np.arange(len(counts)), counts)
+    order = np.lexsort((-scores, group))    # By chunk, best sentence first
+    group_start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order)) - group_start[group[order]]
+    keep = np.flatnonzero(rank < per_chunk)    # Flat positions, already in reading order
+    flat = [sentence for sentences in sentences_by_chunk for sentence in sentences]
+    selected = [[] for _ in sentences_by_chunk]
+    for i in keep:
+        selected[group[i]].append(flat[i])
+    return selected
+
+
+class CrossEncoderReranker:
+    """Optional cross-encoder (sentence-transformers) that scores (query, chunk) pairs in one batch.
+    The model is loaded on first use."""
+
+    def __init__(self, model_name: str, batch_size: int = 32):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+        return np.asarray(self._model.predict([(query, text) for text in texts], batch_size=self.batch_size))
@@ -202,15 +202,25 @@ let currentDocumentName = null;
                 selectedFiles.forEach((file, index) => {    // Add all files to FormData
                     formData.append('files', file);
                 });
-                const response = await fetch(`${API_BASE}/upload-multiple`, { // Send request
+                const response = await fetch(`${API_BASE}/jobs`, { // Queue an ingest job, returns at once
                     method: 'POST',
                     body: formData
                 });
-                const result = await response.json();
-                progressBar.style.width = '100%';   // Update progress
-                progressText.textContent = `${result.successful}/${selectedFiles.length}`;
+                const accepted = await response.json();
+                if (accepted.status !== 'accepted') {
+                    throw new Error(accepted.message || 'Upload was not accepted');
+                }
+                currentFile.textContent = 'Queued for processing...';
+                const job = await pollJob(accepted.job_id, (job) => {   // Update progress while the job runs
+                    progressBar.style.width = `${Math.round(job.completed_files / job.total_files * 100)}%`;
+                    progressText.textContent = `${job.completed_files}/${job.total_files}`;
+                    currentFile.textContent = describeJobProgress(job);
+                });
+                const successfulFiles = job.files.filter(file => file.stage === 'done');
+                const failedFiles = job.files.filter(file => file.stage !== 'done');
+                progressBar.style.width = '100%';
                 currentFile.textContent = 'Complete!';
-                if (result.status === 'success' || result.status === 'partial') {
+                if (successfulFiles.length > 0) {
                     // Show success summary
                     let successHTML = `
                         <div style="background: #d4edda; padding: 20px; border-radius: 8px; border-left: 4px solid #28a745;">
@@ -219,32 +229,28 @@ let currentDocumentName = null;
                                 <div>
                                     <strong style="color: #155724; font-size: 18px;">Upload Complete!</strong>
                                     <div style="color: #0c5460;">
-                                        ${result.message}
+                                        Successfully uploaded ${successfulFiles.length} file(s) to current session${failedFiles.length ? `, ${failedFiles.length} failed` : ''}
                                     </div>
                                 </div>
                             </div>
-                    `;
-                    if (result.successful > 0) {
-                        successHTML += `
                             <div style="margin-top: 15px;">
                                 <strong>Successfully uploaded:</strong>
                                 <ul style="margin: 10px 0 0 20px; padding: 0;">
-                        `;
-                        result.successful_files.forEach(file => {
-                            successHTML += `<li style="margin-bottom: 5px;">📄 ${file.filename}</li>`;
-                        });
-                        successHTML += `
+                    `;
+                    successfulFiles.forEach(file => {
+                        successHTML += `<li style="margin-bottom: 5px;">📄 ${file.filename}</li>`;
+                    });
+                    successHTML += `
                                 </ul>
                             </div>
-                        `;
-                    }
-                    if (result.failed > 0) {
+                    `;
+                    if (failedFiles.length > 0) {
                         successHTML += `
                             <div style="margin-top: 15px;">
                                 <strong style="color: #856404;">Failed to upload:</strong>
                                 <ul style="margin: 10px 0 0 20px; padding: 0;">
                         `;
-                        result.failed_files.forEach(file => {
+                        failedFiles.forEach(file => {
                             successHTML += `<li style="margin-bottom: 5px; color: #856404;">❌ ${file.filename}: ${file.error}</li>`;
                         });
                         successHTML += `
@@ -254,7 +260,7 @@ let currentDocumentName = null;
                     }
                     successHTML += `
                             <div style="margin-top: 15px; font-size: 14px; color: #6c757d;">
-                                Processing time: ${result.processing_time}
+                                Processing time: ${((new Date(job.finished_at) - new Date(job.created_at)) / 1000).toFixed(2)}s
                             </div>
                         </div>
                     `;
@@ -268,7 +274,7 @@ let currentDocumentName = null;
                         <div style="background: #f8d7da; padding: 15px; border-radius: 8px; border-left: 4px solid #dc3545;">
                             <strong style="color: #721c24;">Upload Failed</strong>
                             <div style="margin-top: 5px; color: #856404;">
-                                ${result.message || 'Unknown error occurred'}
+                                ${failedFiles.map(file => `${file.filename}: ${file.error || 'Unknown error'}`).join('<br>') || 'Unknown error occurred'}
                             </div>
                         </div>
                     `, 'error');
@@ -277,9 +283,9 @@ let currentDocumentName = null;
                 console.error('Upload error:', error);
                 showUploadStatus(`
                     <div style="background: #f8d7da; padding: 15px; border-radius: 8px; border-left: 4px solid #dc3545;">
-                        <strong style="color: #721c24;">Connection Error</strong>
+                        <strong style="color: #721c24;">Upload Error</strong>
                         <div style="margin-top: 5px; color: #856404;">
-                            Make sure the backend server is running at http://localhost:8000
+                            ${error.message || 'Make sure the backend server is running at http://localhost:8000'}
                         </div>
                     </div>
                 `, 'error');
@@ -291,84 +297,153 @@ let currentDocumentName = null;
             }
         }
 
+        // Poll an ingest job until every file has finished
+        async function pollJob(jobId, onProgress, intervalMs = 1000) {
+            while (true) {
+                const response = await fetch(`${API_BASE}/jobs/${jobId}`);
+                const result = await response.json();
+                if (result.status !== 'success') {
+                    throw new Error(result.message || 'Lost track of upload job');
+                }
+                onProgress(result.job);
+                if (result.job.finished_at) {
+                    return result.job;
+                }
+                await new Promise(resolve => setTimeout(resolve, intervalMs));
+            }
+        }
+
+        // One-line summary of the file currently being processed
+        function describeJobProgress(job) {
+            const active = job.files.find(file => !['queued', 'done', 'skipped', 'failed'].includes(file.stage));
+            if (!active) {
+                return job.completed_files < job.total_files ? 'Waiting in queue...' : 'Finishing...';
+            }
+            if (active.stage === 'extracting' && active.pages_total) {   // Pages are embedded while extraction continues
+                return `${active.filename}: page ${active.pages_extracted}/${active.pages_total}, ${active.chunks_embedded} chunks embedded`;
+            }
+            if (active.stage === 'embedding') {
+                return `${active.filename}: embedding chunk ${active.chunks_embedded}/${active.chunks_total}`;
+            }
+            return `${active.filename}: ${active.stage}...`;
+        }
+
         // Helper function to show upload status
         function showUploadStatus(message, type = 'info') {
             const uploadStatus = document.getElementById('uploadStatus');
             uploadStatus.innerHTML = message;
             uploadStatus.scrollIntoView({ behavior: 'smooth', block: 'nearest' });  // Scroll to status
         }
-        async function loadDocuments() {    // Load documents
-        const documentList = document.getElementById('documentList');
-        documentList.innerHTML = `
-            <div style="text-align: center; padding: 30px;">
-                <div class="spinner" style="border-top-color: #3498db; width: 40px; height: 40px; margin: 0 auto 15px;"></div>
-                <p>Loading session documents...</p>
-            </div>
-        `;
-        try {
-            const response = await fetch(`${API_BASE}/ui-documents`);
-            const result = await response.json();
-            console.log('Loaded documents:', result); // Debug log
-            if (result.status === 'success' && result.documents.length > 0) {
-                documentList.innerHTML = '';
-                document.getElementById('docCount').textContent = result.documents.length;  // Update document count
-                result.documents.forEach(doc => {
-                    const card = document.createElement('div');
-                    card.className = 'document-card';
-                    card.setAttribute('data-doc-id', doc.id);
-                    card.innerHTML = `
-                        <div class="document-header">
-                            <div class="document-title">📄 ${doc.filename}</div>
-                            <div style="font-size: 12px; color: #7f8c8d;">
-                                ${new Date(doc.uploaded_at).toLocaleDateString()}
-                            </div>
-                        </div>
-                        <div class="document-meta">
-                            <div>Size: ${Math.ceil(doc.size / 1024)} KB</div>
-                            <div style="margin-top: 5px; color: #95a5a6; font-size: 12px;">
-                                ${doc.preview}
-                            </div>
-                        </div>
-                        <div class="document-actions">
-                            <button class="action-btn view-btn" onclick="viewDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
-                                View
-                            </button>
-                            <button class="action-btn edit-btn" onclick="editDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
-                                Edit
-                            </button>
-                            <button class="action-btn delete-btn" onclick="deleteDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
-                                Delete
-                            </button>
-                        </div>
-                    `;
-                    documentList.appendChild(card);
-                });
-                
-                // Show session info
-                const sessionInfo = document.createElement('div');
-                sessionInfo.style.cssText = `
-                    text-align: center; 
-                    margin-top: 20px; 
-                    padding: 10px; 
-                    background: #f8f9fa; 
-                    border-radius: 8px; 
-                    font-size: 12px; 
-                    color: #6c757d;
-                `;
-                sessionInfo.innerHTML = `
-                    <div>Session ID: ${result.session_id || 'N/A'}</div>
-                    <div>Documents in session: ${result.count} | Total in database: ${result.total_in_chromadb || 0}</div>
-                `;
-                documentList.appendChild(sessionInfo);
-            } else {
-                documentList.innerHTML = `
+        const DOCUMENTS_PAGE_SIZE = 50;
+        const DOCUMENT_FIELDS = 'id,filename,uploaded_at,size,preview';    // Only what the cards show
+        let documentsTotal = 0;
+        function emptyDocumentsHTML() {
+            return `
                     <div style="text-align: center; padding: 40px; color: #7f8c8d;">
                         <div style="font-size: 48px; margin-bottom: 20px;">📁</div>
                         <h4>No documents in current session</h4>
                         <p>Upload documents to get started!</p>
                     </div>
                 `;
-                document.getElementById('docCount').textContent = '0';
+        }
+        function renderDocumentCard(doc) {
+            const card = document.createElement('div');
+            card.className = 'document-card';
+            card.setAttribute('data-doc-id', doc.id);
+            card.innerHTML = `
+                <div class="document-header">
+                    <div class="document-title">📄 ${doc.filename}</div>
+                    <div style="font-size: 12px; color: #7f8c8d;">
+                        ${new Date(doc.uploaded_at).toLocaleDateString()}
+                    </div>
+                </div>
+                <div class="document-meta">
+                    <div class="document-size">Size: ${Math.ceil(doc.size / 1024)} KB</div>
+                    <div class="document-preview" style="margin-top: 5px; color: #95a5a6; font-size: 12px;">
+                        ${doc.preview}
+                    </div>
+                </div>
+                <div class="document-actions">
+                    <button class="action-btn view-btn" onclick="viewDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
+                        View
+                    </button>
+                    <button class="action-btn edit-btn" onclick="editDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
+                        Edit
+                    </button>
+                    <button class="action-btn delete-btn" onclick="deleteDocument('${doc.id}', '${doc.filename.replace(/'/g, "\\'")}')">
+                        Delete
+                    </button>
+                </div>
+            `;
+            return card;
+        }
+        function renderSessionInfo(sessionId) {
+            const sessionInfo = document.createElement('div');
+            sessionInfo.id = 'sessionInfo';
+            sessionInfo.style.cssText = `
+                text-align: center; 
+                margin-top: 20px; 
+                padding: 10px; 
+                background: #f8f9fa; 
+                border-radius: 8px; 
+                font-size: 12px; 
+                color: #6c757d;
+            `;
+            sessionInfo.innerHTML = `
+                <div>Session ID: ${sessionId || 'N/A'}</div>
+                <div>Documents in session: <span id="sessionDocCount">${documentsTotal}</span></div>
+            `;
+            return sessionInfo;
+        }
+        function setDocumentsTotal(total) {
+            documentsTotal = total;
+            document.getElementById('docCount').textContent = total;  // Update document count
+            const sessionCount = document.getElementById('sessionDocCount');
+            if (sessionCount) sessionCount.textContent = total;
+        }
+        async function loadDocuments(cursor = null) {    // Load documents, one page at a time
+        const documentList = document.getElementById('documentList');
+        if (!cursor) {
+            documentList.innerHTML = `
+                <div style="text-align: center; padding: 30px;">
+                    <div class="spinner" style="border-top-color: #3498db; width: 40px; height: 40px; margin: 0 auto 15px;"></div>
+                    <p>Loading session documents...</p>
+                </div>
+            `;
+        }
+        try {
+            // The server sends an ETag; unchanged pages are revalidated with a 304 by the browser cache
+            const params = new URLSearchParams({ limit: DOCUMENTS_PAGE_SIZE, fields: DOCUMENT_FIELDS });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`${API_BASE}/ui-documents?${params}`);
+            const result = await response.json();
+            if (result.status === 'success' && (cursor || result.documents.length > 0)) {
+                const loadMore = document.getElementById('loadMoreDocuments');
+                if (loadMore) loadMore.remove();
+                if (!cursor) {
+                    documentList.innerHTML = '';
+                    documentList.appendChild(renderSessionInfo(result.session_id));
+                    setDocumentsTotal(result.total);
+                }
+                const sessionInfo = document.getElementById('sessionInfo');
+                result.documents.forEach(doc => documentList.insertBefore(renderDocumentCard(doc), sessionInfo));
+                if (result.next_cursor) {
+                    const button = document.createElement('button');
+                    button.id = 'loadMoreDocuments';
+                    button.className = 'action-btn view-btn';
+                    button.style.cssText = 'display: block; margin: 15px auto;';
+                    button.textContent = `Load more (${document.querySelectorAll('.document-card').length} of ${documentsTotal})`;
+                    button.onclick = () => {
+                        button.disabled = true;
+                        loadDocuments(result.next_cursor);
+                    };
+                    documentList.insertBefore(button, sessionInfo);
+                }
+            } else if (result.status === 'success') {
+                documentList.innerHTML = emptyDocumentsHTML();
+                setDocumentsTotal(0);
+            } else {
+                throw new Error(result.message);
             }
         } catch (error) {
             console.error('Load documents error:', error);
@@ -383,32 +458,68 @@ let currentDocumentName = null;
         }
     }
         // View document
+        const VIEW_WINDOW_CHARS = 64 * 1024;    // Characters fetched per request while viewing
+        let viewer = null;    // { docId, nextOffset, loading, scroller }
+        function scrollParent(element) {    // The element that actually scrolls the viewer text
+            for (let node = element; node && node !== document.body; node = node.parentElement) {
+                const overflowY = getComputedStyle(node).overflowY;
+                if (overflowY === 'auto' || overflowY === 'scroll') return node;
+            }
+            return element;
+        }
+        async function loadNextWindow() {
+            if (!viewer || viewer.loading || viewer.nextOffset === null) return;
+            const state = viewer;
+            state.loading = true;
+            try {
+                const params = new URLSearchParams({ offset: state.nextOffset, length: VIEW_WINDOW_CHARS });
+                const response = await fetch(`${API_BASE}/ui-documents/${state.docId}?${params}`);
+                const result = await response.json();
+                if (viewer !== state) return;    // Closed or switched documents meanwhile
+                if (result.status !== 'success') throw new Error(result.message);
+                const viewContent = document.getElementById('viewContent');
+                viewContent.appendChild(document.createTextNode(result.document.content));
+                state.nextOffset = result.document.next_offset;
+            } finally {
+                state.loading = false;
+            }
+            // Keep filling until the text overflows the viewer, then wait for the user to scroll
+            const scroller = state.scroller;
+            if (viewer === state && scroller.scrollHeight <= scroller.clientHeight + 200) loadNextWindow().catch(reportViewError);
+        }
+        function reportViewError(error) {
+            console.error('View document error:', error);
+            showToast(' Error loading more of the document', 'error');
+        }
+        function onViewerScroll() {
+            const scroller = viewer && viewer.scroller;
+            if (scroller && scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 1000) loadNextWindow().catch(reportViewError);
+        }
         async function viewDocument(docId, docName) {
             currentDocumentId = docId;
             currentDocumentName = docName;
             
             document.getElementById('viewModalTitle').textContent = `Viewing: ${docName}`;
-            
+            const viewContent = document.getElementById('viewContent');
+            viewContent.textContent = '';
+            // Show modal, then stream the text into it window by window as the user scrolls
+            document.getElementById('viewModalOverlay').style.display = 'block';
+            document.getElementById('viewModal').style.display = 'block';
+            if (viewer) viewer.scroller.removeEventListener('scroll', onViewerScroll);
+            viewer = { docId, nextOffset: 0, loading: false, scroller: scrollParent(viewContent) };
+            viewer.scroller.addEventListener('scroll', onViewerScroll);
             try {
-                const response = await fetch(`${API_BASE}/ui-documents/${docId}`);
-                const result = await response.json();
-                if (result.status === 'success') {
-                    const content = result.document.content;
-                    document.getElementById('viewContent').textContent = content;
-                    // Show modal
-                    document.getElementById('viewModalOverlay').style.display = 'block';
-                    document.getElementById('viewModal').style.display = 'block';
-                } else {
-                    alert('Error loading document: ' + result.message);
-                }
+                await loadNextWindow();
             } catch (error) {
-                alert('Error loading document');
+                alert('Error loading document' + (error.message ? ': ' + error.message : ''));
                 console.error('View document error:', error);
             }
         }
 
         // Close view modal
         function closeViewModal() {
+            if (viewer) viewer.scroller.removeEventListener('scroll', onViewerScroll);
+            viewer = null;
             document.getElementById('viewModalOverlay').style.display = 'none';
             document.getElementById('viewModal').style.display = 'none';
             currentDocumentId = null;
@@ -471,8 +582,12 @@ let currentDocumentName = null;
                 });
                 const result = await response.json();
                 if (result.status === 'success') {
+                    const card = document.querySelector(`[data-doc-id="${currentDocumentId}"]`);
+                    if (card) {    // Update the card in place rather than reloading the list
+                        card.querySelector('.document-size').textContent = `Size: ${Math.ceil(result.size / 1024)} KB`;
+                        card.querySelector('.document-preview').textContent = result.preview;
+                    }
                     closeEditModal();   // Close modal
-                    loadDocuments();    // Reload documents
                     showToast('✅ Document saved successfully!', 'success');    // Show success message
                 } else {
                     alert('Error saving document: ' + result.message);
@@ -511,26 +626,18 @@ let currentDocumentName = null;
                         card.style.transition = 'opacity 0.3s';
                         setTimeout(() => {
                             card.remove();
-                            // Update document count
-                            const remainingCards = document.querySelectorAll('.document-card').length;
-                            document.getElementById('docCount').textContent = remainingCards;
+                            setDocumentsTotal(Math.max(0, documentsTotal - 1));
                             // If no cards left, show empty message
-                            if (remainingCards === 0) {
-                                document.getElementById('documentList').innerHTML = `
-                                    <div style="text-align: center; padding: 40px; color: #7f8c8d;">
-                                        <div style="font-size: 48px; margin-bottom: 20px;">📁</div>
-                                        <h4>No documents in current session</h4>
-                                        <p>Upload documents to get started!</p>
-                                    </div>
-                                `;
+                            if (document.querySelectorAll('.document-card').length === 0) {
+                                if (documentsTotal > 0) {
+                                    loadDocuments();    // Later pages are still on the server
+                                } else {
+                                    document.getElementById('documentList').innerHTML = emptyDocumentsHTML();
+                                }
                             } 
                         }, 300);
                     }
                     showToast(` Document "${docName}" deleted successfully!`, 'success');
-                    // Also trigger a full reload after a delay
-                    setTimeout(() => {
-                        loadDocuments();
-                    }, 1000);
                 } else {
                     showToast(` Error: ${result.message}`, 'error');
                 }
@@ -559,26 +666,51 @@ let currentDocumentName = null;
             thinkingMsg.id = 'thinkingMsg';
             chatWindow.appendChild(thinkingMsg);
             chatWindow.scrollTop = chatWindow.scrollHeight; // Scroll to bottom
+            // Bot response, filled in as sources and answer segments arrive
+            const botMsg = document.createElement('div');
+            botMsg.className = 'message bot-message';
+            const sourcesEl = document.createElement('div');
+            sourcesEl.className = 'chat-sources';
+            const answerEl = document.createElement('div');
+            botMsg.appendChild(sourcesEl);
+            botMsg.appendChild(answerEl);
+            let answer = '';
+            const showBotMessage = () => {
+                if (thinkingMsg.parentNode) {
+                    thinkingMsg.remove();   // Remove thinking message
+                    chatWindow.appendChild(botMsg);
+                }
+                chatWindow.scrollTop = chatWindow.scrollHeight; // Scroll to bottom
+            };
             try {
-                const response = await fetch(`${API_BASE}/chat`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
+                await streamChat(message, {
+                    onSources(sources) {
+                        if (sources.length) {
+                            const names = [...new Set(sources.map(s => s.source))];
+                            sourcesEl.textContent = `Sources: ${names.join(', ')}`;
+                        }
+                        showBotMessage();
+                    },
+                    onToken(text) {
+                        answer += text;
+                        // Format the answer with line breaks
+                        answerEl.innerHTML = answer.replace(/\n/g, '<br>');
+                        showBotMessage();
                     },
-                    body: JSON.stringify({ query: message })
+                    onError(errorMessage) {
+                        answer += errorMessage;
+                        answerEl.textContent = answer;
+                        showBotMessage();
+                    }
                 });
-                const result = await response.json();
-                thinkingMsg.remove();   // Remove thinking message
-                // Add bot response
-                const botMsg = document.createElement('div');
-                botMsg.className = 'message bot-message';
-                // Format the answer with line breaks
-                const formattedAnswer = result.answer.replace(/\n/g, '<br>');
-                botMsg.innerHTML = formattedAnswer;
-                chatWindow.appendChild(botMsg);
-                chatWindow.scrollTop = chatWindow.scrollHeight; // Scroll to bottom
+                showBotMessage();
             } catch (error) {
                 thinkingMsg.remove();   // Remove thinking message
+                if (answer) {
+                    botMsg.appendChild(document.createTextNode(' (response interrupted)'));
+                    return;
+                }
+                botMsg.remove();
                 // Add error message
                 const errorMsg = document.createElement('div');
                 errorMsg.className = 'message bot-message';
@@ -588,6 +720,54 @@ let currentDocumentName = null;
             }
         }
 
+        // Read the server-sent events of /chat/stream and dispatch them as they arrive
+        async function streamChat(query, handlers) {
+            const response = await fetch(`${API_BASE}/chat/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify({ query: query })
+            });
+            if (!response.ok) throw new Error(`Chat stream failed: ${response.status}`);
+            if (!response.body) {   // No streaming support: fall back to the buffered endpoint
+                const fallback = await fetch(`${API_BASE}/chat`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ query: query })
+                });
+                const result = await fallback.json();
+                handlers.onSources([]);
+                handlers.onToken(result.answer);
+                return;
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {   // One event per blank-line separated block
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    }
+                    const payload = data ? JSON.parse(data) : null;
+                    if (event === 'sources') handlers.onSources(payload);
+                    else if (event === 'token') handlers.onToken(payload.text);
+                    else if (event === 'error') handlers.onError(payload.message);
+                    else if (event === 'done') return;
+                }
+            }
+        }
+
         // Toast notification function
         function showToast(message, type = 'info') {
             // Remove existing toasts
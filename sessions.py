@@ -0,0 +1,119 @@
+"""Registry of client sessions.
+
+Each browser (or API client) gets its own session id, sent back on every
+request in the X-Session-ID header or the `session_id` cookie. Sessions are
+kept in SQLite next to the document store, so they survive a restart and no
+per-client state is held in memory. A new id is only handed out at first
+(`resolve`); it is stored once the session writes something (`register`), so
+clients that never upload, such as one-off API calls, leave no row behind.
+
+A session's chunks live in the shared collection, filtered by `session_id`
+metadata at query time, until it is moved to a collection of its own (see
+`collection`), which spares large tenants the filter over everyone else's chunks.
+"""
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+TOUCH_INTERVAL = timedelta(minutes=5)    # last_seen is rewritten at most this often per session
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    collection TEXT
+);
+"""
+
+
+def tenant_collection_name(session_id: str) -> str:
+    """Name of a session's own ChromaDB collection"""
+    return "tenant_" + re.sub(r"[^A-Za-z0-9]", "", session_id)[:48]
+
+
+class SessionRegistry:
+    TABLES = ("sessions",)    # What a snapshot import swaps in
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, session_id: Optional[str] = None) -> Dict:
+        session_id = session_id or str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO sessions (session_id, created_at, last_seen) VALUES (?, ?, ?)",
+                         (session_id, now, now))
+        return self.get(session_id)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def transient(session_id: Optional[str] = None) -> Dict:
+        """A session that is not stored (yet); see `register`"""
+        now = datetime.now().isoformat()
+        return {"session_id": session_id or str(uuid.uuid4()), "created_at": now, "last_seen": now, "collection": None}
+
+    def resolve(self, session_id: Optional[str]) -> Dict:
+        """The session a request belongs to; malformed ids get a new one. Ids not stored
+        (new ones, or created elsewhere, e.g. by an older server run) are adopted as they
+        are, but only stored by `register`."""
+        if not session_id or not SESSION_ID_RE.match(session_id):
+            return self.transient()
+        session = self.get(session_id)
+        if session is None:
+            return self.transient(session_id)
+        now = datetime.now()
+        if datetime.fromisoformat(session["last_seen"]) < now - TOUCH_INTERVAL:
+            with self._connect() as conn:
+                conn.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (now.isoformat(), session_id))
+            session["last_seen"] = now.isoformat()
+        return session
+
+    def register(self, session: Dict) -> Dict:
+        """Store a session before its first write, if it is not stored yet; returns the stored row"""
+        return self.get(session["session_id"]) or self.create(session["session_id"])
+
+    def set_collection(self, session_id: str, collection: Optional[str]):
+        with self._connect() as conn:
+            conn.execute("UPDATE sessions SET collection = ? WHERE session_id = ?", (collection, session_id))
+
+    def add_many(self, rows: List[Dict]):
+        """Insert sessions as they are (e.g. from a snapshot), replacing any with the same id"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, last_seen, collection) VALUES (?, ?, ?, ?)",
+                [(row["session_id"], row["created_at"], row["last_seen"], row.get("collection")) for row in rows]
+            )
+
+    def list(self) -> List[Dict]:
+        return [dict(row) for row in self._connect().execute("SELECT * FROM sessions ORDER BY created_at")]
+
+    def tenant_collections(self) -> List[str]:
+        return [row[0] for row in self._connect().execute("SELECT collection FROM sessions WHERE collection IS NOT NULL")]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions")
@@ -0,0 +1,547 @@
+"""Snapshots of the whole index, to bootstrap a replica or recover without re-embedding.
+
+A snapshot is a directory:
+
+    manifest.json              format version, embedding model and width, counts, SHA-256 of every file
+    documents.jsonl            one document per line, text included
+    sessions.jsonl             one session per line (with the collection it owns, if any)
+    chunks/<collection>.jsonl  one chunk per line: id, text and metadata
+    vectors/<collection>.npy   float32 matrix, row i is the vector of line i of the chunks file
+
+Vectors are plain .npy files, so an import memory-maps them and hands slices
+straight to ChromaDB: nothing is embedded again. Importing also refills the
+lexical index and the embedding cache (by chunk text), so chat re-ranking does
+not go back to the model either. Over HTTP a snapshot travels as an
+uncompressed tar of that directory.
+
+An import is checked (manifest, checksums, model, vector shapes) before anything
+is written, then loaded into staging collections and staging SQLite files next
+to the live ones, and only then swapped in. Until the swap succeeds the current
+index is left as it was, so a failed import loses nothing.
+
+An export holds writers off only while it takes a consistent cut (a backup of
+the document database and the chunk ids of every collection), copies the rest
+without the gate, and copies again if a document of the cut changed meanwhile.
+
+A session id is the only credential a client has, so an export replaces each one
+with a pseudonym (a hash of it) in the documents, sessions, chunk metadata and
+tenant collection names: a snapshot gives no access to the server it came from,
+and on a replica clients start new sessions. To bootstrap a replica that the
+same clients will use, or a backup restored on the same server, keep the ids
+(`--keep-session-ids`, or `keep_session_ids=true` over HTTP).
+
+From the command line (with the server stopped, as it owns the stores):
+
+    python -m snapshot export ./snapshot-2024-06-01 [--keep-session-ids]
+    python -m snapshot import ./snapshot-2024-06-01 [--replace]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from embedders import DIMENSIONS_KEY, MODEL_KEY, check_signature
+from embedding_cache import content_hash, file_hash
+from resources import StoreLockedError
+from sessions import tenant_collection_name
+from telemetry import get_logger
+
+logger = get_logger("snapshot")
+
+SNAPSHOT_FORMAT = "rag-snapshot"
+SNAPSHOT_VERSION = 1    # Bumped when the layout changes; imports accept this version and older
+SNAPSHOT_PAGE_SIZE = 1000    # Chunks read from, or written to, a collection per request
+SNAPSHOT_EXPORT_ATTEMPTS = 3    # Copies tried before an export holds writers off for the whole copy
+# Manifest key of each per-collection file -> its folder and extension (see the layout above)
+COLLECTION_FILES = {"chunks_file": ("chunks", ".jsonl"), "vectors_file": ("vectors", ".npy")}
+
+
+class SnapshotError(ValueError):
+    """The snapshot is unreadable, from another model, or can't be imported here"""
+
+
+class SnapshotConflictError(SnapshotError):
+    """The index holds data an import without `replace` would overwrite"""
+
+
+def pseudonym(session_id: str) -> str:
+    """Stand-in for a session id in an export; still a valid session id, but grants nothing"""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+
+
+def write_jsonl(path: str, rows: Iterator[Dict]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+            count += 1
+    return count
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(rows: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def check_manifest(manifest: Dict):
+    """Raise SnapshotError unless the manifest has every key an import reads, of the right type"""
+    def is_count(value) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+    if not is_count(manifest.get("documents")) or not is_count(manifest.get("sessions")):
+        raise SnapshotError("Snapshot manifest: `documents` and `sessions` must be counts")
+    files = manifest.get("files")
+    if not isinstance(files, dict) or not all(isinstance(path, str) and isinstance(digest, str)
+                                              for path, digest in files.items()):
+        raise SnapshotError("Snapshot manifest: `files` must map file paths to checksums")
+    collections = manifest.get("collections")
+    if not isinstance(collections, list) or not collections:
+        raise SnapshotError("Snapshot manifest: `collections` must be a non-empty list")
+    for entry in collections:
+        if not isinstance(entry, dict) or not is_count(entry.get("chunks")) or \
+                not all(isinstance(entry.get(key), str) for key in ("name", *COLLECTION_FILES)):
+            raise SnapshotError(f"Snapshot manifest: malformed collection entry {entry!r}")
+    for key in (MODEL_KEY, DIMENSIONS_KEY):
+        if key not in manifest:
+            raise SnapshotError(f"Snapshot manifest: `{key}` is missing")
+
+
+def snapshot_file(directory: str, relative: str) -> str:
+    """Full path of a file a manifest names; refuses any that resolves outside the snapshot directory"""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, *str(relative).split("/")))
+    if not path.startswith(root + os.sep):
+        raise SnapshotError(f"Snapshot file {relative!r} is outside the snapshot")
+    return path
+
+
+def collection_file(directory: str, entry: Dict, key: str) -> str:
+    """Full path of a collection's chunks or vectors file, which must follow the exported layout"""
+    folder, extension = COLLECTION_FILES[key]
+    name = entry.get("name")
+    if not isinstance(name, str) or not name or name in (".", "..") or "/" in name or "\\" in name or \
+            entry.get(key) != f"{folder}/{name}{extension}":
+        raise SnapshotError(f"Collection {name!r}: {key} {entry.get(key)!r} is not {folder}/<name>{extension}")
+    return snapshot_file(directory, entry[key])
+
+
+def swap_tables(live_path: str, staged_path: str, tables: List[str]):
+    """Replace `tables` of the SQLite database at `live_path` with their rows in the
+    database at `staged_path` (same schema), in one transaction"""
+    conn = sqlite3.connect(live_path, timeout=30)
+    try:
+        conn.execute("ATTACH DATABASE ? AS staged", (staged_path,))
+        with conn:
+            for table in tables:
+                conn.execute(f"DELETE FROM main.{table}")
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM staged.{table}")
+    finally:
+        conn.close()
+
+
+def pack(directory: str, tar_path: str):
+    """Uncompressed tar of a snapshot directory (vectors don't compress, and this keeps it fast)"""
+    with tarfile.open(tar_path, "w") as tar:
+        for name in sorted(os.listdir(directory)):
+            tar.add(os.path.join(directory, name), arcname=name)
+
+
+def unpack(tar_path: str, directory: str):
+    with tarfile.open(tar_path, "r") as tar:
+        if hasattr(tarfile, "data_filter"):    # Refuses absolute paths, links out of the directory, devices
+            tar.extractall(directory, filter="data")
+        else:
+            for member in tar.getmembers():
+                target = os.path.realpath(os.path.join(directory, member.name))
+                if not target.startswith(os.path.realpath(directory) + os.sep) or not (member.isfile() or member.isdir()):
+                    raise SnapshotError(f"Unsafe entry in snapshot archive: {member.name}")
+            tar.extractall(directory)
+
+
+class Snapshots:
+    def __init__(self, resources, doc_store, lexical_index, sessions, embedding_cache, gate,
+                 on_change: Callable[[], object] = lambda: None):
+        self.resources = resources
+        self.doc_store = doc_store
+        self.lexical_index = lexical_index
+        self.sessions = sessions
+        self.embedding_cache = embedding_cache
+        self.gate = gate
+        self.on_change = on_change    # Called after an import, to retire cached results
+
+    def _collections(self) -> List[str]:
+        return [self.resources.collection_name, *sorted(set(self.sessions.tenant_collections()))]
+
+    # ------------------------------------------------------------ export
+
+    def export(self, directory: str, keep_session_ids: bool = False) -> Dict:
+        """Write a snapshot into `directory` (created; must not exist yet), as of one moment.
+        Writers are held off only while that moment is taken (see _cut), and the copy is
+        kept if nothing it holds changed meanwhile; after SNAPSHOT_EXPORT_ATTEMPTS busy
+        tries, writers are held off for the whole copy.
+        Session ids are replaced by pseudonyms unless `keep_session_ids`."""
+        start = time.time()
+        alias = (lambda session_id: session_id) if keep_session_ids else \
+            (lambda session_id: pseudonym(session_id) if session_id else session_id)
+        if os.path.exists(directory):
+            raise SnapshotError(f"{directory} already exists")
+        if self.resources.collection() is None:
+            raise SnapshotError(f"ChromaDB unavailable: {self.resources.error}")
+        staging = directory.rstrip(os.sep) + ".partial"
+        try:
+            for _ in range(SNAPSHOT_EXPORT_ATTEMPTS):
+                with self.gate.exclusive():
+                    cut = self._cut(staging)
+                try:
+                    counts = self._write(staging, cut, alias)
+                except Exception as e:    # e.g. a collection swapped by maintenance; the locked copy reports real errors
+                    logger.info("Snapshot copy interrupted", extra={"error": str(e)})
+                    counts = None
+                if counts is not None:
+                    with self.gate.exclusive():
+                        if not self._changed_since(cut):
+                            break
+                logger.info("Index changed while exporting, copying again")
+            else:
+                with self.gate.exclusive():
+                    cut = self._cut(staging)
+                    counts = self._write(staging, cut, alias)
+                if counts is None:
+                    raise SnapshotError("Chunks went missing while exporting with writers held off")
+            documents, sessions, collections = counts
+            files = {}
+            for folder, _, names in os.walk(staging):
+                for name in names:
+                    path = os.path.join(folder, name)
+                    files[os.path.relpath(path, staging).replace(os.sep, "/")] = file_hash(path)
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "created_at": cut["taken_at"],
+                MODEL_KEY: self.resources.embedder.model_id,
+                DIMENSIONS_KEY: self.resources.dimensions,
+                "documents": documents,
+                "sessions": sessions,
+                "session_ids": "original" if keep_session_ids else "pseudonymous",
+                "collections": collections,
+                "files": files
+            }
+            with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        finally:
+            shutil.rmtree(staging + ".cut", ignore_errors=True)
+        report = {"status": "success", "path": directory, "documents": documents, "sessions": sessions,
+                  "chunks": sum(c["chunks"] for c in collections), "collections": len(collections),
+                  "bytes": sum(os.path.getsize(os.path.join(directory, path)) for path in files),
+                  "elapsed": f"{time.time() - start:.2f}s"}
+        logger.info("Snapshot exported", extra=report)
+        return report
+
+    def _cut(self, staging: str) -> Dict:
+        """The moment an export copies (the caller holds writers off): a backup of the
+        documents' and sessions' database files, and the chunk ids of every collection"""
+        workdir = staging + ".cut"
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        copies: Dict[str, str] = {}    # Live database file -> its backup (stores sharing a file share it)
+        for store in (self.doc_store, self.sessions):
+            live = os.path.abspath(store.path)
+            if live not in copies:
+                copies[live] = os.path.join(workdir, f"{len(copies)}.db")
+                source, target = sqlite3.connect(live, timeout=30), sqlite3.connect(copies[live])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+        chunk_ids = {}
+        for name in self._collections():
+            collection, ids = self.resources.tenant_collection(name), []
+            while True:
+                page = collection.get(include=[], limit=SNAPSHOT_PAGE_SIZE, offset=len(ids))
+                if not page["ids"]:
+                    break
+                ids.extend(page["ids"])
+            chunk_ids[name] = ids
+        return {"taken_at": datetime.now().isoformat(), "chunk_ids": chunk_ids,
+                "doc_store": type(self.doc_store)(copies[os.path.abspath(self.doc_store.path)]),
+                "sessions": type(self.sessions)(copies[os.path.abspath(self.sessions.path)])}
+
+    def _changed_since(self, cut: Dict) -> bool:
+        """Whether a document or session of the cut was edited, deleted or moved to its own
+        collection since (the caller holds writers off). New ones are simply not exported."""
+        updated = {doc["id"]: doc["updated_at"] for doc in self.doc_store.list_documents()}
+        if any(updated.get(doc["id"]) != doc["updated_at"] for doc in cut["doc_store"].list_documents()):
+            return True
+        collections = {session["session_id"]: session["collection"] for session in self.sessions.list()}
+        return any(collections.get(session["session_id"], session["collection"]) != session["collection"]
+                   for session in cut["sessions"].list())
+
+    def _write(self, staging: str, cut: Dict, alias: Callable[[str], str]) -> Optional[tuple]:
+        """Write the cut's documents, sessions and chunks into `staging`; returns their counts
+        and the collection entries, or None if chunks of the cut are gone from ChromaDB"""
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(os.path.join(staging, "chunks"))
+        os.makedirs(os.path.join(staging, "vectors"))
+        doc_store = cut["doc_store"]
+        documents = write_jsonl(os.path.join(staging, "documents.jsonl"), (
+            {**doc, "session_id": alias(doc["session_id"]), "content": doc_store.get_content(doc["id"]) or ""}
+            for doc in doc_store.list_documents()
+        ))
+        renamed = {}    # Tenant collection names embed the session id
+        rows = []
+        for session in cut["sessions"].list():
+            if session["collection"]:
+                renamed[session["collection"]] = tenant_collection_name(alias(session["session_id"]))
+            rows.append({**session, "session_id": alias(session["session_id"]),
+                         "collection": renamed.get(session["collection"])})
+        sessions = write_jsonl(os.path.join(staging, "sessions.jsonl"), iter(rows))
+        collections = []
+        for name, ids in cut["chunk_ids"].items():
+            entry = self._export_collection(staging, name, ids, renamed.get(name, name), alias)
+            if entry is None:
+                return None
+            collections.append(entry)
+        return documents, sessions, collections
+
+    def _export_collection(self, staging: str, name: str, ids: List[str], exported_name: str,
+                           alias: Callable[[str], str]) -> Optional[Dict]:
+        """Write the chunks `ids` of a collection; None if some are gone"""
+        collection = self.resources.tenant_collection(name)
+        chunks_file, vectors_file = ("/".join((folder, exported_name + extension))
+                                     for folder, extension in COLLECTION_FILES.values())
+        vectors = np.lib.format.open_memmap(os.path.join(staging, vectors_file), mode="w+", dtype=np.float32,
+                                            shape=(len(ids), self.resources.dimensions))
+        written = 0
+        with open(os.path.join(staging, chunks_file), "w", encoding="utf-8") as f:
+            for start in range(0, len(ids), SNAPSHOT_PAGE_SIZE):
+                page = collection.get(ids=ids[start:start + SNAPSHOT_PAGE_SIZE],
+                                      include=["embeddings", "documents", "metadatas"])
+                if len(page["ids"]) != len(ids[start:start + SNAPSHOT_PAGE_SIZE]):
+                    break
+                vectors[written:written + len(page["ids"])] = np.asarray(page["embeddings"], dtype=np.float32)
+                for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    if metadata and metadata.get("session_id"):
+                        metadata = {**metadata, "session_id": alias(metadata["session_id"])}
+                    f.write(json.dumps({"id": chunk_id, "document": document, "metadata": metadata}) + "\n")
+                written += len(page["ids"])
+        vectors.flush()
+        del vectors
+        if written != len(ids):
+            return None
+        return {"name": exported_name, "chunks": written, "chunks_file": chunks_file, "vectors_file": vectors_file}
+
+    # ------------------------------------------------------------ import
+
+    def read_manifest(self, directory: str, verify: bool = True) -> Dict:
+        try:
+            with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Not a snapshot (no readable manifest.json): {e}")
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise SnapshotError("Not a snapshot: unknown format")
+        if not isinstance(manifest.get("version"), int) or manifest["version"] > SNAPSHOT_VERSION:
+            raise SnapshotError(f"Snapshot version {manifest.get('version')} is newer than this server "
+                                f"supports ({SNAPSHOT_VERSION})")
+        check_manifest(manifest)
+        if verify:
+            for path, digest in manifest["files"].items():
+                full = snapshot_file(directory, path)
+                if not os.path.isfile(full) or file_hash(full) != digest:
+                    raise SnapshotError(f"Snapshot file {path} is missing or corrupt")
+        return manifest
+
+    def _check_vectors(self, directory: str, manifest: Dict):
+        """Every collection's files follow the layout, and its vectors are readable, float32,
+        one row per chunk and as wide as the model's"""
+        for entry in manifest["collections"]:
+            collection_file(directory, entry, "chunks_file")
+            path = collection_file(directory, entry, "vectors_file")
+            try:
+                vectors = np.load(path, mmap_mode="r")
+            except (OSError, ValueError) as e:
+                raise SnapshotError(f"Collection {entry['name']}: unreadable vectors: {e}")
+            if vectors.dtype != np.float32 or vectors.ndim != 2 or len(vectors) != entry["chunks"] or \
+                    (len(vectors) and vectors.shape[1] != self.resources.dimensions):
+                raise SnapshotError(f"Collection {entry['name']}: vectors of shape {vectors.shape} ({vectors.dtype}) "
+                                    f"for {entry['chunks']} chunks of width {self.resources.dimensions}")
+
+    def _is_empty(self) -> bool:
+        """No documents, chunks or sessions: the import replaces the whole session registry too"""
+        return not (self.doc_store.count() or self.lexical_index.count() or self.resources.count()
+                    or self.sessions.count())
+
+    def load(self, directory: str, replace: bool = False, verify: bool = True) -> Dict:
+        """Import a snapshot directory. The stores must be empty, or `replace` discards them.
+        Vectors are bulk-loaded as stored; the embedding model is only used to check they match it.
+        Everything is loaded into staging stores first and swapped in at the end."""
+        start = time.time()
+        manifest = self.read_manifest(directory, verify)
+        if self.resources.collection() is None:
+            raise SnapshotError(f"ChromaDB unavailable: {self.resources.error}")
+        try:
+            check_signature(manifest, self.resources.embedder.model_id, self.resources.dimensions, "in the snapshot")
+        except Exception as e:
+            raise SnapshotError(str(e))
+        self._check_vectors(directory, manifest)
+        if not replace and not self._is_empty():
+            raise SnapshotConflictError("The index is not empty; import with replace to discard it first")
+        names = [entry["name"] for entry in manifest["collections"]]
+        workdir = tempfile.mkdtemp(prefix=".snapshot-import-", dir=os.path.dirname(os.path.abspath(self.doc_store.path)))
+        staged_paths: Dict[str, str] = {}    # Live database file -> its staging copy (stores sharing a file share it)
+
+        def staged(store):
+            path = staged_paths.setdefault(os.path.abspath(store.path), os.path.join(workdir, f"{len(staged_paths)}.db"))
+            return type(store)(path)
+
+        try:
+            doc_store, sessions, lexical_index = staged(self.doc_store), staged(self.sessions), staged(self.lexical_index)
+            for docs in batched(read_jsonl(os.path.join(directory, "documents.jsonl")), SNAPSHOT_PAGE_SIZE):
+                doc_store.add_many(docs)
+            sessions.add_many(list(read_jsonl(os.path.join(directory, "sessions.jsonl"))))
+            chunks = sum(self._load_collection(directory, entry, lexical_index) for entry in manifest["collections"])
+            lexical_stale = self._swap_in(names, replace, doc_store, sessions, lexical_index)
+        finally:
+            self.resources.discard_imports(names)    # Only left over when the swap did not happen
+            shutil.rmtree(workdir, ignore_errors=True)
+        report = {"status": "success", "documents": manifest["documents"], "sessions": manifest["sessions"],
+                  "chunks": chunks, "collections": len(manifest["collections"]), "replaced": replace,
+                  "session_ids": manifest.get("session_ids", "original"),
+                  "snapshot_created_at": manifest.get("created_at"), "elapsed": f"{time.time() - start:.2f}s"}
+        if lexical_stale:
+            report["warning"] = "The lexical index could not be swapped in; the next maintenance run reconciles it"
+        logger.info("Snapshot imported", extra=report)
+        return report
+
+    def _swap_in(self, names: List[str], replace: bool, staged_documents, staged_sessions, staged_lexical) -> bool:
+        """Swap the staged collections and stores in, with writers held off. The collections go
+        first, set aside rather than dropped, and come back if the documents' tables fail; the
+        lexical index, derived from the chunks, goes last. Returns whether it failed to."""
+        with self.gate.exclusive():
+            if not replace and not self._is_empty():
+                raise SnapshotConflictError("The index is not empty; import with replace to discard it first")
+            if self.gate.in_flight():
+                raise SnapshotConflictError("Uploads are being ingested; retry once they finish")
+            previous = self._collections()
+            self.resources.swap_imported(names)
+            try:
+                tables: Dict[str, tuple] = {}    # One transaction per database file (documents and sessions share one)
+                for live, staged in ((self.doc_store, staged_documents), (self.sessions, staged_sessions)):
+                    tables.setdefault(live.path, (staged.path, []))[1].extend(live.TABLES)
+                for live_path, (staged_path, table_names) in tables.items():
+                    swap_tables(live_path, staged_path, table_names)
+            except BaseException:
+                self.resources.revert_import(names)
+                raise
+            try:
+                self.resources.finish_import(names, drop=previous)
+            except Exception:
+                logger.exception("Could not delete the collections replaced by the snapshot")
+            try:
+                swap_tables(self.lexical_index.path, staged_lexical.path, list(self.lexical_index.TABLES))
+                return False
+            except Exception:
+                logger.exception("Swapping in the snapshot's lexical index failed")
+                return True
+            finally:
+                self.on_change()
+
+    def _load_collection(self, directory: str, entry: Dict, lexical_index) -> int:
+        """Load a collection into its staging copy (see Resources.create_import) and `lexical_index`"""
+        collection = self.resources.create_import(entry["name"])
+        vectors = np.load(collection_file(directory, entry, "vectors_file"), mmap_mode="r")
+        page_size = min(SNAPSHOT_PAGE_SIZE, self.resources.client().get_max_batch_size())
+        loaded = 0
+        for rows in batched(read_jsonl(collection_file(directory, entry, "chunks_file")), page_size):
+            if loaded + len(rows) > len(vectors):
+                raise SnapshotError(f"Collection {entry['name']}: more chunk rows than its {len(vectors)} vectors")
+            ids = [row["id"] for row in rows]
+            texts = [row["document"] for row in rows]
+            metadatas = [row["metadata"] for row in rows]
+            embeddings = np.ascontiguousarray(vectors[loaded:loaded + len(rows)])
+            collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            lexical_index.add(ids, texts, metadatas)
+            self.embedding_cache.put_many(zip((content_hash(text) for text in texts), embeddings))    # A cache: harmless if the import fails
+            loaded += len(rows)
+        if loaded != entry["chunks"]:
+            raise SnapshotError(f"Collection {entry['name']}: {loaded} chunk rows for {entry['chunks']} vectors")
+        return loaded
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the RAG index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a snapshot directory (or .tar)")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--keep-session-ids", action="store_true",
+                               help="Keep session ids (for a backup restored on this server) instead of pseudonyms")
+    import_parser = commands.add_parser("import", help="Load a snapshot directory (or .tar)")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true", help="Discard the current index first")
+    import_parser.add_argument("--no-verify", action="store_true", help="Skip the file checksums")
+    args = parser.parse_args(argv)
+
+    import backend    # Run from the server's directory: its stores are relative to it
+    try:
+        backend.store_lock.acquire()    # Refuses while the server is running
+    except StoreLockedError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    backend.migrate_json_documents()
+    try:
+        if args.command == "export":
+            if args.path.endswith(".tar"):
+                staging = args.path[:-len(".tar")] + ".dir"
+                report = backend.snapshots.export(staging, keep_session_ids=args.keep_session_ids)
+                pack(staging, args.path)
+                shutil.rmtree(staging)
+                report["path"] = args.path
+            else:
+                report = backend.snapshots.export(args.path, keep_session_ids=args.keep_session_ids)
+        else:
+            directory = args.path
+            if args.path.endswith(".tar"):
+                directory = args.path[:-len(".tar")] + ".dir"
+                unpack(args.path, directory)
+            try:
+                report = backend.snapshots.load(directory, replace=args.replace, verify=not args.no_verify)
+            finally:
+                if directory != args.path:
+                    shutil.rmtree(directory, ignore_errors=True)
+    except SnapshotError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    import snapshot    # The module backend imports, not this __main__ copy, so its errors are the ones caught
+    snapshot.main()
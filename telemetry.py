@@ -0,0 +1,275 @@
+"""Logging, stage timing and Prometheus metrics.
+
+- `get_logger(name)` returns a logger under "rag"; `configure_logging` sends
+  them to stderr as one line per record, JSON (LOG_FORMAT=json) or plain text,
+  at LOG_LEVEL. Keyword fields go in `extra=` and come out as JSON keys.
+- `span(stage)` / `timed_iter(iterable, stage)` time a pipeline stage (extract,
+  chunk, embed, store, index, retrieve, rerank, sentences, answer). Times are
+  exclusive: a stage running inside another is not counted twice, so the
+  stages of a request add up to at most its total.
+- Stage times are observed into the `rag_stage_seconds` histogram and, when
+  the request asked for a profile (see `start_profile`), collected for a
+  `Server-Timing` response header.
+- `REGISTRY.render()` is the Prometheus text exposition served on /metrics;
+  counters and histograms are kept in-process, so no client library is needed.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")    # text | json
+
+# Seconds; covers a cached lookup (sub-millisecond) up to a large PDF (minutes)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+# ---------------------------------------------------------------- logging
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """`time level logger: message key=value ...`"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        return f"{line} {fields}" if fields else line
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Install the handler on the "rag" logger (once; later calls only change the level)"""
+    root = logging.getLogger("rag")
+    root.setLevel(level)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        root.addHandler(handler)
+        root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"rag.{name}")
+
+
+# ---------------------------------------------------------------- metrics
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}    # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """A value read when metrics are scraped"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.name, self.documentation, self.read = name, documentation, read
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:    # A failing reader must not break the whole scrape
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Time spent in each pipeline stage (exclusive)", ["stage"])
+
+
+# ---------------------------------------------------------------- spans
+
+_profile: contextvars.ContextVar = contextvars.ContextVar("rag_profile", default=None)
+_frame: contextvars.ContextVar = contextvars.ContextVar("rag_span_frame", default=None)
+
+
+def start_profile() -> List[Tuple[str, float]]:
+    """Collect the stage times of the current request (and the threads it hands work to)"""
+    profile: List[Tuple[str, float]] = []
+    _profile.set(profile)
+    return profile
+
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        profile.append((stage, seconds))
+
+
+class _Frame:
+    __slots__ = ("children",)
+
+    def __init__(self):
+        self.children = 0.0    # Seconds spent in spans nested inside this one
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as `stage`"""
+    parent = _frame.get()
+    frame = _Frame()
+    token = _frame.set(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _frame.reset(token)
+        if parent is not None:
+            parent.children += elapsed
+        record(stage, elapsed - frame.children)
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """Yield from `iterable`, timing the work done producing its items as one `stage`
+    observation (recorded when the iteration ends or is abandoned)"""
+    iterator = iter(iterable)
+    own = 0.0
+    try:
+        while True:
+            parent = _frame.get()
+            frame = _Frame()
+            token = _frame.set(frame)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                _frame.reset(token)
+                if parent is not None:
+                    parent.children += elapsed
+                own += elapsed - frame.children
+            yield item
+    finally:
+        record(stage, own)
+
+
+def bind(function: Callable) -> Callable:
+    """`function` bound to a copy of the current context, for executors that don't copy it
+    (loop.run_in_executor), so its stages land in the caller's profile"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+
+def server_timing(profile: List[Tuple[str, float]]) -> str:
+    """`Server-Timing` header value: total milliseconds per stage, in first-seen order"""
+    totals: Dict[str, float] = {}
+    for stage, seconds in profile:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
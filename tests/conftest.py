@@ -0,0 +1,62 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings for the in-process app; read when `backend` is first imported
+APP_ENV = {
+    "MAINTENANCE_INTERVAL": "0",    # No background passes during the tests
+    "OLLAMA_ENABLED": "0",
+    "CHAT_GENERATOR": "stub",    # Streams the extractive answer word by word, like a model
+    "STUB_TOKEN_DELAY": "0",
+    "DOCUMENTS_DB": "ui_documents.db",
+}
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """The backend module, importing in a scratch directory with the offline hashing
+    embedder (benchmarks/fake_embedder.py). One app serves the whole run: tests keep
+    apart by using sessions of their own (see `headers`)."""
+    workdir = tmp_path_factory.mktemp("app")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)    # The app keeps its stores relative to the working directory
+    for key, value in APP_ENV.items():
+        os.environ.setdefault(key, value)
+    try:
+        from benchmarks import fake_embedder
+        fake_embedder.install()
+        import backend
+        yield backend
+    finally:
+        os.chdir(previous_dir)
+
+
+@pytest.fixture(scope="session")
+def client(backend):
+    from fastapi.testclient import TestClient
+    with TestClient(backend.app) as client:
+        backend.resources.warm_up()
+        yield client
+
+
+@pytest.fixture
+def headers(backend):
+    """A new client session: documents, chat and caches are all scoped to it"""
+    return {backend.SESSION_HEADER: str(uuid.uuid4())}
+
+
+@pytest.fixture
+def upload(client):
+    """Ingest a text file in a session; returns the document id"""
+    def upload(headers, filename: str, text: str) -> str:
+        response = client.post("/upload", files={"file": (filename, text.encode("utf-8"), "text/plain")},
+                               headers=headers)
+        body = response.json()
+        assert body["status"] == "success", body
+        return body["document_id"]
+    return upload
@@ -0,0 +1,45 @@
+"""Benchmark harness: reproducible corpora, latency percentiles, result comparison, the phases."""
+import pytest
+
+from benchmarks import corpus, run
+
+
+def test_corpora_are_reproducible():
+    assert corpus.text_corpus(3, 2, seed=7) == corpus.text_corpus(3, 2, seed=7)
+    assert corpus.text_corpus(3, 2, seed=7) != corpus.text_corpus(3, 2, seed=8)
+    pdfs = corpus.pdf_corpus(2, 3)
+    assert pdfs == corpus.pdf_corpus(2, 3) and all(doc.data.startswith(b"%PDF") and doc.pages == 3 for doc in pdfs)
+    queries = corpus.queries(40)
+    assert queries == corpus.queries(40) and len(set(queries)) == 40
+
+
+def test_percentiles_are_reported_in_milliseconds():
+    stats = run.percentiles([i / 1000 for i in range(1, 101)])    # 1..100 ms
+    assert stats["p50_ms"] == pytest.approx(50.5) and stats["p99_ms"] == pytest.approx(99.01)
+    assert stats["mean_ms"] == pytest.approx(50.5) and stats["max_ms"] == pytest.approx(100)
+    assert run.percentiles([]) == {}
+
+
+def test_runs_are_compared_metric_by_metric():
+    baseline = {"meta": {"commit": "aaa"}, "sizes": {"small": {"chat": {"p50_ms": 10.0, "errors": 0}}},
+                "startup": {"ready_s": 2.0}}
+    current = {"meta": {"commit": "bbb"}, "sizes": {"small": {"chat": {"p50_ms": 8.0, "errors": 0, "ok": True},
+                                                             "ingest": {"txt": {"pages_per_s": 50}}}},
+               "startup": {"ready_s": 3.0}}
+    assert run.flatten(current["sizes"]) == {"small.chat.p50_ms": 8.0, "small.chat.errors": 0,
+                                             "small.ingest.txt.pages_per_s": 50}
+    table = run.compare(baseline, current).splitlines()
+    rows = {line.split()[0]: line.split()[1:] for line in table[1:-1]}
+    assert rows == {"sizes.small.chat.errors": ["0", "0"], "sizes.small.chat.p50_ms": ["10.0", "8.0", "-20.0%"],
+                    "startup.ready_s": ["2.0", "3.0", "+50.0%"]}
+    assert table[-1] == "baseline: aaa  current: bbb"
+
+
+def test_the_phases_measure_the_running_app(client, headers):
+    ingest = run.bench_ingest(client, corpus.text_corpus(3, 1), headers, verbose=False)
+    assert ingest["documents"] == 3 and ingest["failed"] == 0 and ingest["chunks"] >= 3 and ingest["pages_per_s"] > 0
+    queries = corpus.queries(run.WARMUP_QUERIES + 4)
+    chat = run.bench_chat(client, queries, concurrency=2, headers=headers, verbose=False)
+    assert chat["requests"] == 4 and chat["errors"] == 0 and chat["p50_ms"] <= chat["p99_ms"]
+    batch = run.bench_chat_batch(client, queries, headers, verbose=False)
+    assert batch["queries"] == len(queries) and batch["errors"] == 0
@@ -0,0 +1,79 @@
+"""/ui-documents/bulk: operations apply in request order and report in that order."""
+import json
+
+
+def run_bulk(client, headers, operations):
+    """Result lines (by request index) and the summary of a bulk call"""
+    response = client.post("/ui-documents/bulk", json={"operations": operations}, headers=headers)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]["summary"]
+
+
+def stored_chunks(backend, doc_id):
+    return backend.resources.collection().get(where={"doc_id": doc_id}, include=["documents"])["documents"]
+
+
+def test_export_before_delete_sees_the_document(backend, client, headers, upload):
+    doc_id = upload(headers, "valve.txt", "The relief valve V-7 opens at twelve bar. Test it once a year.")
+    results, summary = run_bulk(client, headers, [{"op": "export", "id": doc_id}, {"op": "delete", "id": doc_id}])
+    assert [(item["index"], item["op"], item["status"]) for item in results] == [(0, "export", "success"),
+                                                                                  (1, "delete", "success")]
+    assert results[0]["document"]["content"].startswith("The relief valve V-7")
+    assert results[0]["document"]["filename"] == "valve.txt"
+    assert summary["succeeded"] == 2 and summary["deleted"] == 1 and summary["exported"] == 1
+    # Gone from the store, the collection and the lexical index
+    assert client.get(f"/ui-documents/{doc_id}", headers=headers).json()["status"] == "error"
+    assert stored_chunks(backend, doc_id) == []
+    assert all(hit["metadata"]["doc_id"] != doc_id
+               for hit in backend.lexical_index.search("relief valve", session_id=headers[backend.SESSION_HEADER]))
+
+
+def test_exports_see_the_updates_before_them(backend, client, headers, upload):
+    doc_id = upload(headers, "notes.txt", "Original notes about the pump.")
+    results, summary = run_bulk(client, headers, [
+        {"op": "export", "id": doc_id},
+        {"op": "update", "id": doc_id, "content": "First revision: the gasket leaks."},
+        {"op": "export", "id": doc_id},
+        {"op": "update", "id": doc_id, "content": "Second revision: the motor hums."},
+        {"op": "export", "id": doc_id},
+    ])
+    assert [item["index"] for item in results] == [0, 1, 2, 3, 4]
+    assert [results[i]["document"]["content"] for i in (0, 2, 4)] == [
+        "Original notes about the pump.", "First revision: the gasket leaks.", "Second revision: the motor hums."]
+    assert results[1]["superseded"] and "superseded" not in results[3]
+    assert results[3]["embedding"]["recomputed"] == 1
+    assert summary["succeeded"] == 5 and summary["failed"] == 0 and summary["updated"] == 1
+    stored = client.get(f"/ui-documents/{doc_id}", headers=headers).json()["document"]
+    assert stored["content"] == "Second revision: the motor hums."
+    assert backend.doc_store.get(doc_id)["updated_at"] == results[4]["document"]["updated_at"]
+    assert stored_chunks(backend, doc_id) == ["Second revision: the motor hums."]
+
+
+def test_failures_are_reported_in_place(client, headers, upload):
+    mine = upload(headers, "mine.txt", "A document of this session.")
+    other_session = {**headers, "X-Session-ID": headers["X-Session-ID"] + "-other"}
+    other = upload(other_session, "theirs.txt", "A document of another session.")
+    results, summary = run_bulk(client, headers, [
+        {"op": "export", "id": other},
+        {"op": "update", "id": mine},
+        {"op": "delete", "id": mine},
+        {"op": "export", "id": mine},
+    ])
+    assert [(item["index"], item["status"]) for item in results] == [(0, "error"), (1, "error"), (2, "success"),
+                                                                     (3, "error")]
+    assert results[0]["message"] == "Document not found in current session"
+    assert results[3]["message"] == "Document is deleted earlier in this batch"
+    assert summary["succeeded"] == 1 and summary["failed"] == 3
+    # The other session's document is untouched
+    assert client.get(f"/ui-documents/{other}", headers=other_session).json()["status"] == "success"
+
+
+def test_updates_without_a_collection_save_the_content(backend, client, headers, monkeypatch, upload):
+    doc_id = upload(headers, "fan.txt", "The exhaust fan runs at low speed.")
+    monkeypatch.setattr(backend, "session_collection", lambda session: None)    # ChromaDB down
+    results, summary = run_bulk(client, headers, [{"op": "update", "id": doc_id, "content": "The fan runs fast."}])
+    assert results[0]["status"] == "success" and summary["failed"] == 0
+    assert results[0]["embedding"]["recomputed"] == 0 and results[0]["embedding"]["errors"] == []
+    stored = client.get(f"/ui-documents/{doc_id}", headers=headers).json()["document"]
+    assert stored["content"] == "The fan runs fast."
@@ -0,0 +1,128 @@
+"""Chat caches: query embeddings and retrievals (TTL LRU), and the semantic answer cache."""
+import pytest
+
+from cache import SemanticCache, TTLCache
+
+NEAR = [1.0, 0.05, 0.0]    # cos ~ 0.9988 to [1, 0, 0]
+FAR = [1.0, 0.5, 0.0]    # cos ~ 0.894
+
+
+def test_hit_needs_the_threshold():
+    cache = SemanticCache(threshold=0.95)
+    cache.put([2.0, 0.0, 0.0], "scope", "answer", doc_ids=["d1"])    # Stored normalised
+    found, value, similarity = cache.get(NEAR, "scope")
+    assert found and value == "answer" and similarity == pytest.approx(0.9988, abs=1e-4)
+    found, value, similarity = cache.get(FAR, "scope")
+    assert not found and value is None and similarity == pytest.approx(0.8944, abs=1e-4)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_scopes_do_not_share_answers():
+    cache = SemanticCache()
+    cache.put([1, 0, 0], ("s1", "vector"), "one", doc_ids=[])
+    cache.put([1, 0, 0], ("s2", "vector"), "two", doc_ids=[])
+    assert cache.get([1, 0, 0], ("s1", "vector"))[1] == "one"
+    assert cache.get([1, 0, 0], ("s2", "vector"))[1] == "two"
+    assert not cache.get([1, 0, 0], ("s3", "vector"))[0]
+
+
+def test_near_duplicate_put_replaces_the_entry():
+    cache = SemanticCache()
+    cache.put([1, 0, 0], "scope", "old", doc_ids=[])
+    cache.put(NEAR, "scope", "new", doc_ids=[])
+    assert cache.get([1, 0, 0], "scope")[1] == "new"
+    assert cache.stats()["size"] == 1
+
+
+def test_document_and_group_invalidation():
+    cache = SemanticCache()
+    cache.put([1, 0, 0], "scope", "from d1", doc_ids=["d1", "d2"], group="s1")
+    cache.put([0, 1, 0], "scope", "from d3", doc_ids=["d3"], group="s1")
+    cache.put([0, 0, 1], "other", "from d4", doc_ids=["d4"], group="s2")
+    assert cache.invalidate_documents(["d2", "unknown"]) == 1
+    assert not cache.get([1, 0, 0], "scope")[0]
+    assert cache.get([0, 1, 0], "scope")[0]
+    assert cache.invalidate_group("s1") == 1
+    assert not cache.get([0, 1, 0], "scope")[0] and cache.get([0, 0, 1], "other")[0]
+    assert cache.stats()["invalidated"] == 2
+
+
+def test_answer_computed_across_an_invalidation_is_not_stored():
+    cache = SemanticCache()
+    version = cache.version
+    cache.invalidate_documents(["d1"])
+    cache.put([1, 0, 0], "scope", "stale", doc_ids=["d1"], version=version)
+    assert not cache.get([1, 0, 0], "scope")[0]
+    cache.put([1, 0, 0], "scope", "fresh", doc_ids=["d1"], version=cache.version)
+    assert cache.get([1, 0, 0], "scope")[1] == "fresh"
+
+
+def test_least_recently_used_is_evicted():
+    cache = SemanticCache(maxsize=2)
+    cache.put([1, 0, 0], "scope", "a", doc_ids=[])
+    cache.put([0, 1, 0], "scope", "b", doc_ids=[])
+    cache.get([1, 0, 0], "scope")    # "b" is now the least recently used
+    cache.put([0, 0, 1], "scope", "c", doc_ids=[])
+    assert [cache.get(vector, "scope")[1] for vector in ([1, 0, 0], [0, 1, 0], [0, 0, 1])] == ["a", None, "c"]
+
+
+def test_entries_expire():
+    cache = SemanticCache(ttl=0)
+    cache.put([1, 0, 0], "scope", "a", doc_ids=[])
+    assert not cache.get([1, 0, 0], "scope")[0]
+    assert cache.stats()["size"] == 0
+
+
+def test_chat_answers_are_cached_until_their_document_changes(client, headers, upload):
+    doc_id = upload(headers, "pump.txt", "The seal of pump P-100 fails when the shaft is misaligned. " * 5)
+    query = {"query": "Why does the P-100 seal fail?"}
+    first = client.post("/chat", json=query, headers=headers).json()
+    assert "cached" not in first
+    again = client.post("/chat", json={"query": "why does the p-100 seal  fail"}, headers=headers).json()
+    assert again["answer"] == first["answer"] and again["cached"]["query"] == query["query"]
+    # Another session asking the same question gets its own answer
+    other = {**headers, "X-Session-ID": headers["X-Session-ID"] + "-other"}
+    assert "cached" not in client.post("/chat", json=query, headers=other).json()
+    # An edit to the document drops the answer built from it
+    client.put(f"/ui-documents/{doc_id}", json={"content": "The P-100 seal fails when it runs dry."}, headers=headers)
+    edited = client.post("/chat", json=query, headers=headers).json()
+    assert "cached" not in edited and "runs dry" in edited["answer"]
+
+
+def test_ttl_cache_evicts_the_least_recently_used_and_expires():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)    # "b" is now the least recently used
+    cache.set("c", 3)
+    assert [cache.get(key) for key in "abc"] == [(True, 1), (False, None), (True, 3)]
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+    expiring = TTLCache(ttl=0)
+    expiring.set("a", 1)
+    assert expiring.get("a") == (False, None) and expiring.stats()["size"] == 0
+
+
+def cache_stats(client):
+    return client.get("/health").json()["cache"]
+
+
+def test_repeated_queries_reuse_embeddings_and_results_until_a_write(client, headers, upload):
+    def retrieve(query):
+        body = client.post("/chat/batch", json={"queries": [query], "answers": False, "mode": "vector"},
+                           headers=headers).json()
+        return {chunk["doc_id"] for chunk in body["results"][0]["chunks"]}
+
+    first = upload(headers, "fan.txt", "The exhaust fan E-4 belt is tensioned every spring.")
+    assert retrieve("exhaust fan belt tension") == {first}
+    before = cache_stats(client)
+    assert retrieve("  Exhaust FAN belt tension ") == {first}    # Case and whitespace do not matter
+    after = cache_stats(client)
+    assert after["retrieval"]["hits"] == before["retrieval"]["hits"] + 1
+    assert after["query_embeddings"]["misses"] == before["query_embeddings"]["misses"]
+    # An upload bumps the collection version: the query is searched again, its embedding reused
+    second = upload(headers, "fan2.txt", "The exhaust fan E-5 belt is replaced when it squeals.")
+    assert cache_stats(client)["collection_version"] > after["collection_version"]
+    assert retrieve("exhaust fan belt tension") == {first, second}
+    latest = cache_stats(client)
+    assert latest["retrieval"]["misses"] > after["retrieval"]["misses"]
+    assert latest["query_embeddings"]["hits"] > after["query_embeddings"]["hits"]
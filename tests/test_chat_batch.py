@@ -0,0 +1,57 @@
+"""/chat/batch: per-query results in query order, as JSON or NDJSON."""
+import json
+
+DOCUMENTS = {
+    "pump.txt": "The seal of pump P-100 fails when the shaft is misaligned. Check the coupling first.",
+    "valve.txt": "The relief valve V-7 opens at twelve bar. Test the valve once a year.",
+    "motor.txt": "Motor M-3 overheats when its cooling fan is blocked. Clean the fan guard monthly.",
+}
+QUERIES = ["why does the pump seal fail", "when does the relief valve open", "motor overheating fan",
+           "pump coupling", "valve test interval"]
+EXPECTED_SOURCES = ["pump.txt", "valve.txt", "motor.txt", "pump.txt", "valve.txt"]
+
+
+def upload_all(upload, headers):
+    return {filename: upload(headers, filename, text) for filename, text in DOCUMENTS.items()}
+
+
+def test_results_follow_query_order_across_rounds(backend, client, headers, upload, monkeypatch):
+    doc_ids = upload_all(upload, headers)
+    monkeypatch.setattr(backend, "CHAT_BATCH_SIZE", 2)    # Three retrieval rounds
+    body = client.post("/chat/batch", json={"queries": QUERIES, "k": 2, "mode": "lexical"}, headers=headers).json()
+    results = body["results"]
+    assert [(item["index"], item["query"]) for item in results] == list(enumerate(QUERIES))
+    for item, source in zip(results, EXPECTED_SOURCES):
+        assert len(item["chunks"]) <= 2
+        assert item["chunks"][0]["source"] == source and item["chunks"][0]["doc_id"] == doc_ids[source]
+    assert body["summary"]["queries"] == len(QUERIES) and body["summary"]["failed"] == 0
+    # The same answers /chat gives one query at a time
+    for item in results[:3]:
+        chat = client.post("/chat", json={"query": item["query"], "k": 2, "mode": "lexical"}, headers=headers).json()
+        assert item["answer"] == chat["answer"]
+
+
+def test_retrieval_only(client, headers, upload):
+    upload_all(upload, headers)
+    results = client.post("/chat/batch", json={"queries": QUERIES[:2], "answers": False, "mode": "lexical"},
+                          headers=headers).json()["results"]
+    assert all("answer" not in item and item["chunks"] for item in results)
+    assert [item["chunks"][0]["source"] for item in results] == EXPECTED_SOURCES[:2]
+
+
+def test_stream_gives_the_same_results_as_lines(client, headers, upload):
+    upload_all(upload, headers)
+    request = {"queries": QUERIES, "answers": False, "mode": "lexical"}
+    response = client.post("/chat/batch", json={**request, "stream": True}, headers=headers)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["summary"]["queries"] == len(QUERIES)
+    whole = client.post("/chat/batch", json=request, headers=headers).json()["results"]
+    assert [(item["index"], [chunk["id"] for chunk in item["chunks"]]) for item in lines[:-1]] == \
+        [(item["index"], [chunk["id"] for chunk in item["chunks"]]) for item in whole]
+
+
+def test_session_without_documents(backend, client, headers):
+    results = client.post("/chat/batch", json={"queries": ["anything", "else"]}, headers=headers).json()["results"]
+    assert [(item["index"], item["chunks"], item["answer"]) for item in results] == [
+        (0, [], backend.NO_DOCUMENTS_ANSWER), (1, [], backend.NO_DOCUMENTS_ANSWER)]
@@ -0,0 +1,57 @@
+"""/chat/stream: server-sent events from the stub generator, compared with /chat."""
+import json
+
+MANUAL = ("Pump maintenance guide. The seal of pump P-100 fails when the shaft is misaligned. "
+          "Check the coupling alignment before replacing the seal. "
+          "Bearings on the P-100 should be greased every three months.\n\n"
+          "Valve manual. The relief valve V-7 opens at twelve bar. Test it once a year.")
+
+
+def read_events(text: str):
+    """(event, data) pairs of an SSE body"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_events_arrive_as_sources_tokens_done(client, headers, upload):
+    doc_id = upload(headers, "manual.txt", MANUAL)
+    query = {"query": "why does the pump seal fail", "mode": "lexical"}
+    response = client.post("/chat/stream", json=query, headers=headers)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = read_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "sources" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    assert len(names) > 10    # Word by word, not the answer in one piece
+    sources = events[0][1]
+    assert sources and all(source["doc_id"] == doc_id for source in sources)
+    assert sources[0]["source"] == "manual.txt"
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    assert "misaligned" in answer
+    assert events[-1][1]["retrieval"]["mode"] == "lexical"
+    # The same answer /chat gives, which the stream has just cached
+    chat = client.post("/chat", json=query, headers=headers).json()
+    assert chat["answer"] == answer
+    assert chat["cached"]["query"] == query["query"]
+
+
+def test_session_without_documents_gets_the_fallback(backend, client, headers):
+    events = read_events(client.post("/chat/stream", json={"query": "anything"}, headers=headers).text)
+    assert events[0] == ("sources", [])
+    assert events[1] == ("token", {"text": backend.NO_DOCUMENTS_ANSWER})
+    assert events[-1][0] == "done"
+
+
+def test_error_is_an_event(backend, client, headers, upload, monkeypatch):
+    upload(headers, "manual.txt", MANUAL)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(backend, "retrieve_context", broken)
+    events = read_events(client.post("/chat/stream", json={"query": "relief valve"}, headers=headers).text)
+    assert [name for name, _ in events] == ["error", "done"]
+    assert events[0][1]["message"] == backend.CHAT_ERROR_ANSWER
@@ -0,0 +1,104 @@
+"""Chunkers: spans, overlap, page markers, streaming and anchor stability."""
+import base64
+import random
+
+from chunker import FixedChunker, PAGE_MARKER_RE, StructuredChunker, count_tokens
+
+
+def sentence_text(count: int, seed: int = 0) -> str:
+    """Paragraphs of numbered, distinct sentences"""
+    words = "pump seal shaft valve coupling bearing pressure flow gasket motor".split()
+    rng = random.Random(seed)
+    sentences = [f"Step {i} checks the {' '.join(rng.choice(words) for _ in range(rng.randint(4, 14)))}."
+                 for i in range(count)]
+    return "\n\n".join(" ".join(sentences[i:i + 5]) for i in range(0, count, 5))
+
+
+def chunks_of(text: str, parts: int = 1, **options):
+    """Chunks of `text` streamed in roughly equal parts"""
+    size = -(-len(text) // parts)
+    return list(StructuredChunker(**options).iter_chunks(text[i:i + size] for i in range(0, len(text), size)))
+
+
+def test_spans_match_the_text_and_respect_the_budget():
+    text = sentence_text(200)
+    chunks = chunks_of(text, max_tokens=60, overlap_tokens=15)
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert text[chunk.start:chunk.end] == chunk.text
+        assert chunk.tokens == count_tokens(chunk.text) <= 60
+        assert chunk.page_start is None and chunk.page_end is None
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+
+
+def test_streaming_in_parts_gives_the_same_chunks():
+    text = sentence_text(150, seed=1)
+    whole = chunks_of(text, max_tokens=50)
+    for parts in (3, 17, 400):
+        assert chunks_of(text, parts=parts, max_tokens=50) == whole
+
+
+def test_overlap_repeats_trailing_sentences():
+    text = " ".join(f"Sentence number {i} is here." for i in range(60))    # Six tokens each
+    chunks = chunks_of(text, max_tokens=30, overlap_tokens=12)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start < previous.end
+        carried = text[chunk.start:previous.end]
+        assert previous.text.endswith(carried) and count_tokens(carried) <= 12
+    # Without overlap the chunks tile the text
+    chunks = chunks_of(text, max_tokens=30, overlap_tokens=0)
+    assert all(chunk.start >= previous.end for previous, chunk in zip(chunks, chunks[1:]))
+
+
+def page_at(text: str, position: int) -> int:
+    """Number of the last page marker before `position`"""
+    return int(PAGE_MARKER_RE.findall(text[:position])[-1])
+
+
+def test_page_markers_stay_out_of_chunks():
+    pages = [sentence_text(12, seed=page) for page in range(1, 5)]
+    text = "".join(f"--- Page {page} ---\n{body}\n\n" for page, body in enumerate(pages, start=1))
+    chunks = chunks_of(text, parts=4, max_tokens=80, overlap_tokens=20)
+    for chunk in chunks:
+        assert "--- Page" not in chunk.text
+        assert PAGE_MARKER_RE.sub("", text[chunk.start:chunk.end]) == chunk.text
+        assert chunk.page_start == page_at(text, chunk.start) and chunk.page_end == page_at(text, chunk.end)
+    assert {chunk.page_start for chunk in chunks} == {1, 2, 3, 4}
+    # Overlap never carries a sentence across a page break
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if chunk.page_start > previous.page_end:
+            assert chunk.start >= previous.end
+
+
+def test_an_edit_only_moves_boundaries_up_to_the_next_anchor():
+    text = sentence_text(300, seed=2)
+    edited = text.replace("Step 3 checks", "Step 3 first checks", 1)
+    before = [chunk.text for chunk in chunks_of(text)]
+    after = [chunk.text for chunk in chunks_of(edited)]
+    assert before[0] != after[0]
+    assert before[-len(before) // 2:] == after[-len(before) // 2:]
+
+
+def test_text_without_spaces_is_cut_to_bounded_chunks():
+    text = base64.b64encode(random.Random(3).randbytes(300_000)).decode("ascii")
+    chunks = chunks_of(text, parts=40, max_tokens=100)
+    assert len(chunks) > 100
+    assert all(chunk.tokens <= 100 and text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert "".join(text[chunk.start:chunk.end] for chunk in chunks) == text
+
+
+def test_hard_cut_never_splits_a_page_marker():
+    text = "--- Page 1 ---\n" + "A" * 70_000 + "\n\n" + "--- Page 2 ---\nPage two text here.\n\n"
+    split = text.index("--- Page 2")
+    chunks = list(StructuredChunker().iter_chunks([text[:split], text[split:]]))
+    assert all("---" not in chunk.text for chunk in chunks)
+    assert all(PAGE_MARKER_RE.sub("", text[chunk.start:chunk.end]) == chunk.text for chunk in chunks)
+    assert chunks[0].page_start == 1 and chunks[-1].page_end == 2
+
+
+def test_fixed_chunker_slices_with_pages():
+    text = "--- Page 1 ---\n" + "a" * 1500 + "--- Page 2 ---\n" + "b" * 700
+    chunks = list(FixedChunker(chunk_size=1000).iter_chunks([text[:900], text[900:]]))
+    assert [chunk.text for chunk in chunks] == [text[:1000], text[1000:2000], text[2000:]]
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(0, 1000), (1000, 2000), (2000, len(text))]
+    assert [(chunk.page_start, chunk.page_end) for chunk in chunks] == [(1, 1), (1, 2), (2, 2)]
@@ -0,0 +1,74 @@
+"""SQLite document store: segmented bodies, row-level writes, the JSON migration."""
+import json
+
+import pytest
+
+import doc_store
+from doc_store import DocumentStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(doc_store, "SEGMENT_CHARS", 16)
+    return DocumentStore(str(tmp_path / "documents.db"))
+
+
+def document(doc_id, content, session_id="session", **extra):
+    return {"id": doc_id, "filename": f"{doc_id}.txt", "uploaded_at": "2024-01-01T00:00:00", "size": len(content),
+            "session_id": session_id, "content": content, **extra}
+
+
+def test_bodies_are_stored_in_segments_and_read_back(store):
+    content = "The pressure relief valve V-12 is tested every quarter." * 3
+    store.add_many([document("a", content), document("empty", "")])
+    assert list(store.iter_content("a")) == [content[i:i + 16] for i in range(0, len(content), 16)]
+    assert store.get_content("a") == content and store.get_content("empty") == ""
+    assert store.read_range("a", 10, 30) == content[10:40]
+    listed = store.get("a")
+    assert "content" not in listed and listed["preview"] == doc_store.make_preview(content)
+    assert store.get("a", with_content=True)["content"] == content
+    assert store.get("missing") is None and store.get_content("missing") is None
+
+
+def test_writes_touch_only_the_rows_they_change(store):
+    store.add_many([document("a", "First body."), document("b", "Second body.", file_hash="f" * 64)])
+    before = store.get("b")
+    assert store.update_content("a", "First body, edited at length to span segments.")
+    assert store.get_content("a") == "First body, edited at length to span segments."
+    assert store.get("a")["size"] == len("First body, edited at length to span segments.")
+    assert store.get("b") == before and store.get_content("b") == "Second body."
+    assert store.find_by_file_hash("f" * 64, "session") == "b" and store.find_by_file_hash("f" * 64, "other") is None
+    assert store.update_content("b", "Edited.") and store.find_by_file_hash("f" * 64) is None
+    assert store.delete("a") and not store.delete("a")
+    assert list(store.iter_content("a")) == [] and store.count() == 1 and store.count("session") == 1
+    assert not store.update_content("a", "Gone.")
+
+
+def test_staged_text_is_adopted_when_the_document_is_added(store):
+    writer = store.content_writer("staged")
+    for part in ["--- Page 1 ---\nThe boiler feed pump ", "starts at 6 bar.\n\n", "--- Page 2 ---\nIt stops at 9 bar."]:
+        writer.write(part)
+    writer.close()
+    assert store.staged_documents() == {"staged"} and store.get("staged") is None
+    store.add_many([{"id": "staged", "filename": "pump.pdf", "uploaded_at": "2024-01-01T00:00:00",
+                     "size": writer.size, "file_type": "pdf", "session_id": "session", "preview": writer.preview}])
+    text = "--- Page 1 ---\nThe boiler feed pump starts at 6 bar.\n\n--- Page 2 ---\nIt stops at 9 bar."
+    assert store.get_content("staged") == text and store.staged_documents() == set()
+    assert store.page_count("staged") == 2 and store.page_span("staged", 2)[0] == text.index("--- Page 2 ---")
+    discarded = store.content_writer("discarded")
+    discarded.write("Never registered." * 4)
+    discarded.discard()
+    assert store.staged_documents() == set()
+
+
+def test_the_legacy_json_file_is_imported_once(store, tmp_path):
+    store.add_many([document("known", "Already stored.")])
+    legacy = [{"id": "known", "filename": "known.txt", "uploaded_at": "2023-05-01T00:00:00", "content": "Stale copy."},
+              {"id": "old", "filename": "old.txt", "uploaded_at": "2023-05-01T00:00:00", "content": "From the JSON file."}]
+    path = tmp_path / "ui_documents.json"
+    path.write_text(json.dumps(legacy))
+    assert store.import_json(str(path)) == 1
+    assert store.get_content("old") == "From the JSON file." and store.get("old")["size"] == len("From the JSON file.")
+    assert store.get_content("known") == "Already stored."
+    assert not path.exists() and (tmp_path / "ui_documents.json.migrated").exists()
+    assert store.import_json(str(path)) == 0
@@ -0,0 +1,66 @@
+"""Embedding backends: the configured batch size reaches the model, specs and signatures are checked."""
+import numpy as np
+import pytest
+
+import embedders
+# Bound at collection, before the `backend` fixture swaps the module attribute for the hashing embedder
+from embedders import BatchedSentenceTransformerEmbeddingFunction, OnnxEmbeddingFunction
+
+
+class RecordingModel:
+    """sentence-transformers model stand-in recording how it was asked to encode"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append((texts, kwargs))
+        return np.ones((len(texts), 4), dtype=np.float64)
+
+
+def test_sentence_transformers_encode_with_the_configured_batch_size():
+    function = BatchedSentenceTransformerEmbeddingFunction.__new__(BatchedSentenceTransformerEmbeddingFunction)
+    function._model, function.batch_size, function.normalize_embeddings = RecordingModel(), 7, False
+    vectors = function(["first chunk", "second chunk"])
+    assert [vector.dtype for vector in vectors] == [np.float32, np.float32]
+    texts, kwargs = function._model.calls[0]
+    assert texts == ["first chunk", "second chunk"] and kwargs["batch_size"] == 7
+
+
+def test_the_spec_builds_the_backend_with_its_batch_size(monkeypatch):
+    built = []
+    monkeypatch.setattr(embedders, "BatchedSentenceTransformerEmbeddingFunction",
+                        lambda **kwargs: built.append(kwargs) or "model")
+    assert embedders.EmbedderSpec("all-MiniLM-L6-v2", batch_size=64).build() == "model"
+    assert built == [{"model_name": "all-MiniLM-L6-v2", "batch_size": 64}]
+    for spec in (embedders.EmbedderSpec("m", backend="tensorflow"), embedders.EmbedderSpec("m", quantize="int4"),
+                 embedders.EmbedderSpec("m", quantize="int8")):    # int8 needs the onnx backend
+        with pytest.raises(ValueError):
+            spec.build()
+    assert embedders.EmbedderSpec("m", "onnx", "int8").model_id == "m:int8"
+    assert embedders.EmbedderSpec("m", "onnx").model_id == embedders.EmbedderSpec("m").model_id == "m"
+
+
+def test_onnx_batches_texts_of_similar_length_and_keeps_their_order():
+    function = OnnxEmbeddingFunction.__new__(OnnxEmbeddingFunction)
+    function.batch_size = 2
+    batches = []
+
+    def forward(texts):
+        batches.append(texts)
+        return np.array([[len(text), 1.0] for text in texts])
+    function._forward = forward
+    texts = ["a" * 9, "a", "a" * 5, "a" * 2, "a" * 7]
+    vectors = function(texts)
+    assert batches == [["a", "a" * 2], ["a" * 5, "a" * 7], ["a" * 9]]
+    assert [int(vector[0]) for vector in vectors] == [9, 1, 5, 2, 7]
+    assert all(vector.dtype == np.float32 for vector in vectors)
+
+
+def test_collections_from_another_model_are_refused():
+    embedders.check_signature({}, "m", 384, "documents")    # Nothing recorded: nothing to compare
+    embedders.check_signature({embedders.MODEL_KEY: "m", embedders.DIMENSIONS_KEY: 384}, "m", 384, "documents")
+    with pytest.raises(embedders.EmbeddingMismatchError, match="other-model"):
+        embedders.check_signature({embedders.MODEL_KEY: "other-model"}, "m", 384, "documents")
+    with pytest.raises(embedders.EmbeddingMismatchError, match="768-dim"):
+        embedders.check_signature({embedders.DIMENSIONS_KEY: 768}, "m", 384, "documents")
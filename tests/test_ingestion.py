@@ -0,0 +1,163 @@
+"""Ingestion pipeline: batched embedding and storage, PDF extraction on the process pool, streaming, duplicates."""
+import os
+
+import numpy as np
+import pytest
+
+import ingestion
+from benchmarks import corpus
+from chunker import Chunk
+from doc_store import DocumentStore
+
+
+class RecordingCollection:
+    """Records every `add`; fails the calls listed in `fail_calls`"""
+
+    def __init__(self, fail_calls=()):
+        self.calls = []
+        self.fail_calls = set(fail_calls)
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self.calls.append(ids)
+        if len(self.calls) - 1 in self.fail_calls:
+            raise RuntimeError("disk full")
+
+
+class CountingEmbedder:
+    """Embedding function counting its forward passes"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(len(texts))
+        return [np.ones(4, dtype=np.float32) for _ in texts]
+
+
+def make_chunks(count):
+    return [Chunk(f"Chunk number {i}.", i * 20, i * 20 + 16) for i in range(count)]
+
+
+def test_chunks_are_embedded_and_stored_in_batches():
+    collection, embedder = RecordingCollection(), CountingEmbedder()
+    report = ingestion.embed_and_store(collection, embedder, iter(make_chunks(250)), "doc", {"source": "a.txt"},
+                                       batch_size=100)
+    assert embedder.batches == [100, 100, 50]
+    assert [len(ids) for ids in collection.calls] == [100, 100, 50]
+    assert collection.calls[0][0] == ingestion.chunk_id("doc", 0)
+    assert collection.calls[2][-1] == ingestion.chunk_id("doc", 249)
+    assert report["stored"] == 250 and report["batches"] == 3 and report["failed"] == 0 and report["errors"] == []
+
+
+def test_a_failed_batch_is_reported_and_the_rest_stored():
+    collection = RecordingCollection(fail_calls={1})
+    report = ingestion.embed_and_store(collection, CountingEmbedder(), iter(make_chunks(25)), "doc", {},
+                                       batch_size=10)
+    assert report["stored"] == 15 and report["failed"] == 10 and report["batches"] == 3
+    assert report["errors"] == [{"chunks": "10-19", "stage": "store", "error": "disk full"}]
+
+
+@pytest.fixture
+def pdf_pool(monkeypatch):
+    """A small PDF pool splitting files into two-page ranges, shut down afterwards"""
+    ingestion.shutdown_pdf_pool()
+    monkeypatch.setattr(ingestion, "PDF_WORKERS", 2)
+    monkeypatch.setattr(ingestion, "PDF_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(ingestion, "PDF_MAX_INFLIGHT", 2)
+    yield
+    ingestion.shutdown_pdf_pool()
+
+
+def write_pdf(tmp_path, pages):
+    path = tmp_path / "manual.pdf"
+    path.write_bytes(corpus.make_pdf(pages))
+    return str(path)
+
+
+def test_pdf_pages_are_extracted_on_the_pool_in_page_order(pdf_pool, tmp_path):
+    path = write_pdf(tmp_path, [f"Page body {i} mentions gasket G-{i}." for i in range(1, 8)])
+    progress = {}
+    pages = list(ingestion.iter_pdf_pages(path, progress))
+    assert [number for number, _ in pages] == list(range(1, 8))
+    assert all(f"gasket G-{number}" in text for number, text in pages)
+    assert progress == {"pages_total": 7, "pages_extracted": 7}
+    assert ingestion.get_pdf_pool().submit(os.getpid).result() != os.getpid()
+
+
+def test_pdf_uploads_go_through_the_pipeline(pdf_pool, client, headers, tmp_path):
+    path = write_pdf(tmp_path, ["The intake filter F-1 is changed monthly.", "", "Torque the flange bolts evenly."])
+    with open(path, "rb") as f:
+        body = client.post("/upload", files={"file": ("manual.pdf", f, "application/pdf")}, headers=headers).json()
+    assert body["status"] == "success" and body["embedding"]["stored"] >= 1
+    document = client.get(f"/ui-documents/{body['document_id']}", headers=headers).json()["document"]
+    assert document["file_type"] == "pdf" and document["pages"] == 3
+    assert "--- Page 3 ---\nTorque the flange bolts evenly." in document["content"]
+
+
+def test_text_uploads_are_decoded_in_blocks(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingestion, "TEXT_BLOCK_SIZE", 64)
+    text = "Schraube lösen, Dichtung prüfen, Ölstand messen. " * 40    # Multi-byte characters across block edges
+    path = tmp_path / "notes.txt"
+    path.write_text(text, encoding="utf-8")
+    parts = list(ingestion.iter_document_parts(str(path), "notes.txt"))
+    assert len(parts) > 20 and all(len(part) <= 64 for part in parts)
+    assert "".join(parts) == text
+    path.write_bytes("Caf\xe9 cr\xe8me.".encode("latin-1"))    # Not UTF-8: read as latin-1
+    assert "".join(ingestion.iter_document_parts(str(path), "notes.txt")) == "Caf\xe9 cr\xe8me."
+
+
+def test_chunks_are_embedded_while_the_file_is_still_being_read(monkeypatch, tmp_path):
+    events = []
+    read_parts = ingestion.iter_document_parts
+
+    def logged_parts(*args, **kwargs):
+        for part in read_parts(*args, **kwargs):
+            events.append("part")
+            yield part
+
+    class LoggingEmbedder(CountingEmbedder):
+        def __call__(self, texts):
+            events.append("embed")
+            return super().__call__(texts)
+
+    monkeypatch.setattr(ingestion, "TEXT_BLOCK_SIZE", 256)
+    monkeypatch.setattr(ingestion, "iter_document_parts", logged_parts)
+    text = "\n\n".join(f"Paragraph {i}. The drain valve D-{i} is flushed after every shift." for i in range(300))
+    path = tmp_path / "long.txt"
+    path.write_text(text, encoding="utf-8")
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    document, report = ingestion.ingest_file(str(path), "long.txt", "session", RecordingCollection(),
+                                             LoggingEmbedder(), store, batch_size=8)
+    assert report["stored"] > 8 and events.count("part") > 10
+    assert events.index("embed") < len(events) - 1 - events[::-1].index("part")    # Embedding began before the last part
+    store.add_many([document])
+    assert store.get_content(document["id"]) == text and document["size"] == len(text)
+
+
+def upload_body(client, headers, filename, data):
+    return client.post("/upload", files={"file": (filename, data, "text/plain")}, headers=headers).json()
+
+
+def test_identical_uploads_reuse_the_text_and_vectors(monkeypatch, client, headers):
+    data = "\n\n".join(f"Step {i}. Bleed the hydraulic line H-{i} until no air is left." for i in range(20)).encode()
+    first = upload_body(client, headers, "bleeding.txt", data)
+    assert first["embedding"]["duplicate_of"] is None and first["embedding"]["stored"] >= 2
+
+    def not_parsed(*args, **kwargs):
+        raise AssertionError("a duplicate upload was parsed again")
+    with monkeypatch.context() as patched:
+        patched.setattr(ingestion, "iter_document_parts", not_parsed)
+        again = upload_body(client, headers, "bleeding-copy.txt", data)
+    assert again["status"] == "success" and again["document_id"] != first["document_id"]
+    assert again["embedding"]["duplicate_of"] == first["document_id"]
+    assert again["embedding"]["cached"] == again["embedding"]["stored"] == first["embedding"]["stored"]
+    assert client.get(f"/ui-documents/{again['document_id']}", headers=headers).json()["document"]["content"] == \
+        data.decode()
+    # Another session parses the file itself, but its chunk vectors still come from the cache
+    other = upload_body(client, {"X-Session-ID": headers["X-Session-ID"] + "-other"}, "bleeding.txt", data)
+    assert other["embedding"]["duplicate_of"] is None
+    assert other["embedding"]["cached"] == other["embedding"]["stored"]
+    # An edited document no longer stands for the file it came from
+    for doc_id in (first["document_id"], again["document_id"]):
+        client.put(f"/ui-documents/{doc_id}", json={"content": "Rewritten."}, headers=headers)
+    assert upload_body(client, headers, "bleeding.txt", data)["embedding"]["duplicate_of"] is None
@@ -0,0 +1,61 @@
+"""Background ingestion jobs: progress polling, session scoping, the bounded queue."""
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import jobs
+
+
+def wait_for_job(client, headers, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}", headers=headers).json()["job"]
+        if job["finished_at"]:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_a_job_reports_per_file_progress(client, headers):
+    files = [("files", ("a.txt", b"The cooling tower fan is inspected weekly.", "text/plain")),
+             ("files", ("b.txt", b"The chiller C-1 restarts after a power cut.", "text/plain")),
+             ("files", ("empty.txt", b"   ", "text/plain"))]
+    response = client.post("/jobs", files=files, headers=headers)
+    assert response.status_code == 202
+    accepted = response.json()
+    assert accepted["status"] == "accepted" and accepted["total_files"] == 3
+    job = wait_for_job(client, headers, accepted["job_id"])
+    assert job["status"] == "completed" and job["completed_files"] == 3
+    assert job["successful"] == 2 and job["failed"] == 1
+    done = [entry for entry in job["files"] if entry["stage"] == "done"]
+    assert {entry["filename"] for entry in done} == {"a.txt", "b.txt"}
+    assert all(entry["chunks_embedded"] == entry["chunks_total"] >= 1 and entry["document_id"] for entry in done)
+    assert job["files"][2]["stage"] == "skipped" and job["files"][2]["error"]
+    listed = {doc["id"] for doc in client.get("/ui-documents", headers=headers).json()["documents"]}
+    assert listed == {entry["document_id"] for entry in done}
+    # Another session neither sees the job nor lists it
+    other = {"X-Session-ID": str(uuid.uuid4())}
+    assert client.get(f"/jobs/{accepted['job_id']}", headers=other).status_code == 404
+    assert client.get("/jobs", headers=other).json()["jobs"] == []
+
+
+def test_the_queue_is_bounded_and_failures_are_recorded():
+    def process_file(path, filename, progress, session_id):
+        if filename == "bad.txt":
+            raise RuntimeError("unreadable")
+        progress["stage"] = "done"
+
+    async def scenario():
+        manager = jobs.JobManager(process_file, None, concurrency=1, queue_size=2)
+        with pytest.raises(jobs.QueueFullError):
+            await manager.submit([("1", "a.txt"), ("2", "b.txt"), ("3", "c.txt")])
+        job = await manager.submit([("1", "good.txt"), ("2", "bad.txt")], "session")
+        await manager.queue.join()
+        await manager.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "completed" and job["successful"] == 1 and job["failed"] == 1
+    assert job["files"][1]["stage"] == "failed" and job["files"][1]["error"] == "unreadable"
@@ -0,0 +1,77 @@
+"""LexicalIndex: tokenization, BM25 scores against the formula, session scoping and deletes."""
+import math
+
+import pytest
+
+from lexical_index import BM25_B, BM25_K1, LexicalIndex, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    return LexicalIndex(str(tmp_path / "lexical.db"))
+
+
+def bm25(tf: int, length: int, n: int, chunks: int, avgdl: float) -> float:
+    idf = math.log(1 + (chunks - n + 0.5) / (n + 0.5))
+    return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl))
+
+
+def add(index, chunk_id, text, doc_id="doc", session_id="s1"):
+    index.add([chunk_id], [text], [{"doc_id": doc_id, "session_id": session_id}])
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("The pump shows ERR-4012 on v2.3.1") == ["pump", "shows", "err-4012", "err", "4012",
+                                                             "v2.3.1", "v2", "3", "1"]
+
+
+def test_scores_follow_bm25(index):
+    add(index, "a", "pump seal pump seal pump")    # tf(pump)=3, length 5
+    add(index, "b", "pump bearing")    # tf(pump)=1, length 2
+    add(index, "c", "valve spring valve")    # no pump, length 3
+    avgdl = (5 + 2 + 3) / 3
+    hits = index.search("pump", n_results=10)
+    assert [hit["id"] for hit in hits] == ["a", "b"]
+    assert hits[0]["score"] == pytest.approx(bm25(3, 5, 2, 3, avgdl))
+    assert hits[1]["score"] == pytest.approx(bm25(1, 2, 2, 3, avgdl))
+    assert hits[0]["document"] == "pump seal pump seal pump"
+    assert hits[0]["metadata"] == {"doc_id": "doc", "session_id": "s1"}
+
+
+def test_query_terms_add_up(index):
+    add(index, "a", "pump seal")
+    add(index, "b", "pump bearing")
+    add(index, "c", "valve spring")
+    avgdl = 2.0
+    hits = index.search("seal of the pump", n_results=10)    # "of", "the" are stopwords
+    assert hits[0]["id"] == "a"
+    assert hits[0]["score"] == pytest.approx(bm25(1, 2, 2, 3, avgdl) + bm25(1, 2, 1, 3, avgdl))
+
+
+def test_exact_identifier_wins(index):
+    add(index, "a", "Error ERR-4012 means the seal leaks")
+    add(index, "b", "Error ERR-4013 means the bearing is worn")
+    assert index.search("ERR-4012", n_results=1)[0]["id"] == "a"
+
+
+def test_session_is_scored_as_its_own_corpus(index):
+    add(index, "a", "pump seal", session_id="s1")
+    add(index, "b", "valve spring", session_id="s1")
+    add(index, "c", "pump pump pump", session_id="s2")
+    hits = index.search("pump", session_id="s1")
+    assert [hit["id"] for hit in hits] == ["a"]
+    assert hits[0]["score"] == pytest.approx(bm25(1, 2, 1, 2, 2.0))
+    assert index.count("s1") == 2 and index.count("s2") == 1 and index.count() == 3
+
+
+def test_replacing_and_deleting_keep_stats(index):
+    add(index, "a", "pump seal", doc_id="d1")
+    add(index, "a", "valve spring coil", doc_id="d1")    # Same id: replaced
+    add(index, "b", "pump bearing", doc_id="d2")
+    assert index.count() == 2
+    assert [hit["id"] for hit in index.search("pump")] == ["b"]
+    assert index.delete_document("d2") == 1
+    assert index.search("pump") == []
+    assert index.count() == 1
+    assert index.search("spring")[0]["score"] == pytest.approx(bm25(1, 3, 1, 1, 3.0))
+    assert index.chunk_ids() == {"a"}
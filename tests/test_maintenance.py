@@ -0,0 +1,38 @@
+"""Maintenance: orphaned chunks are removed, the embedding cache keeps vectors in use."""
+import numpy as np
+
+
+def stored(backend, where):
+    return backend.resources.collection().get(where=where, include=["metadatas"])
+
+
+def test_orphaned_chunks_are_removed(backend, headers, upload):
+    doc_id = upload(headers, "pump.txt", "The feed pump P-3 is primed before every start.")
+    session_id = headers[backend.SESSION_HEADER]
+    orphan = {"doc_id": "gone-" + session_id, "session_id": session_id, "chunk": 0}
+    backend.resources.collection().add(ids=["orphan-" + session_id], documents=["Left behind by a failed upload."],
+                                       embeddings=[np.ones(backend.resources.dimensions, dtype=np.float32)],
+                                       metadatas=[orphan])
+    report = backend.maintenance.run(rebuild=False)
+    assert report["status"] == "success"
+    shared = report["collections"][backend.resources.collection_name]
+    assert shared["orphans"] >= 1 and shared["removed"] >= 1
+    assert stored(backend, {"doc_id": orphan["doc_id"]})["ids"] == []
+    assert stored(backend, {"doc_id": doc_id})["ids"]
+
+
+def test_vectors_of_chunks_stored_during_a_run_are_kept(backend, headers, monkeypatch, upload):
+    stale = "0" * 64
+    backend.embedding_cache.put_many([(stale, np.ones(backend.resources.dimensions, dtype=np.float32))])
+    uploaded = []
+    reconcile = backend.maintenance._reconcile_lexical
+
+    def upload_meanwhile(collections):    # An ingest that commits after the run's first scan
+        uploaded.append(upload(headers, "late.txt", "The gearbox oil is changed every six months."))
+        return reconcile(collections)
+    monkeypatch.setattr(backend.maintenance, "_reconcile_lexical", upload_meanwhile)
+    report = backend.maintenance.run(rebuild=False)
+    assert report["status"] == "success" and report["embedding_cache"]["removed"] >= 1
+    hashes = [meta["content_hash"] for meta in stored(backend, {"doc_id": uploaded[0]})["metadatas"]]
+    assert hashes and set(backend.embedding_cache.get_many(hashes)) == set(hashes)
+    assert stale not in backend.embedding_cache.get_many([stale])
@@ -0,0 +1,188 @@
+"""OllamaClient against a fake Ollama server (a local http.server speaking /api/generate).
+
+The fake streams one NDJSON line per word of the prompt. Prompts starting with
+"http-500" or "model-error" fail, and prompts starting with "slow" wait before
+the first token.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_client import OllamaClient, OllamaError
+
+TOKEN_DELAY = 0.05    # Seconds between streamed tokens
+SLOW_DELAY = 1.0    # Seconds before the first token of a "slow" prompt
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"    # The body ends when the connection closes
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self._respond(body["prompt"])
+        except (BrokenPipeError, ConnectionResetError):    # The client gave up (timeout tests)
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _respond(self, prompt: str):
+        if prompt.startswith("http-500"):
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b"internal error")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        if prompt.startswith("model-error"):
+            self._line({"error": "model 'test-model' not found"})
+            return
+        if prompt.startswith("slow"):
+            time.sleep(SLOW_DELAY)
+        words = prompt.split()
+        for i, word in enumerate(words):
+            time.sleep(TOKEN_DELAY)
+            self._line({"response": word if i == 0 else " " + word, "done": False})
+        self._line({"response": "", "done": True})
+
+    def _line(self, data):
+        self.wfile.write((json.dumps(data) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests, httpd.active, httpd.max_active = [], 0, 0
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/api/generate"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run(client: OllamaClient, coroutine_function):
+    """Run `coroutine_function(client)` on a fresh loop, closing the client's pool afterwards"""
+    async def main():
+        try:
+            return await coroutine_function(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_streams_tokens_as_they_arrive(server):
+    client = OllamaClient(server.url, "test-model")
+
+    async def collect(client):
+        tokens, times = [], []
+        start = time.perf_counter()
+        async for token in client.stream("one two three four"):
+            tokens.append(token)
+            times.append(time.perf_counter() - start)
+        return tokens, times
+
+    tokens, times = run(client, collect)
+    assert tokens == ["one", " two", " three", " four"]
+    assert times[0] < times[-1] - 2 * TOKEN_DELAY    # The first token came before the generation finished
+    assert server.requests == [{"model": "test-model", "prompt": "one two three four", "stream": True}]
+    assert client.counters["generations"] == 1
+
+
+def test_generate_joins_tokens(server):
+    client = OllamaClient(server.url, "test-model")
+    assert run(client, lambda client: client.generate("hello there")) == "hello there"
+
+
+def test_identical_prompts_are_coalesced(server):
+    client = OllamaClient(server.url, "test-model")
+
+    async def ask(client):
+        return await asyncio.gather(*(client.generate("same question here") for _ in range(5)),
+                                    client.generate("another question"))
+
+    answers = run(client, ask)
+    assert answers == ["same question here"] * 5 + ["another question"]
+    assert sorted(request["prompt"] for request in server.requests) == ["another question", "same question here"]
+    assert client.counters["coalesced"] == 4
+    assert client.stats()["in_flight"] == 0
+
+
+def test_late_subscriber_gets_tokens_already_streamed(server):
+    client = OllamaClient(server.url, "test-model")
+
+    async def ask(client):
+        first = asyncio.create_task(client.generate("a b c d e f"))
+        await asyncio.sleep(TOKEN_DELAY * 3)    # Some tokens are out before the second caller joins
+        second = await client.generate("a b c d e f")
+        return await first, second
+
+    assert run(client, ask) == ("a b c d e f", "a b c d e f")
+    assert len(server.requests) == 1
+
+
+def test_concurrency_is_capped(server):
+    client = OllamaClient(server.url, "test-model", max_concurrency=1)
+
+    async def ask(client):
+        return await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(3)))
+
+    assert run(client, ask) == ["prompt 0", "prompt 1", "prompt 2"]
+    assert server.max_active == 1
+
+
+def test_http_error_raises(server):
+    client = OllamaClient(server.url, "test-model")
+    with pytest.raises(OllamaError, match="HTTP 500"):
+        run(client, lambda client: client.generate("http-500 please"))
+    assert client.counters["failures"] == 1
+
+
+def test_error_line_raises(server):
+    client = OllamaClient(server.url, "test-model")
+    with pytest.raises(OllamaError, match="not found"):
+        run(client, lambda client: client.generate("model-error please"))
+
+
+def test_error_reaches_every_coalesced_caller(server):
+    client = OllamaClient(server.url, "test-model")
+
+    async def ask(client):
+        return await asyncio.gather(*(client.generate("http-500 again") for _ in range(3)), return_exceptions=True)
+
+    results = run(client, ask)
+    assert all(isinstance(result, OllamaError) for result in results)
+    assert len(server.requests) == 1
+
+
+def test_timeout_raises(server):
+    client = OllamaClient(server.url, "test-model", timeout=0.3)
+    start = time.perf_counter()
+    with pytest.raises(OllamaError, match="timed out"):
+        run(client, lambda client: client.generate("slow answer"))
+    assert time.perf_counter() - start < SLOW_DELAY
+    assert client.counters["timeouts"] == 1
+
+
+def test_unreachable_server_raises():
+    client = OllamaClient("http://127.0.0.1:9/api/generate", "test-model", connect_timeout=1)
+    with pytest.raises(OllamaError):
+        run(client, lambda client: client.generate("anyone there"))
+    assert client.counters["failures"] == 1
@@ -0,0 +1,64 @@
+"""Lazy resources: nothing loads before first use, failed loads back off, readiness vs liveness."""
+import time
+
+import resources
+from benchmarks.fake_embedder import HashingEmbeddingFunction
+
+
+class Spec:
+    """EmbedderSpec stand-in building the hashing embedder; the first `failures` builds raise"""
+
+    backend = "test"
+
+    def __init__(self, model="hashing", failures=0):
+        self.model = self.model_id = model
+        self.failures = failures
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        if self.builds <= self.failures:
+            raise OSError("model download cut short")
+        return HashingEmbeddingFunction(dimensions=8)
+
+
+def test_nothing_is_loaded_before_first_use(tmp_path):
+    spec, loaded = Spec(), []
+    store = resources.Resources(str(tmp_path), spec)
+    store.on_ready.append(loaded.append)
+    assert store.state == resources.STATE_COLD and store.count() is None and not store.status()["ready"]
+    assert spec.builds == 0 and not loaded
+    collection = store.collection()
+    assert store.ready and store.count() == 0 and store.dimensions == 8
+    assert spec.builds == 1 and loaded == [collection]
+    assert {"client_s", "model_load_s", "collection_s", "time_to_ready_s"} <= store.timings.keys()
+    assert store.collection() is collection and spec.builds == 1
+
+
+def test_a_failed_load_is_retried_after_a_cooldown(tmp_path):
+    spec = Spec(failures=1)
+    store = resources.Resources(str(tmp_path), spec)
+    assert store.collection() is None
+    status = store.status()
+    assert status["state"] == resources.STATE_FAILED and "cut short" in status["error"] and status["retry_in_s"] > 0
+    assert store.collection() is None and spec.builds == 1    # Not retried while cooling down
+    store.retry_at = time.monotonic()
+    assert store.collection() is not None and store.ready and store.failures == 0 and spec.builds == 2
+
+
+def test_a_store_written_by_another_model_fails_for_good(tmp_path):
+    resources.Resources(str(tmp_path), Spec("model-a")).collection().add(
+        ids=["a"], documents=["Written by model A."], embeddings=[[1.0] * 8])
+    store = resources.Resources(str(tmp_path), Spec("model-b"))
+    assert store.collection() is None
+    assert store.state == resources.STATE_FAILED and store.retry_at is None and "model-a" in store.error
+
+
+def test_readiness_is_separate_from_liveness(backend, client, monkeypatch):
+    ready = client.get("/health/ready")
+    assert ready.status_code == 200 and ready.json()["status"] == "ready"
+    monkeypatch.setattr(backend.resources, "state", resources.STATE_LOADING)
+    warming = client.get("/health/ready")
+    assert warming.status_code == 503 and warming.json()["state"] == resources.STATE_LOADING
+    assert client.get("/health/live").json() == {"status": "alive"}
+    assert client.get("/health").json()["ready"] is False
@@ -0,0 +1,113 @@
+"""Result fusion and re-ranking helpers in retrieval.py, and hybrid retrieval in the app."""
+import pytest
+
+import retrieval
+from retrieval import RRF_K, reciprocal_rank_fusion
+
+
+def ranking(ids, distances=None):
+    """Query-shaped results for `ids`, best first"""
+    return {"ids": [list(ids)], "documents": [[f"text of {cid}" for cid in ids]],
+            "metadatas": [[{"doc_id": cid} for cid in ids]],
+            "distances": [list(distances) if distances else [None] * len(ids)]}
+
+
+def test_rrf_sums_reciprocal_ranks():
+    dense = ranking(["a", "b", "c"], distances=[0.1, 0.2, 0.3])
+    lexical = ranking(["c", "d", "a"])
+    fused = reciprocal_rank_fusion([dense, lexical], n_results=10)
+    expected = {"a": 1 / (RRF_K + 1) + 1 / (RRF_K + 3), "b": 1 / (RRF_K + 2),
+                "c": 1 / (RRF_K + 3) + 1 / (RRF_K + 1), "d": 1 / (RRF_K + 2)}
+    assert set(fused["ids"][0]) == set(expected)
+    assert fused["scores"][0] == pytest.approx([expected[cid] for cid in fused["ids"][0]])
+    assert fused["scores"][0] == sorted(fused["scores"][0], reverse=True)
+    assert set(fused["ids"][0][:2]) == {"a", "c"}    # Found by both retrievers
+    # Each chunk keeps its text, metadata and the dense distance when it has one
+    position = {cid: i for i, cid in enumerate(fused["ids"][0])}
+    assert fused["documents"][0][position["d"]] == "text of d"
+    assert fused["metadatas"][0][position["c"]] == {"doc_id": "c"}
+    assert fused["distances"][0][position["c"]] == 0.3
+    assert fused["distances"][0][position["d"]] is None
+
+
+def test_rrf_keeps_n_results():
+    fused = reciprocal_rank_fusion([ranking("abcde"), ranking("edcba")], n_results=2)
+    assert len(fused["ids"][0]) == 2
+    assert all(len(fused[field][0]) == 2 for field in ("documents", "metadatas", "distances", "scores"))
+
+
+def test_rrf_of_one_ranking_keeps_its_order():
+    fused = reciprocal_rank_fusion([ranking(["x", "y", "z"])], n_results=3)
+    assert fused["ids"][0] == ["x", "y", "z"]
+
+
+def test_from_lexical_is_query_shaped():
+    hits = [{"id": "a", "document": "pump", "metadata": {"doc_id": "d"}, "score": 2.5}]
+    assert retrieval.from_lexical(hits) == {"ids": [["a"]], "documents": [["pump"]], "metadatas": [[{"doc_id": "d"}]],
+                                            "distances": [[None]], "scores": [[2.5]]}
+
+
+def test_hybrid_is_the_fusion_of_dense_and_lexical(backend, client, headers, upload):
+    upload(headers, "manual.txt", "The seal of pump P-100 fails when the shaft is misaligned. " * 30 +
+           "\n\nError ERR-4012 means the relief valve is stuck. " * 30)
+    upload(headers, "other.txt", "Bearings should be greased every three months. " * 40)
+    session = backend.sessions.get(headers[backend.SESSION_HEADER])
+    query = "ERR-4012 relief valve"
+    dense = backend.retrieve_many([query], session, n_results=5, mode="vector")[0]
+    lexical = backend.retrieve_many([query], session, n_results=5, mode="lexical")[0]
+    hybrid = backend.retrieve_many([query], session, n_results=5, mode="hybrid")[0]
+    assert hybrid["ids"] == reciprocal_rank_fusion([dense, lexical], 5)["ids"]
+    assert "ERR-4012" in hybrid["documents"][0][0]
+
+
+# ---------------------------------------------------------------- re-ranking
+
+def test_top_k_is_stable_on_ties():
+    assert retrieval.top_k([0.2, 0.9, 0.2, 0.5], 3) == [1, 3, 0]
+
+
+def test_fusing_with_retrieval_order_blends_both_ranks():
+    fused = retrieval.fuse_with_retrieval_order([0.1, 0.9, 0.5])
+    # Retrieval ranks 1, 2, 3; score ranks 3, 1, 2
+    assert fused.tolist() == pytest.approx([1 / (RRF_K + 1) + 1 / (RRF_K + 3), 1 / (RRF_K + 2) + 1 / (RRF_K + 1),
+                                            1 / (RRF_K + 3) + 1 / (RRF_K + 2)])
+    assert retrieval.top_k(fused, 3) == [1, 0, 2]
+
+
+def test_select_keeps_every_field_in_order():
+    results = {**ranking(["a", "b", "c"], distances=[0.1, 0.2, 0.3]), "scores": [[1.0, 2.0, 3.0]]}
+    assert retrieval.select(results, [2, 0]) == {
+        "ids": [["c", "a"]], "documents": [["text of c", "text of a"]], "metadatas": [[{"doc_id": "c"}, {"doc_id": "a"}]],
+        "distances": [[0.3, 0.1]], "scores": [[3.0, 1.0]]}
+
+
+def test_split_sentences_drops_short_duplicate_and_marker_lines():
+    text = "--- Page 2 ---\nThe seal fails when misaligned. Too short. The seal fails when misaligned.\nCheck the coupling first!"
+    assert retrieval.split_sentences(text) == ["The seal fails when misaligned.", "Check the coupling first!"]
+
+
+def test_top_sentences_picks_closest_per_chunk_in_reading_order():
+    query = [1.0, 0.0]
+    sentences = [["s1", "s2", "s3"], [], ["t1", "t2"]]
+    vectors = [[0.0, 1.0], [1.0, 0.1], [0.9, 0.2], [1.0, 0.0], [0.0, 1.0]]
+    assert retrieval.top_sentences(query, sentences, vectors, per_chunk=2) == [["s2", "s3"], [], ["t1", "t2"]]
+    assert retrieval.top_sentences(query, sentences, vectors, per_chunk=1) == [["s2"], [], ["t1"]]
+
+
+def test_chat_keeps_k_of_the_candidates(client, headers, upload):
+    for i in range(6):
+        upload(headers, f"pump{i}.txt", f"Pump {i} needs a new seal when the shaft is misaligned. " * 20 +
+               f"Model PX-{i} ships with a spare.")
+    body = client.post("/chat", json={"query": "pump seal misaligned", "candidates": 6, "k": 2},
+                       headers=headers).json()
+    pipeline = body["retrieval"]
+    assert pipeline["candidates"] == 6 and pipeline["k"] == 2
+    assert pipeline["reranker"] == "cosine" and pipeline["skipped"] == []
+    assert body["answer"].count("**Information from") == 2
+
+
+def test_spent_budget_skips_reranking(client, headers, upload):
+    upload(headers, "pump.txt", "The seal of the pump fails when the shaft is misaligned. " * 20)
+    pipeline = client.post("/chat", json={"query": "pump seal", "budget_ms": 0.001}, headers=headers).json()["retrieval"]
+    assert pipeline["skipped"] == ["rerank", "sentences"]
+    assert pipeline["reranker"] is None
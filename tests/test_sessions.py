@@ -0,0 +1,70 @@
+"""Sessions: registered on first upload, scoped retrieval, tenant collections, /clear-all."""
+import uuid
+
+import pytest
+
+
+def listed(client, headers):
+    return {doc["id"] for doc in client.get("/ui-documents", headers=headers).json()["documents"]}
+
+
+def test_clear_all_only_clears_the_callers_session(backend, client, headers, upload):
+    other = {backend.SESSION_HEADER: str(uuid.uuid4())}
+    mine = upload(headers, "mine.txt", "The cooling fan F-1 is cleaned every month.")
+    theirs = upload(other, "theirs.txt", "The cooling fan F-2 is cleaned every week.")
+    response = client.post("/clear-all", headers=headers).json()
+    assert response["status"] == "success" and response["documents_removed"] == 1
+    assert listed(client, headers) == set() and listed(client, other) == {theirs}
+    assert backend.doc_store.get(mine) is None
+    assert backend.resources.collection().get(where={"doc_id": theirs}, include=[])["ids"]
+    # Clearing every session needs ADMIN_TOKEN, which the tests do not set
+    assert backend.ADMIN_TOKEN is None
+    assert client.post("/clear-all?all=true", headers=headers).status_code == 403
+    assert listed(client, other) == {theirs}
+
+
+def retrieved(client, headers, query, mode):
+    """Doc ids of the chunks /chat/batch retrieves for one query"""
+    body = client.post("/chat/batch", json={"queries": [query], "answers": False, "mode": mode}, headers=headers).json()
+    return {chunk["doc_id"] for chunk in body["results"][0]["chunks"]}
+
+
+def test_sessions_are_stored_on_their_first_upload(backend, client, upload):
+    before = backend.sessions.count()
+    for _ in range(3):
+        response = client.get("/ui-documents")
+        assert response.headers[backend.SESSION_HEADER]
+    fresh = {backend.SESSION_HEADER: str(uuid.uuid4())}
+    assert client.get("/ui-documents", headers=fresh).json()["session_id"] == fresh[backend.SESSION_HEADER]
+    assert backend.sessions.count() == before
+    upload(fresh, "first.txt", "The first upload of this session.")
+    assert backend.sessions.get(fresh[backend.SESSION_HEADER]) is not None
+    assert backend.sessions.count() == before + 1
+
+
+@pytest.mark.parametrize("mode", ["lexical", "vector", "hybrid"])
+def test_retrieval_only_sees_the_callers_documents(client, headers, upload, mode):
+    other = {"X-Session-ID": str(uuid.uuid4())}
+    mine = upload(headers, "boiler.txt", "The boiler B-9 pressure switch trips at six bar.")
+    theirs = upload(other, "boiler.txt", "The boiler B-9 pressure switch trips at six bar, per the manual.")
+    assert retrieved(client, headers, "boiler pressure switch", mode) == {mine}
+    assert retrieved(client, other, "boiler pressure switch", mode) == {theirs}
+
+
+def test_large_sessions_move_to_a_collection_of_their_own(backend, client, headers, monkeypatch, upload):
+    session_id = headers[backend.SESSION_HEADER]
+    first = upload(headers, "compressor.txt", "The compressor C-5 unloads above eight bar.")
+    monkeypatch.setattr(backend, "TENANT_COLLECTION_MIN_CHUNKS", 1)
+    moved = backend.move_to_tenant_collection(session_id)
+    name = backend.sessions.get(session_id)["collection"]
+    assert moved >= 1 and name == backend.tenant_collection_name(session_id)
+    shared = backend.resources.collection()
+    assert shared.get(where={"session_id": session_id}, include=[])["ids"] == []
+    tenant = backend.resources.tenant_collection(name)
+    assert {meta["doc_id"] for meta in tenant.get(include=["metadatas"])["metadatas"]} == {first}
+    # Later uploads are written to it, and retrieval reads from it
+    second = upload(headers, "dryer.txt", "The air dryer D-2 drains its condensate hourly.")
+    assert {meta["doc_id"] for meta in tenant.get(include=["metadatas"])["metadatas"]} == {first, second}
+    assert shared.get(where={"session_id": session_id}, include=[])["ids"] == []
+    assert retrieved(client, headers, "compressor unloads", "vector") >= {first}
+    assert retrieved(client, headers, "air dryer condensate", "hybrid") >= {second}
@@ -0,0 +1,129 @@
+"""Snapshots: export/import round trip, the staged swap and its revert, manifest paths."""
+import json
+import os
+import shutil
+
+import pytest
+
+from resources import IMPORT_SUFFIX, REPLACED_SUFFIX
+
+
+def document_ids(backend):
+    return {doc["id"] for doc in backend.doc_store.list_documents()}
+
+
+def chunk_ids(backend):
+    """Ids of the chunks in the shared collection and every tenant's own"""
+    names = [backend.resources.collection_name, *backend.sessions.tenant_collections()]
+    return {cid for name in names for cid in backend.resources.tenant_collection(name).get(include=[])["ids"]}
+
+
+def edit_manifest(directory, edit):
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    edit(manifest)
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def test_round_trip_restores_the_index(backend, client, headers, tmp_path, upload):
+    kept = upload(headers, "seal.txt", "The shaft seal S-4 is replaced every two thousand hours.")
+    report = backend.snapshots.export(str(tmp_path / "snapshot"), keep_session_ids=True)
+    assert report["documents"] == len(document_ids(backend)) and report["chunks"] == len(chunk_ids(backend))
+    documents, chunks = document_ids(backend), chunk_ids(backend)
+    added = upload(headers, "late.txt", "Uploaded after the export, so the import discards it.")
+
+    report = backend.snapshots.load(str(tmp_path / "snapshot"), replace=True)
+    assert report["status"] == "success" and report["replaced"]
+    assert document_ids(backend) == documents and chunk_ids(backend) == chunks
+    assert client.get(f"/ui-documents/{added}", headers=headers).json()["status"] == "error"
+    restored = client.get(f"/ui-documents/{kept}", headers=headers).json()
+    assert restored["document"]["content"].startswith("The shaft seal S-4")
+    hits = backend.lexical_index.search("shaft seal", session_id=headers[backend.SESSION_HEADER])
+    assert any(hit["metadata"]["doc_id"] == kept for hit in hits)
+    assert not [collection.name for collection in backend.resources.client().list_collections()
+                if collection.name.endswith((IMPORT_SUFFIX, REPLACED_SUFFIX))]
+
+
+def test_a_failed_swap_keeps_the_current_index(backend, headers, monkeypatch, tmp_path, upload):
+    backend.snapshots.export(str(tmp_path / "snapshot"), keep_session_ids=True)
+    added = upload(headers, "late.txt", "The coupling C-2 is aligned after every motor change.")
+    documents, chunks = document_ids(backend), chunk_ids(backend)
+    collections = {collection.name for collection in backend.resources.client().list_collections()}
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(backend.snapshot, "swap_tables", fail)
+    with pytest.raises(RuntimeError):
+        backend.snapshots.load(str(tmp_path / "snapshot"), replace=True)
+    # The collections set aside by the swap came back; nothing staged is left over
+    assert added in document_ids(backend) and document_ids(backend) == documents
+    assert chunk_ids(backend) == chunks
+    assert {collection.name for collection in backend.resources.client().list_collections()} == collections
+
+
+@pytest.mark.parametrize("key, value", [
+    ("vectors_file", "../outside.npy"),
+    ("vectors_file", "vectors/../../outside.npy"),
+    ("chunks_file", "chunks/other.jsonl"),
+    ("name", "../outside"),
+])
+def test_manifest_paths_must_stay_in_the_snapshot(backend, tmp_path, key, value):
+    directory = str(tmp_path / "snapshot")
+    backend.snapshots.export(directory, keep_session_ids=True)
+    shutil.copy(os.path.join(directory, "vectors", os.listdir(os.path.join(directory, "vectors"))[0]),
+                tmp_path / "outside.npy")
+    edit_manifest(directory, lambda manifest: manifest["collections"][0].update({key: value}))
+    documents = document_ids(backend)
+    with pytest.raises(backend.snapshot.SnapshotError):
+        backend.snapshots.load(directory, replace=True, verify=False)
+    assert document_ids(backend) == documents
+
+
+def test_checksummed_files_must_stay_in_the_snapshot(backend, tmp_path):
+    directory = str(tmp_path / "snapshot")
+    backend.snapshots.export(directory, keep_session_ids=True)
+    (tmp_path / "secret.txt").write_text("not part of the snapshot")
+    edit_manifest(directory, lambda manifest: manifest["files"].update({"../secret.txt": "0" * 64}))
+    with pytest.raises(backend.snapshot.SnapshotError, match="outside the snapshot"):
+        backend.snapshots.read_manifest(directory)
+
+
+@pytest.mark.parametrize("edit", [
+    lambda manifest: manifest.pop("files"),
+    lambda manifest: manifest.pop("collections"),
+    lambda manifest: manifest.pop("documents"),
+    lambda manifest: manifest.update(sessions="3"),
+    lambda manifest: manifest.update(files=["documents.jsonl"]),
+    lambda manifest: manifest["collections"][0].pop("chunks"),
+    lambda manifest: manifest["collections"].append("chunks/extra.jsonl"),
+])
+def test_malformed_manifests_are_refused(backend, tmp_path, edit):
+    directory = str(tmp_path / "snapshot")
+    backend.snapshots.export(directory, keep_session_ids=True)
+    edit_manifest(directory, edit)
+    with pytest.raises(backend.snapshot.SnapshotError, match="manifest"):
+        backend.snapshots.load(directory, replace=True, verify=False)
+
+
+def test_a_malformed_manifest_over_http_is_a_bad_request(backend, client, monkeypatch, tmp_path):
+    directory = str(tmp_path / "snapshot")
+    backend.snapshots.export(directory, keep_session_ids=True)
+    edit_manifest(directory, lambda manifest: manifest.pop("files"))
+    backend.snapshot.pack(directory, str(tmp_path / "snapshot.tar"))
+    monkeypatch.setattr(backend, "SNAPSHOT_TOKEN", "secret")
+    with open(tmp_path / "snapshot.tar", "rb") as f:
+        response = client.post("/snapshot?replace=true", files={"file": ("snapshot.tar", f, "application/x-tar")},
+                               headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 400 and "files" in response.json()["message"]
+
+
+def test_registered_sessions_count_as_data_to_replace(backend, headers, monkeypatch, tmp_path, upload):
+    upload(headers, "belt.txt", "The conveyor belt is tensioned weekly.")
+    backend.snapshots.export(str(tmp_path / "snapshot"), keep_session_ids=True)
+    sessions = backend.sessions.list()
+    for store in (backend.doc_store, backend.lexical_index, backend.resources):    # Only sessions left
+        monkeypatch.setattr(store, "count", lambda *args: 0)
+    with pytest.raises(backend.snapshot.SnapshotConflictError):
+        backend.snapshots.load(str(tmp_path / "snapshot"))
+    assert backend.sessions.list() == sessions
@@ -0,0 +1,107 @@
+"""Telemetry: exclusive stage spans, Prometheus exposition, JSON logs, /metrics and Server-Timing."""
+import contextvars
+import json
+import logging
+import time
+
+import pytest
+
+import telemetry
+
+
+def profiled(function):
+    """Stage times recorded while `function` runs, in a context of its own"""
+    def collect():
+        profile = telemetry.start_profile()
+        function()
+        return profile
+    return contextvars.copy_context().run(collect)
+
+
+def totals(profile):
+    seconds = {}
+    for stage, elapsed in profile:
+        seconds[stage] = seconds.get(stage, 0.0) + elapsed
+    return seconds
+
+
+def test_nested_spans_are_not_counted_twice():
+    def work():
+        with telemetry.span("test_outer"):
+            time.sleep(0.02)
+            with telemetry.span("test_inner"):
+                time.sleep(0.05)
+    seconds = totals(profiled(work))
+    assert seconds["test_inner"] >= 0.05
+    assert 0.02 <= seconds["test_outer"] < 0.06    # Its own sleep only, not the inner span's
+
+
+def test_timed_iter_times_the_producer_not_the_consumer():
+    def produce():
+        for _ in range(3):
+            time.sleep(0.01)
+            yield
+
+    def work():
+        for _ in telemetry.timed_iter(produce(), "test_produce"):
+            with telemetry.span("test_consume"):
+                time.sleep(0.03)
+    profile = profiled(work)
+    seconds = totals(profile)
+    assert [stage for stage, _ in profile].count("test_produce") == 1    # One observation per iteration
+    assert 0.03 <= seconds["test_produce"] < 0.08 and seconds["test_consume"] >= 0.09
+    assert telemetry.server_timing([("embed", 0.001), ("store", 0.002), ("embed", 0.003)]) == \
+        "embed;dur=4.00, store;dur=2.00"
+
+
+def test_metrics_are_rendered_in_the_prometheus_text_format():
+    registry = telemetry.Registry()
+    counter = registry.counter("test_files_total", "Files", ["outcome"])
+    counter.inc(outcome="ok")
+    counter.inc(2, outcome='say "hi"')
+    histogram = registry.histogram("test_seconds", "Seconds", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, stage="embed")
+    registry.gauge("test_ready", "Ready", lambda: 1)
+    registry.gauge("test_broken", "Raises", lambda: 1 / 0)
+    lines = registry.render().splitlines()
+    assert 'test_files_total{outcome="ok"} 1' in lines and 'test_files_total{outcome="say \\"hi\\""} 2' in lines
+    assert 'test_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="embed",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="embed"} 5.55' in lines and 'test_seconds_count{stage="embed"} 3' in lines
+    assert "test_ready 1" in lines and not any("test_broken" in line for line in lines)
+    assert counter.value(outcome="ok") == 1
+
+
+def test_json_logs_carry_the_extra_fields():
+    record = logging.LogRecord("rag.test", logging.INFO, __file__, 1, "Upload complete", None, None)
+    record.doc_id, record.chunks = "d1", 3
+    entry = json.loads(telemetry.JsonFormatter().format(record))
+    assert entry["level"] == "info" and entry["logger"] == "rag.test" and entry["message"] == "Upload complete"
+    assert entry["doc_id"] == "d1" and entry["chunks"] == 3
+
+
+def test_metrics_endpoint_and_profiling_header(client, headers, upload):
+    upload(headers, "pump.txt", "The pump P-7 coupling is aligned with a dial gauge.")
+    response = client.post("/chat", json={"query": "How is the pump coupling aligned?"},
+                           headers={**headers, "X-Profile": "1"})
+    timing = dict(entry.split(";dur=") for entry in response.headers["Server-Timing"].split(", "))
+    assert {"retrieve", "total"} <= timing.keys()
+    assert sum(float(ms) for stage, ms in timing.items() if stage != "total") <= float(timing["total"])
+    assert "Server-Timing" not in client.post("/chat", json={"query": "coupling"}, headers=headers).headers
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = metrics.text.splitlines()
+    assert any(line.startswith('rag_stage_seconds_count{stage="embed"}') for line in lines)
+    assert any(line.startswith('rag_request_seconds_count{method="POST",route="/chat",status="200"}')
+               for line in lines)
+    assert any(line.startswith("rag_documents ") for line in lines) and "rag_model_ready 1" in lines
+
+
+@pytest.mark.parametrize("path, template", [("/ui-documents/not-a-real-id", "/ui-documents/{doc_id}"),
+                                            ("/jobs/not-a-real-job", "/jobs/{job_id}")])
+def test_requests_are_labelled_by_route_template(client, headers, path, template):
+    client.get(path, headers=headers)
+    metrics = client.get("/metrics").text
+    assert f'route="{template}"' in metrics and path not in metrics
@@ -0,0 +1,129 @@
+"""UI documents: incremental re-embedding on edit, paged listings with ETags, windowed reads."""
+import numpy as np
+
+from benchmarks import corpus
+
+PARAGRAPHS = [f"Section {i}. The cooling loop C-{i} is drained, flushed with clean water and refilled with glycol. "
+              f"Its pump is checked for leaks and the strainer S-{i} is cleaned before the loop is restarted."
+              for i in range(12)]
+
+
+def stored_chunks(backend, doc_id):
+    stored = backend.resources.collection().get(where={"doc_id": doc_id}, include=["documents", "embeddings"])
+    return {cid: (text, np.asarray(vector)) for cid, text, vector in zip(stored["ids"], stored["documents"],
+                                                                         stored["embeddings"])}
+
+
+def edit(client, headers, doc_id, content):
+    body = client.put(f"/ui-documents/{doc_id}", json={"content": content}, headers=headers).json()
+    assert body["status"] == "success", body
+    return body
+
+
+def test_an_edit_re_embeds_only_the_chunks_it_changed(backend, client, headers, upload):
+    text = "\n\n".join(PARAGRAPHS)
+    doc_id = upload(headers, "loops.txt", text)
+    before = stored_chunks(backend, doc_id)
+    assert len(before) >= 4
+    unchanged = edit(client, headers, doc_id, text)
+    assert unchanged["chunks_recomputed"] == 0 and unchanged["chunks_reused"] == len(before)
+    edited_text = text.replace("strainer S-11 is cleaned", "strainer S-11 is replaced")
+    body = edit(client, headers, doc_id, edited_text)
+    assert body["chunks_recomputed"] == 1 and body["chunks_reused"] == len(before) - 1
+    assert body["embedding"]["removed"] == 0 and body["embedding"]["failed"] == 0
+    after = stored_chunks(backend, doc_id)
+    assert after.keys() == before.keys()
+    changed = [cid for cid in after if after[cid][0] != before[cid][0]]
+    assert len(changed) == 1 and "S-11 is replaced" in after[changed[0]][0]
+    assert all(np.array_equal(after[cid][1], before[cid][1]) for cid in after if cid not in changed)
+    # Shortening the document drops its trailing chunks; at most the new last chunk is embedded
+    shortened = edit(client, headers, doc_id, "\n\n".join(PARAGRAPHS[:3]))
+    assert shortened["chunks_recomputed"] <= 1 and shortened["embedding"]["removed"] > 0
+    assert len(stored_chunks(backend, doc_id)) == len(before) - shortened["embedding"]["removed"]
+
+
+def listing(client, headers, **params):
+    response = client.get("/ui-documents", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_listings_are_paged_by_cursor_projected_and_filtered(client, headers, upload):
+    names = ["pump_a.txt", "pumpxa.txt", "valve.txt", "boiler.txt", "fan.txt"]
+    ids = [upload(headers, name, "Maintenance note. " * (i + 1)) for i, name in enumerate(names)]
+    first = listing(client, headers, limit=2)
+    assert first["total"] == 5 and first["count"] == 2 and first["next_cursor"]
+    pages, cursor = [first], first["next_cursor"]
+    while cursor:
+        pages.append(listing(client, headers, limit=2, cursor=cursor))
+        assert pages[-1]["total"] is None    # Only counted on the first page
+        cursor = pages[-1]["next_cursor"]
+    assert [doc["id"] for page in pages for doc in page["documents"]] == ids
+    by_size = listing(client, headers, sort="size", order="desc", fields="filename")
+    assert [doc["filename"] for doc in by_size["documents"]] == names[::-1]
+    assert all(doc.keys() == {"id", "filename"} for doc in by_size["documents"])
+    # "_" in the filter is a literal underscore, not a LIKE wildcard
+    assert [doc["id"] for doc in listing(client, headers, filename="pump_")["documents"]] == [ids[0]]
+    assert listing(client, headers, file_type="pdf")["documents"] == []
+    assert listing(client, headers, uploaded_after="2999-01-01")["total"] == 0
+    for bad in ({"fields": "content"}, {"cursor": "not-a-cursor"}):
+        assert client.get("/ui-documents", params=bad, headers=headers).status_code == 400
+
+
+def test_an_unchanged_listing_is_answered_with_304(client, headers, upload):
+    doc_id = upload(headers, "chiller.txt", "The chiller CH-2 condenser is descaled yearly.")
+    response = client.get("/ui-documents", headers=headers)
+    etag = response.headers["ETag"]
+    revalidated = client.get("/ui-documents", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.headers["ETag"] == etag and not revalidated.content
+    # Other parameters, an edit or an upload each change the tag
+    assert client.get("/ui-documents?limit=1", headers=headers).headers["ETag"] != etag
+    client.put(f"/ui-documents/{doc_id}", json={"content": "The condenser is descaled twice a year."}, headers=headers)
+    edited = client.get("/ui-documents", headers={**headers, "If-None-Match": etag})
+    assert edited.status_code == 200 and edited.headers["ETag"] != etag
+    upload(headers, "tower.txt", "The cooling tower basin is drained in winter.")
+    fresh = client.get("/ui-documents", headers={**headers, "If-None-Match": edited.headers["ETag"]})
+    assert fresh.status_code == 200 and fresh.json()["total"] == 2
+    # Another session never matches this session's tag
+    other = {"X-Session-ID": headers["X-Session-ID"] + "-other", "If-None-Match": fresh.headers["ETag"]}
+    assert client.get("/ui-documents", headers=other).status_code == 200
+
+
+def read(client, headers, doc_id, **params):
+    body = client.get(f"/ui-documents/{doc_id}", params=params, headers=headers).json()
+    assert body["status"] == "success", body
+    return body["document"]
+
+
+def test_large_documents_are_read_in_windows(client, headers, upload):
+    text = "".join(f"Line {i:05d}: the gland packing of valve V-{i} is adjusted. " for i in range(2500))
+    assert len(text) > 2 * 64 * 1024    # Spans several stored segments
+    doc_id = upload(headers, "valves.txt", text)
+    window = read(client, headers, doc_id, offset=65000, length=1000)    # Across a segment boundary
+    assert window["content"] == text[65000:66000] and window["next_offset"] == 66000
+    parts, offset = [], 0
+    while offset is not None:
+        window = read(client, headers, doc_id, offset=offset, length=50000)
+        parts.append(window["content"])
+        offset = window["next_offset"]
+    assert len(parts) == 3 and "".join(parts) == text
+    assert read(client, headers, doc_id, offset=len(text) + 10)["content"] == ""
+    assert "offset" not in read(client, headers, doc_id) and read(client, headers, doc_id)["content"] == text
+    too_long = client.get(f"/ui-documents/{doc_id}", params={"length": 10 ** 7}, headers=headers)
+    assert too_long.status_code == 422
+
+
+def test_pdf_pages_are_read_on_their_own(client, headers):
+    pages = ["The burner nozzle is cleaned.", "The flame sensor is tested.", "The flue is inspected."]
+    body = client.post("/upload", files={"file": ("burner.pdf", corpus.make_pdf(pages), "application/pdf")},
+                       headers=headers).json()
+    doc_id = body["document_id"]
+    full = read(client, headers, doc_id)["content"]
+    second = read(client, headers, doc_id, page=2)
+    assert second["pages"] == 3 and second["content"].startswith("--- Page 2 ---\nThe flame sensor is tested.")
+    assert "Page 3" not in second["content"] and second["next_offset"] == full.index("--- Page 3 ---")
+    assert full[second["offset"]:second["next_offset"]] == second["content"]
+    last = read(client, headers, doc_id, page=3, offset=15, length=6)    # `offset` counts from the page start
+    assert last["content"] == "The fl" and last["offset"] == full.index("--- Page 3 ---") + 15
+    missing = client.get(f"/ui-documents/{doc_id}", params={"page": 9}, headers=headers).json()
+    assert missing["status"] == "error" and "Page 9" in missing["message"]